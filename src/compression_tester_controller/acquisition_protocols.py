@@ -2,12 +2,12 @@ import logging
 import threading
 import time
 import os
-import glob
+import shutil
+import tempfile
 import uuid
-import paramiko
-import random
+import json
 
-import pandas as pd
+from typing import List
 
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
@@ -17,18 +17,31 @@ import numpy as np
 from dotenv import load_dotenv
 from os.path import join, dirname
 
-from compression_testing_data.main import parse_gphoto_config_for_sql, parse_cam_config_dict_for_gphoto, parse_sql_gphoto_config_for_gphoto
+from compression_testing_data.main import parse_gphoto_config_for_sql, parse_sql_gphoto_config_for_gphoto
 from compression_testing_data.meta import get_session
-from compression_testing_data.models.samples import Print, Sample, Phantom
+from compression_testing_data.models.samples import Sample, Phantom
 from compression_testing_data.models.acquisition_settings import CameraSetting
-from compression_testing_data.models.reconstruction_settings import MetashapePlyExportSetting, MetashapePlyGenerationSetting, Open3DDBSCANClusteringSetting, Open3DSegmentationSetting
+from compression_testing_data.models.reconstruction_settings import ColorDefinition
 from compression_testing_data.models.testing import CompressionTrial, CompressionStep, Frame
 
-from compression_tester_controls.components.canon_eosr50 import gphoto2_get_active_ports, gpohoto2_get_camera_settings
-from compression_tester_controls.sys_protocols import platon_setup, init_cameras, sys_init, home_camera_system, capture_step_frames, camera_system_setup, clear_cam_frames, transfer_step_frames
-from compression_tester_controls.sys_functions import sample_force_sensor, get_a201_Rf, move_stepper_PID_target
-
-from file_management import move_trial_assets
+from hardware import gphoto2_get_active_ports, gpohoto2_get_camera_settings
+from hardware import platon_setup, init_cameras, sys_init, capture_step_frames, camera_system_setup
+from hardware import sample_force_sensor, move_stepper_PID_target, download_port_frames, clear_port_frames, list_port_frames
+
+from file_management import move_trial_assets, upload_interfaces
+from sampling import RingSampler, sample_force_settled
+from force_curves import ForceCurveWriter
+from pipeline import StepFinisher
+from transfer_daemon import TransferDaemon, TransferQueue, daemon_running
+from db_writer import DBWriter
+from camera_manager import CameraManager
+from camera_transfer import download_frames, list_frames
+from spool import StepSpool, MANIFEST_FILENAME
+from precrop import precrop_spool, color_bounds
+from strain_schedule import adaptive_strain_delta
+from decimation import pick_frames
+from timing import PhaseTimer, timed
+from trial_meta import trial_meta_path, update_trial_meta
 
 dotenv_path = join(dirname(__file__), '.env')
 load_dotenv(dotenv_path)
@@ -96,6 +109,83 @@ def get_cam_settings(session, id: int = 1):
     return setting
 
 
+def set_if_column(obj, meta_path: str = None, **fields):
+    """
+    set fields on an ORM object. fields without a matching column in compression_testing_data
+    go in the trial's sidecar json at meta_path (see trial_meta), keyed by the object's table
+    and name, or are only logged if no meta_path is given
+    """
+    columns = obj.__table__.columns.keys()
+    missing = dict()
+    for key, value in fields.items():
+        if key in columns:
+            setattr(obj, key, value)
+        else:
+            missing[key] = value
+
+    if missing and meta_path:
+        update_trial_meta(filepath=meta_path, table=obj.__tablename__, name=obj.name, fields=missing)
+        logging.info(f"{obj.__tablename__} has no column for {list(missing.keys())}, written to {meta_path}")
+    elif missing:
+        logging.info(f"{obj.__tablename__} has no column for {list(missing.keys())}, not stored: {missing}")
+
+
+def column_values(obj):
+    """
+    :return: dict of the non null column values of an ORM object, enough to rebuild it in another session
+    """
+    values = dict()
+    for key in obj.__table__.columns.keys():
+        value = getattr(obj, key)
+        if value is not None:
+            values[key] = value
+    return values
+
+
+def add_step_frames(session, step_id: int, filenames, cam_settings_id: int, crop_boxes: dict = None, meta_path: str = None):
+    """
+    :param crop_boxes: file name -> crop box for frames pre-cropped on the pi, Frame has no
+                       column for it so it goes in the trial sidecar at meta_path
+    """
+    crop_boxes = crop_boxes if crop_boxes else dict()
+    for filename in filenames:
+        name = os.path.splitext(filename)[0]
+        file_ext = os.path.splitext(filename)[1].strip(".")
+        new_frame = Frame(
+            name=name,
+            file_extension=file_ext,
+            file_name=filename,
+            camera_setting_id=cam_settings_id,
+            compression_step_id=step_id
+        )
+        if crop_boxes.get(filename):
+            set_if_column(new_frame, meta_path=meta_path, crop_box=json.dumps(crop_boxes.get(filename)))
+        session.add(new_frame)
+
+
+def get_precrop_settings(
+        session,
+        color_setting_id: int = None,
+        box: List[int] = None,
+        margin: float = 0.1,
+):
+    """
+    kwargs for precrop.precrop_spool, None if pre-cropping is off. a fixed box wins over
+    the colour window of ColorDefinition color_setting_id (the platen side colour)
+    """
+    if box:
+        return {'box': list(box)}
+    if color_setting_id is None:
+        return None
+
+    color_definition = session.query(ColorDefinition).filter(ColorDefinition.id == color_setting_id).first()
+    if not color_definition:
+        logging.info(f"Color Setting ID: {color_setting_id} not found, frames go up uncropped.")
+        return None
+    rgb_min, rgb_max = color_bounds(color_definition=color_definition.__dict__)
+    return {'rgb_min': rgb_min, 'rgb_max': rgb_max, 'margin': margin}
+
+
 def counts_to_mm(encoder_steps):
     mm = encoder_steps * (6/4000)
     return mm
@@ -112,12 +202,23 @@ def find_force_sensor_Rf():
 
     return
 
-import termplotlib as tpl
 
 def run_force_trial(
         db_conn: str,
         trial_id: int = 1,
+        sample_rate_hz: float = 200,
+        curve_dir: str = 'force_curves',
+        server_ip: str = '192.168.1.3',
+        postgres_db_dir: str = '/share/CACHEDEV1_DATA/Public/postgres_data',
+        dest_machine_user: str = 'domanlab',
+        background_db_writes: bool = False,
         ):
+    """
+    continuous compression with force and encoder sampled on a RingSampler thread, the
+    curve is written to curve_dir and uploaded next to the trial's frames. with
+    background_db_writes the trial and sample updates go through a DBWriter, if any of
+    them failed this raises once the platen is home
+    """
     Session = get_session(conn_str=db_conn)
     session = Session()
 
@@ -125,10 +226,15 @@ def run_force_trial(
     if trial:
         components = sys_init()
         sample = session.query(Sample).filter(Sample.id == trial.sample.id).first()
+        sample_id = sample.id
+        db_writer = DBWriter(Session=Session) if background_db_writes else None
 
         force_zero = np.mean(sample_force_sensor(n_samples=100, components=components))
-        trial.force_zero = force_zero
-        session.commit()
+        if db_writer:
+            db_writer.submit(lambda session: setattr(session.get(CompressionTrial, trial_id), 'force_zero', force_zero))
+        else:
+            trial.force_zero = force_zero
+            session.commit()
         logging.info(f"Force Zero: {force_zero}")
 
         encoder_zero_count, encoder_sample_height_count = platon_setup(components=components)
@@ -136,6 +242,11 @@ def run_force_trial(
         steps_to_travel = sample_height_counts * trial.strain_limit
 
         enc = components.get('e5')
+        sampler = RingSampler(
+            read_counts=enc.get_encoder_count,
+            read_force=lambda: np.mean(sample_force_sensor(n_samples=1, components=components)) - force_zero,
+            rate_hz=sample_rate_hz
+        )
 
         stepper_thread = threading.Thread(
                 target=move_stepper_PID_target,
@@ -148,44 +259,56 @@ def run_force_trial(
                     1
                     )
             )
-        stepper_thread.start()
+        sample_height_mm = counts_to_mm(sample_height_counts)
+        if db_writer:
+            db_writer.submit(lambda session: setattr(session.get(Sample, sample_id), 'height_enc', sample_height_mm))
+        else:
+            sample.height_enc = sample_height_mm
+            session.commit()
+        logging.info(f"Sample Height: {sample_height_mm}")
 
-        force_strain = []
-        while stepper_thread.is_alive():
-            counts = enc.get_encoder_count()
-            force = np.mean(sample_force_sensor(n_samples=5, components=components))
+        trial_name = trial.name
+        curve_writer = ForceCurveWriter(
+            trial_name=trial_name,
+            curve_dir=curve_dir,
+            meta={
+                'force_zero': force_zero,
+                'encoder_sample_height_count': encoder_sample_height_count,
+                'sample_height_counts': sample_height_counts,
+                'sample_height_mm': sample_height_mm,
+            }
+        )
 
-            force_strain.append({'counts': enc.get_encoder_count(),
-                                 'force': np.mean(sample_force_sensor(n_samples=5, components=components)) - force_zero
-                                 })
-            time.sleep(0.01)
+        def write_chunk(chunk):
+            chunk['strain'] = (chunk['counts'] - encoder_sample_height_count) / sample_height_counts
+            curve_writer.append(**chunk)
 
-        df = pd.DataFrame(force_strain)
-        df['strain'] = (df['counts'] - encoder_sample_height_count) / sample_height_counts
+        sampler.start()
+        stepper_thread.start()
 
-        sample_height_mm = counts_to_mm(sample_height_counts)
-        sample.height_enc = sample_height_mm
-        session.commit()
-        logging.info(f"Sample Height: {sample_height_mm}")
+        # drain well inside the ring capacity, sampling itself happens on the sampler thread
+        while stepper_thread.is_alive():
+            time.sleep(0.1)
+            write_chunk(sampler.drain())
+
+        sampler.stop()
+        write_chunk(sampler.drain())
+        logging.info(f"Force Sampling Rate: {sampler.achieved_rate_hz:.1f} Hz (target {sample_rate_hz} Hz)")
 
         stepper_thread.join()
-        
-        for idx in df.index:
-            strain = df.iloc[idx]['strain']
-            force = df.iloc[idx]['force']
-
-            new_step = CompressionStep(
-                name=uuid.uuid4(),
-                strain_target=strain,
-                strain_encoder=strain,
-                force=force,
-                compression_trial_id=trial_id
-            )
-        
-            session.add(new_step)
-        session.commit()
+        if db_writer:
+            db_writer.close()
         session.close()
-        
+
+        curve_filepath = curve_writer.finalize()
+        move_trial_assets(
+            absolute_asset_filepaths=[os.path.abspath(curve_filepath)],
+            dest_asset_dir=f'{postgres_db_dir}/{trial_name}',
+            dest_machine_user=dest_machine_user,
+            dest_machine_addr=server_ip,
+            interfaces=upload_interfaces()
+        )
+
         move_stepper_PID_target(
             stepper=components.get('big_stepper'),
             pid=components.get('big_stepper_PID'),
@@ -194,23 +317,359 @@ def run_force_trial(
             setpoint=5, 
             error=1
         )
+        if db_writer:
+            db_writer.check()  # the trial is over and the platen is home, now surface failed writes
 
     pass
 
 
+def run_continuous_trial(
+        db_conn: str,
+        trial_id: int = 1,
+        cam_settings_id = 1,
+        strain_thresholds: List[float] = None,
+        sample_rate_hz: float = 200,
+        stepper_dc: float = 85,
+        curve_dir: str = 'force_curves',
+        server_ip: str = '192.168.1.3',
+        postgres_db_dir: str = '/share/CACHEDEV1_DATA/Public/postgres_data',
+        dest_machine_user: str = 'domanlab',
+        max_in_flight: int = 2,
+        concurrent_download: bool = False,
+        angular_decimation: bool = False,
+        selective_download: bool = False,
+        transport: str = 'sftp',
+        timing_dir: str = 'timings',
+        meta_dir: str = 'trial_meta',
+        precrop_color_setting_id: int = None,
+        precrop_box: List[int] = None,
+        ):
+    """
+    hybrid of run_trial and run_force_trial. the platen compresses to strain_limit in one
+    continuous move on the slow PID while force and encoder stream on a RingSampler (saved
+    as the trial's force curve), and a frame burst (one turntable rotation) fires each
+    time the strain crosses the next threshold. every burst is a CompressionStep tagged
+    with the force and strain of the sample that crossed the threshold, uploads run on a
+    StepFinisher so the next burst is only held up by the capture and download
+
+    thresholds default to every strain_delta_target from 0 up to strain_limit. thresholds
+    passed while a burst is still downloading are skipped and logged, lower stepper_dc
+    (a slower strain rate) if that happens. the ring is drained into the curve on its own
+    thread so a long burst cant overrun it. with a frames_per_step_target of 0 the cameras
+    are left alone and each threshold only records a step
+
+    the capture lag and the strain and force at the end of each burst have no column in
+    compression_testing_data, they go in meta_dir/<trial name>.json (see trial_meta), which is
+    uploaded next to the force curve as trial_meta.json
+
+    :param strain_thresholds: strains to capture at
+    :param stepper_dc: platen stepper duty cycle, sets the strain rate
+    :param precrop_color_setting_id: see run_trial
+    :param precrop_box: see run_trial
+    """
+    Session = get_session(conn_str=db_conn)
+    session = Session()
+
+    trial = session.query(CompressionTrial).filter(CompressionTrial.id == trial_id).first()
+    if not trial:
+        logging.info(f"Trial with ID: {trial_id} not found!")
+        return
+    if not trial.sample:
+        logging.info(f"Trial {trial.id} has no associated sample")
+        return
+
+    components = sys_init()
+    sample = session.query(Sample).filter(Sample.id == trial.sample.id).first()
+    trial_name = trial.name
+
+    force_zero = np.mean(sample_force_sensor(n_samples=100, components=components))
+    trial.force_zero = force_zero
+    session.commit()
+    logging.info(f"Force Zero: {force_zero}")
+
+    encoder_zero_count, encoder_sample_height_count = platon_setup(components=components)
+    sample_height_counts = abs(encoder_zero_count - encoder_sample_height_count)
+    sample_height_mm = counts_to_mm(sample_height_counts)
+    sample.height_enc = sample_height_mm
+    session.commit()
+    logging.info(f"Sample Height: {sample_height_mm}")
+
+    if strain_thresholds is None:
+        n_thresholds = int(np.floor(trial.strain_limit / trial.strain_delta_target + 1e-9)) + 1
+        strain_thresholds = [i * trial.strain_delta_target for i in range(n_thresholds)]
+    strain_thresholds = sorted(strain_thresholds)
+
+    def counts_to_strain(counts):
+        return abs(counts - encoder_sample_height_count) / sample_height_counts
+
+    photographed = trial.frames_per_step_target > 0
+    camera_manager = None
+    cam_ports = None
+    cam_steper_freq = None
+    if photographed:
+        camera_system_setup(components=components)
+        camera_manager = CameraManager(load_settings=lambda id: get_cam_settings(session=session, id=id))
+        cam_ports = camera_manager.ports(cam_settings_id=cam_settings_id)
+        cam_steper_freq = num_photos_2_cam_stepper_freq(num_photos=trial.frames_per_step_target)
+    precrop = get_precrop_settings(session=session, color_setting_id=precrop_color_setting_id, box=precrop_box)
+    meta_path = trial_meta_path(trial_name=trial_name, meta_dir=meta_dir)
+
+    enc = components.get('e5')
+    sampler = RingSampler(
+        read_counts=enc.get_encoder_count,
+        read_force=lambda: np.mean(sample_force_sensor(n_samples=1, components=components)) - force_zero,
+        rate_hz=sample_rate_hz
+    )
+    curve_writer = ForceCurveWriter(
+        trial_name=trial_name,
+        curve_dir=curve_dir,
+        meta={
+            'force_zero': force_zero,
+            'encoder_sample_height_count': encoder_sample_height_count,
+            'sample_height_counts': sample_height_counts,
+            'sample_height_mm': sample_height_mm,
+            'strain_thresholds': strain_thresholds,
+        }
+    )
+
+    def write_chunk(chunk):
+        chunk['strain'] = (chunk['counts'] - encoder_sample_height_count) / sample_height_counts
+        curve_writer.append(**chunk)
+
+    stepper_thread = threading.Thread(
+            target=move_stepper_PID_target,
+            args=(
+                components.get('big_stepper'),
+                components.get('big_stepper_PID_slow'),
+                enc,
+                stepper_dc,
+                encoder_sample_height_count + mm_to_counts(sample_height_mm * trial.strain_limit),
+                1
+                )
+        )
+
+    timer = PhaseTimer()
+    finisher = StepFinisher(Session=Session, finish=finish_trial_step, max_in_flight=max_in_flight)
+
+    def capture_burst(strain_threshold, trigger):
+        trigger_t, trigger_counts, trigger_force = trigger
+        timings = timer.new_step()
+
+        new_step = CompressionStep(
+            name=uuid.uuid4(),
+            strain_target=strain_threshold,
+            strain_encoder=counts_to_strain(trigger_counts),
+            force=trigger_force + force_zero,  # raw reading like run_trial steps, the curve is zeroed
+            compression_trial_id=trial_id
+        )
+        session.add(new_step)
+        with timed(timings, 'step_commit'):
+            session.commit()
+        logging.info(f"Burst @ Strain {new_step.strain_encoder:.4f} (threshold {strain_threshold}): {new_step.force}")
+        if not photographed:
+            return
+
+        spool = StepSpool(spool_dir=os.path.join('spool', f'step_{new_step.id}'))
+        capture_start = time.monotonic()
+        spool_step_frames(
+            cam_ports=cam_ports,
+            components=components,
+            spool=spool,
+            photos_per_step_target=trial.frames_per_step_target,
+            stepper_freq=cam_steper_freq,
+            camera_manager=camera_manager,
+            concurrent_download=concurrent_download,
+            angular_decimation=angular_decimation,
+            selective_download=selective_download,
+            timings=timings
+        )
+
+        # the platen keeps moving through the rotation, keep where it got to as well
+        end_t, end_counts, end_force = sampler.latest()
+        set_if_column(
+            new_step,
+            meta_path=meta_path,
+            trigger_lag_s=capture_start - trigger_t,
+            strain_end=counts_to_strain(end_counts),
+            force_end=end_force + force_zero
+        )
+        session.commit()
+
+        finisher.submit({
+            'step_id': new_step.id,
+            'spool_dir': spool.spool_dir,
+            'trial_frames_dir': f'{postgres_db_dir}/{trial_name}',
+            'cam_settings_id': cam_settings_id,
+            'dest_machine_addr': server_ip,
+            'dest_machine_user': dest_machine_user,
+            'timings': timings,
+            'transport': transport,
+            'precrop': precrop,
+            'meta_path': meta_path,
+        })
+
+    # bursts block this thread for a whole rotation plus the download, so the ring is
+    # drained on its own thread to stay well inside its capacity
+    drain_stop = threading.Event()
+    drain_errors = []
+
+    def drain_loop():
+        try:
+            while not drain_stop.wait(0.1):
+                write_chunk(sampler.drain())
+        except Exception as e:
+            logging.exception(f"Force curve draining stopped: {e}")
+            drain_errors.append(e)
+
+    drain_thread = threading.Thread(target=drain_loop, daemon=True)
+    sampler.start()
+    drain_thread.start()
+    stepper_thread.start()
+
+    # keep going after the last burst until the move ends
+    next_threshold = 0
+    while True:
+        moving = stepper_thread.is_alive()
+        time.sleep(0.01)
+        if drain_errors:
+            raise RuntimeError(f"Force curve sampling failed: {drain_errors[0]}") from drain_errors[0]
+
+        trigger = sampler.latest()
+        if trigger is None or next_threshold >= len(strain_thresholds):
+            if not moving:
+                break
+            continue
+        strain = counts_to_strain(trigger[1])
+
+        crossed = [i for i in range(next_threshold, len(strain_thresholds)) if strain >= strain_thresholds[i]]
+        if crossed:
+            if crossed[-1] > next_threshold:
+                logging.info(f"Strain thresholds passed during the last burst, skipped: "
+                             f"{strain_thresholds[next_threshold:crossed[-1]]}")
+            next_threshold = crossed[-1] + 1
+            capture_burst(strain_threshold=strain_thresholds[crossed[-1]], trigger=trigger)
+        elif not moving:
+            logging.info(f"Move finished at strain {strain:.4f}, thresholds not reached: "
+                         f"{strain_thresholds[next_threshold:]}")
+            break
+
+    stepper_thread.join()
+    sampler.stop()
+    drain_stop.set()
+    drain_thread.join()
+    write_chunk(sampler.drain())
+    logging.info(f"Force Sampling Rate: {sampler.achieved_rate_hz:.1f} Hz (target {sample_rate_hz} Hz)")
+    if sampler.n_overrun:
+        logging.info(f"{sampler.n_overrun} force curve samples were lost to ring overruns.")
+
+    logging.info("Waiting for burst uploads to finish...")
+    finisher.close()
+
+    curve_filepath = curve_writer.finalize()
+    move_trial_assets(
+        absolute_asset_filepaths=[os.path.abspath(curve_filepath)],
+        dest_asset_dir=f'{postgres_db_dir}/{trial_name}',
+        dest_machine_user=dest_machine_user,
+        dest_machine_addr=server_ip,
+        interfaces=upload_interfaces()
+    )
+    upload_trial_meta(
+        meta_path=meta_path,
+        trial_frames_dir=f'{postgres_db_dir}/{trial_name}',
+        dest_machine_addr=server_ip,
+        dest_machine_user=dest_machine_user
+    )
+
+    timer.print_summary(title=f"Trial {trial_id} Phase Timing")
+    os.makedirs(timing_dir, exist_ok=True)
+    timer.to_csv(filepath=os.path.join(timing_dir, f"{trial_name}.csv"))
+
+    move_stepper_PID_target(
+        stepper=components.get('big_stepper'),
+        pid=components.get('big_stepper_PID'),
+        enc=enc,
+        stepper_dc=85, 
+        setpoint=5, 
+        error=1
+    )
+    session.close()
+    return
+
+
 def run_trial(
         db_conn: str,
         trial_id: int = 1,
         cam_settings_id = 1,
         server_ip = '192.168.1.3',
-        is_calibration: bool = False
+        server_user: str = None,
+        postgres_db_dir: str = '/share/CACHEDEV1_DATA/Public/postgres_data',
+        is_calibration: bool = False,
+        pipelined: bool = False,
+        max_in_flight: int = 2,
+        concurrent_download: bool = False,
+        angular_decimation: bool = False,
+        selective_download: bool = False,
+        transport: str = 'sftp',
+        adaptive_stepping: bool = False,
+        strain_delta_min: float = None,
+        strain_delta_max: float = None,
+        settle_tolerance: float = None,
+        settle_timeout_s: float = 10,
+        timing_dir: str = 'timings',
+        meta_dir: str = 'trial_meta',
+        background_db_writes: bool = False,
+        resume: bool = False,
+        transfer_daemon: bool = False,
+        max_queued_steps: int = 8,
+        transfer_timeout_s: float = 3600,
+        precrop_color_setting_id: int = None,
+        precrop_box: List[int] = None
         ):
+    """
+    stop and go photogrammetry trial. with adaptive_stepping the strain delta is picked
+    each step by adaptive_strain_delta between strain_delta_min and strain_delta_max,
+    which default to the trial's strain_delta_target and 4x that. settle_tolerance turns on
+    settle aware force sampling per step. per step phase timings are printed at the end
+    and written to timing_dir/<trial name>.csv. values compression_testing_data has no column
+    for (the strain schedule, force settle times, phase timings and crop boxes) go in
+    meta_dir/<trial name>.json on the pi, see trial_meta. a copy is uploaded next to the
+    trial's frames as trial_meta.json at the end of the trial (see upload_trial_meta).
+
+    with background_db_writes step, force and Frame records go through a DBWriter instead
+    of committing inside the control loop, it is flushed at the end of each step's Frame
+    registration and at the end of the trial. failed writes are logged after the step they
+    happened in and the trial raises once it is over and the platen is home.
+
+    with resume an interrupted trial is picked up where it stopped. frames left in the spool
+    by steps that never finished are uploaded first, then the sample height and force zero
+    measured at the start of the trial are reused (the platen is re-homed but the compressed
+    sample top is ignored) and stepping continues after the last step with a force reading.
+    steps with a force reading whose frames still didnt go up keep their spool for a later
+    finish_spooled_steps, steps with no force reading are deleted unless their spool still
+    holds frames (see completed_trial_steps).
+
+    with transfer_daemon steps are only enqueued for upload (see transfer_daemon.TransferDaemon),
+    an in process daemon is started unless one is already watching the spool. finished
+    uploads are registered between steps, acquisition blocks while max_queued_steps are
+    still waiting on the daemon and the trial waits up to transfer_timeout_s for the rest
+    at the end. anything left over stays in the spool for resume
+
+    with precrop_color_setting_id (a ColorDefinition, normally the platen side one used by
+    get_full_ply) or a fixed precrop_box ([left, top, right, bottom] px) frames are cropped on
+    the pi before upload (see precrop.precrop_spool). cropped frames are uploaded as
+    <name>_precrop.<ext>, which tells get_full_ply to use them as they are, and their crop
+    boxes go in the trial sidecar
+
+    :param server_user: user on server_ip, defaults to DOMANLAB_USER from the environment / .env
+    """
+    server_user = server_user or os.environ.get('DOMANLAB_USER', 'domanlab')
     Session = get_session(conn_str=db_conn)
     session = Session()
 
     trial = session.query(CompressionTrial).filter(CompressionTrial.id == trial_id).first()
     if trial:
         components = sys_init()
+        db_writer = None
         if trial.sample:
             sample = session.query(Sample).filter(Sample.id == trial.sample.id).first()
         else:
@@ -221,20 +680,51 @@ def run_trial(
         else:
             phantom = None
 
+        camera_manager = CameraManager(load_settings=lambda id: get_cam_settings(session=session, id=id))
+        precrop = get_precrop_settings(session=session, color_setting_id=precrop_color_setting_id, box=precrop_box)
+
         if sample and not phantom:
             # components = sys_init()
 
-            force_zero = np.mean(sample_force_sensor(n_samples=100, components=components))
-            trial.force_zero = force_zero
-            session.commit()
-            logging.info(f"Force Zero: {force_zero}")
+            completed_steps = []
+            if resume:
+                finish_spooled_steps(
+                    session=session,
+                    trial_id=trial_id,
+                    trial_frames_dir=f'{postgres_db_dir}/{trial.name}',
+                    cam_settings_id=cam_settings_id,
+                    dest_machine_addr=server_ip,
+                    dest_machine_user=server_user
+                )
+                completed_steps = completed_trial_steps(
+                    session=session,
+                    trial_id=trial_id,
+                    frames_required=trial.frames_per_step_target > 0,
+                    delete_incomplete=True
+                )
 
-            encoder_zero_count, encoder_sample_height_count = platon_setup(components=components) 
-            sample_height_counts = abs(encoder_zero_count - encoder_sample_height_count)
-            sample_height_mm = counts_to_mm(sample_height_counts)
-            sample.height_enc = sample_height_mm
-            session.commit()
-            logging.info(f"Sample Height: {sample_height_mm}")
+            if completed_steps and trial.force_zero is not None and sample.height_enc:
+                logging.info(f"Resuming trial {trial_id} after {len(completed_steps)} completed steps, "
+                             f"last strain target {completed_steps[-1].strain_target}")
+                encoder_zero_count, _ = platon_setup(components=components)
+                sample_height_mm = sample.height_enc
+                encoder_sample_height_count = encoder_zero_count - mm_to_counts(sample_height_mm)
+                logging.info(f"Restored Sample Height: {sample_height_mm}, Force Zero: {trial.force_zero}")
+            else:
+                if resume:
+                    logging.info(f"Nothing to resume for trial {trial_id}, starting from strain 0")
+
+                force_zero = np.mean(sample_force_sensor(n_samples=100, components=components))
+                trial.force_zero = force_zero
+                session.commit()
+                logging.info(f"Force Zero: {force_zero}")
+
+                encoder_zero_count, encoder_sample_height_count = platon_setup(components=components) 
+                sample_height_counts = abs(encoder_zero_count - encoder_sample_height_count)
+                sample_height_mm = counts_to_mm(sample_height_counts)
+                sample.height_enc = sample_height_mm
+                session.commit()
+                logging.info(f"Sample Height: {sample_height_mm}")
 
             # force_zero = np.mean(sample_force_sensor(n_samples=100, components=components))
             # trial.force_zero = force_zero
@@ -248,11 +738,46 @@ def run_trial(
             desired_strain_delta = trial.strain_delta_target 
             force_limit = trial.force_limit
 
+            timer = PhaseTimer()
+            meta_path = trial_meta_path(trial_name=trial.name, meta_dir=meta_dir)
+            db_writer = DBWriter(Session=Session) if background_db_writes else None
+            transfer_queue = None
+            daemon = None
+            if transfer_daemon:
+                transfer_queue = TransferQueue(finish=finish_trial_step, max_queued=max_queued_steps)
+                if not daemon_running():
+                    daemon = TransferDaemon(max_concurrent=max_in_flight).start()
+            finisher = None
+            if pipelined:
+                finisher = StepFinisher(Session=Session, finish=finish_trial_step, max_in_flight=max_in_flight)
+
+            if adaptive_stepping:
+                strain_delta_min = strain_delta_min if strain_delta_min else desired_strain_delta
+                strain_delta_max = strain_delta_max if strain_delta_max else 4 * desired_strain_delta
+            step_strains = []
+            step_forces = []
+            strain_schedule = []
+
             step_strain_target = strain_min
-            while True:
+            if completed_steps:
+                step_strains = [step.strain_encoder for step in completed_steps]
+                step_forces = [step.force for step in completed_steps]
+                strain_schedule = [step.strain_target for step in completed_steps]
+                if adaptive_stepping:
+                    step_strain_delta = adaptive_strain_delta(
+                        strains=step_strains,
+                        forces=step_forces,
+                        delta_min=strain_delta_min,
+                        delta_max=strain_delta_max
+                    )
+                else:
+                    step_strain_delta = desired_strain_delta
+                step_strain_target = completed_steps[-1].strain_target + step_strain_delta
+
+            while step_strain_target <= desired_strain_limit:
                 logging.info(f"Running Trial Step")
 
-                run_trial_step(
+                new_step = run_trial_step(
                     components=components,
                     session=session,
                     photos_per_step_target=trial.frames_per_step_target,
@@ -262,17 +787,68 @@ def run_trial(
                     trial_id=trial_id,
                     trial_name=trial.name,
                     cam_settings_id=cam_settings_id,
-                    postgres_db_dir='/share/CACHEDEV1_DATA/Public/postgres_data',
+                    postgres_db_dir=postgres_db_dir,
                     dest_machine_addr=server_ip,
-                    dest_machine_user='domanlab',
-                    is_calibration=False
+                    dest_machine_user=server_user,
+                    is_calibration=False,
+                    finisher=finisher,
+                    camera_manager=camera_manager,
+                    concurrent_download=concurrent_download,
+                    angular_decimation=angular_decimation,
+                    selective_download=selective_download,
+                    transport=transport,
+                    settle_tolerance=settle_tolerance,
+                    settle_timeout_s=settle_timeout_s,
+                    timer=timer,
+                    db_writer=db_writer,
+                    transfer_queue=transfer_queue,
+                    precrop=precrop,
+                    meta_path=meta_path
                 )
+                strain_schedule.append(step_strain_target)
+                if db_writer:
+                    db_writer.report_errors()  # a failed step or force write shows up here, not steps later
+
+                if adaptive_stepping:
+                    step_strains.append(new_step.strain_encoder)
+                    step_forces.append(new_step.force)
+                    step_strain_delta = adaptive_strain_delta(
+                        strains=step_strains,
+                        forces=step_forces,
+                        delta_min=strain_delta_min,
+                        delta_max=strain_delta_max
+                    )
+                    logging.info(f"Next Strain Delta: {step_strain_delta}")
+                else:
+                    step_strain_delta = desired_strain_delta
+
+                step_strain_target += step_strain_delta
+
+            logging.info("Strain limit reached! Trial Complete")
+            logging.info(f"Strain Schedule: {strain_schedule}")
+            set_if_column(trial, meta_path=meta_path, strain_schedule=json.dumps(strain_schedule))
+            session.commit()
 
-                step_strain_target += desired_strain_delta
+            if finisher:
+                logging.info("Waiting for step uploads to finish...")
+                finisher.close()
+            if transfer_queue:
+                logging.info("Waiting for the transfer daemon...")
+                transfer_queue.wait(session=session, timeout_s=transfer_timeout_s)
+                if daemon:
+                    daemon.stop()
+            if db_writer:
+                db_writer.close()  # trial barrier, everything queued is committed before close returns
+            upload_trial_meta(
+                meta_path=meta_path,
+                trial_frames_dir=f'{postgres_db_dir}/{trial.name}',
+                dest_machine_addr=server_ip,
+                dest_machine_user=server_user
+            )
 
-                if step_strain_target > desired_strain_limit:
-                    logging.info("Strain limit reached! Trial Complete")
-                    break
+            timer.print_summary(title=f"Trial {trial_id} Phase Timing")
+            os.makedirs(timing_dir, exist_ok=True)
+            timer.to_csv(filepath=os.path.join(timing_dir, f"{trial.name}.csv"))
 
         elif phantom:
             logging.info(f"Running Trial Step")
@@ -287,10 +863,16 @@ def run_trial(
                 trial_id=trial_id,
                 trial_name=trial.name,
                 cam_settings_id=cam_settings_id,
-                postgres_db_dir='/share/CACHEDEV1_DATA/Public/postgres_data',
+                postgres_db_dir=postgres_db_dir,
                 dest_machine_addr=server_ip,
-                dest_machine_user='domanlab',
-                is_calibration=True
+                dest_machine_user=server_user,
+                is_calibration=True,
+                camera_manager=camera_manager,
+                concurrent_download=concurrent_download,
+                angular_decimation=angular_decimation,
+                selective_download=selective_download,
+                transport=transport,
+                precrop=precrop
             )
             logging.info("Phantom Trial Complete.")
         
@@ -306,12 +888,157 @@ def run_trial(
             error=1
         )
         session.close()
+        if db_writer:
+            db_writer.check()  # the trial is over and the platen is home, now surface failed writes
     
     else:
         logging.info(f"Trial with ID: {trial_id} not found!")
     return
 
 
+def upload_trial_meta(
+        meta_path: str,
+        trial_frames_dir: str,
+        dest_machine_addr: str = '192.168.1.3',
+        dest_machine_user: str = 'domanlab',
+):
+    """
+    copy the trial's sidecar json (see trial_meta) next to its frames on the server as
+    trial_meta.json. the local file is kept, finish_spooled_steps can still add to it and a
+    resumed trial uploads it again. an upload error is logged, it shouldnt fail the trial
+    """
+    if not os.path.exists(meta_path):
+        return
+
+    upload_dir = tempfile.mkdtemp()
+    try:
+        upload_path = os.path.join(upload_dir, 'trial_meta.json')
+        shutil.copyfile(meta_path, upload_path)
+        move_trial_assets(
+            absolute_asset_filepaths=[upload_path],
+            dest_asset_dir=trial_frames_dir,
+            dest_machine_user=dest_machine_user,
+            dest_machine_addr=dest_machine_addr,
+            interfaces=upload_interfaces()
+        )
+    except Exception as e:
+        logging.exception(f"Could not upload {meta_path}, it is still on the pi: {e}")
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+def step_spool_dirs(step, spool_root: str = 'spool'):
+    """
+    spool dirs a step's frames may be in, keyed by id or by name when the step went through a DBWriter
+    """
+    return [os.path.join(spool_root, f'step_{spool_key}') for spool_key in [step.id, step.name]]
+
+
+def spool_pending(spool_dir: str):
+    """
+    :return: True if the spool's manifest still lists frames not confirmed on the server
+    """
+    try:
+        with open(os.path.join(spool_dir, MANIFEST_FILENAME), 'r') as f:
+            frames = json.load(f).get('frames', [])
+    except (OSError, ValueError):
+        return False
+    return any(not frame.get('uploaded') for frame in frames)
+
+
+def completed_trial_steps(
+        session,
+        trial_id: int,
+        frames_required: bool = True,
+        delete_incomplete: bool = False,
+        spool_root: str = 'spool',
+):
+    """
+    steps of a trial that got as far as a force reading, stepping carries on after the last
+    of them since the sample cant be un-compressed. steps with a force reading but missing
+    Frames (frames_required) are kept and logged, their frames are still in the spool for
+    finish_spooled_steps. steps that died before their force reading are logged, with
+    delete_incomplete they are deleted along with any Frames and spool they have, unless
+    the spool still holds frames that were never uploaded
+
+    :return: steps with a force reading in strain target order
+    """
+    steps = session.query(CompressionStep).\
+        filter(CompressionStep.compression_trial_id == trial_id).\
+        order_by(CompressionStep.id).all()
+
+    completed = []
+    incomplete = []
+    missing_frames = []
+    for step in steps:
+        if step.force is None or step.strain_target is None:
+            incomplete.append(step)
+        else:
+            completed.append(step)
+            if frames_required and not step.frames:
+                missing_frames.append(step)
+
+    if missing_frames:
+        logging.info(f"Trial {trial_id} steps have a force reading but no Frames yet, their spools are kept "
+                     f"for finish_spooled_steps: {[step.id for step in missing_frames]}")
+    if incomplete:
+        logging.info(f"Trial {trial_id} steps have no force reading: {[step.id for step in incomplete]}")
+
+    if incomplete and delete_incomplete:
+        n_deleted = 0
+        for step in incomplete:
+            spool_dirs = step_spool_dirs(step=step, spool_root=spool_root)
+            if any(spool_pending(spool_dir=spool_dir) for spool_dir in spool_dirs):
+                logging.info(f"Keeping step {step.id}, its spool still has frames that were never uploaded")
+                continue
+            for frame in step.frames:
+                session.delete(frame)
+            for spool_dir in spool_dirs:
+                shutil.rmtree(spool_dir, ignore_errors=True)
+            session.delete(step)
+            n_deleted += 1
+        session.commit()
+        logging.info(f"Deleted {n_deleted} step(s) of trial {trial_id} without a force reading")
+
+    return sorted(completed, key=lambda step: step.strain_target)
+
+
+def finish_spooled_steps(
+        session,
+        trial_id: int,
+        trial_frames_dir: str,
+        cam_settings_id: int,
+        dest_machine_addr: str = '192.168.1.3',
+        dest_machine_user: str = 'domanlab',
+        spool_root: str = 'spool',
+):
+    """
+    upload and register frames still sitting in the spool, i.e. the capture worked but the
+    upload or the commit after it failed for some or all of a step's frames
+    """
+    steps = session.query(CompressionStep).filter(CompressionStep.compression_trial_id == trial_id).all()
+    for step in steps:
+        for spool_dir in step_spool_dirs(step=step, spool_root=spool_root):
+            if not os.path.exists(os.path.join(spool_dir, MANIFEST_FILENAME)):
+                continue
+
+            logging.info(f"Finishing spooled frames for step {step.id} from {spool_dir}")
+            try:
+                finish_trial_step(
+                    session=session,
+                    step_id=step.id,
+                    spool_dir=spool_dir,
+                    trial_frames_dir=trial_frames_dir,
+                    cam_settings_id=cam_settings_id,
+                    dest_machine_addr=dest_machine_addr,
+                    dest_machine_user=dest_machine_user
+                )
+            except Exception as e:
+                logging.exception(f"Could not finish spooled step {step.id}: {e}")
+                session.rollback()
+            break
+
+
 def num_photos_2_cam_stepper_freq(
         num_photos: int,
         seconds_per_photo: int = 1,
@@ -331,28 +1058,90 @@ def num_photos_2_cam_stepper_freq(
     return round(freq, ndigits=0)
 
 
-def decimate_frames(file_paths, desired_size):
-    if len(file_paths) > desired_size:
-        # Calculate the number of items to remove
-        num_to_remove = len(file_paths) - desired_size
-        # Randomly select file paths to remove
-        files_to_remove = random.sample(file_paths, num_to_remove)
-        
-        for file_path in files_to_remove:
+def run_trial_step(
+        components,
+        session,
+        photos_per_step_target: int,
+        step_strain_target: float,
+        sample_height_mm: float,
+        encoder_sample_height_count: int,
+        trial_id: int,
+        trial_name: str,
+        cam_settings_id: int = 1,
+        postgres_db_dir: str = '/share/CACHEDEV1_DATA/Public/postgres_data',
+        dest_machine_addr: str = '192.168.1.3',
+        dest_machine_user: str = 'domanlab',
+        is_calibration: bool = False,
+        finisher: StepFinisher = None,
+        camera_manager: CameraManager = None,
+        concurrent_download: bool = False,
+        angular_decimation: bool = False,
+        selective_download: bool = False,
+        transport: str = 'sftp',
+        settle_tolerance: float = None,
+        settle_timeout_s: float = 10,
+        timer: PhaseTimer = None,
+        db_writer: DBWriter = None,
+        transfer_queue: TransferQueue = None,
+        precrop: dict = None,
+        meta_path: str = None
+        ):
+    """
+    compress, sample force and capture frames for one step, then upload and register the frames.
+    if a finisher is given the upload and Frame registration are handed to it and this returns
+    as soon as the frames are on the pi. if a timer is given every phase of the step is timed.
+    with a db_writer the step is only written in the background, the returned step is not
+    attached to session and has no id. with a transfer_queue the frames are only enqueued
+    for the transfer daemon and steps it has finished since the last call are registered,
+    this blocks while the queue is full (see TransferQueue.throttle)
+
+    :return: the new CompressionStep
+    """
+    new_step, job = acquire_trial_step(
+        components=components,
+        session=session,
+        photos_per_step_target=photos_per_step_target,
+        step_strain_target=step_strain_target,
+        sample_height_mm=sample_height_mm,
+        encoder_sample_height_count=encoder_sample_height_count,
+        trial_id=trial_id,
+        trial_name=trial_name,
+        cam_settings_id=cam_settings_id,
+        postgres_db_dir=postgres_db_dir,
+        dest_machine_addr=dest_machine_addr,
+        dest_machine_user=dest_machine_user,
+        is_calibration=is_calibration,
+        camera_manager=camera_manager,
+        concurrent_download=concurrent_download,
+        angular_decimation=angular_decimation,
+        selective_download=selective_download,
+        transport=transport,
+        settle_tolerance=settle_tolerance,
+        settle_timeout_s=settle_timeout_s,
+        timings=timer.new_step() if timer else None,
+        db_writer=db_writer,
+        precrop=precrop,
+        meta_path=meta_path
+    )
+
+    if transfer_queue:
+        if job:
+            transfer_queue.submit(job)
+        transfer_queue.throttle(session=session)
+    elif job:
+        if finisher:
+            finisher.submit(job)
+        else:
             try:
-                # Attempt to delete the file
-                os.remove(file_path)
-                # Remove the file path from the list
-                file_paths.remove(file_path)
-                print(f"Removed: {file_path}")
-            except OSError as e:
-                print(f"Error deleting {file_path}: {e}")
-    else:
-        print("No need to reduce the list.")
-    return file_paths
+                finish_trial_step(session=session, **job)
+            except Exception as e:
+                # same as the finisher, an upload problem shouldnt end the trial, the spool is kept for resume
+                logging.exception(f"Finishing step {job.get('step_id')} failed: {e}")
+                session.rollback()
+    return new_step
 
 
-def run_trial_step(
+def acquire_trial_step(
         components,
         session,
         photos_per_step_target: int,
@@ -365,17 +1154,50 @@ def run_trial_step(
         postgres_db_dir: str = '/share/CACHEDEV1_DATA/Public/postgres_data',
         dest_machine_addr: str = '192.168.1.3',
         dest_machine_user: str = 'domanlab',
-        is_calibration: bool = False
+        is_calibration: bool = False,
+        camera_manager: CameraManager = None,
+        concurrent_download: bool = False,
+        angular_decimation: bool = False,
+        selective_download: bool = False,
+        transport: str = 'sftp',
+        settle_tolerance: float = None,
+        settle_timeout_s: float = 10,
+        timings: dict = None,
+        spool_root: str = 'spool',
+        db_writer: DBWriter = None,
+        precrop: dict = None,
+        meta_path: str = None
         ):
+    """
+    motion, force and capture phases of a step. frames are downloaded into a per step
+    spool (see StepSpool) so the next step can capture while these are still uploading.
+    with concurrent_download each camera is drained on its own thread, with angular_decimation
+    the kept frames are spread evenly around the turntable (see decimate_frames_by_angle).
+    with selective_download only the kept frames are pulled off the cameras (see spool_step_frames).
+    with settle_tolerance force is streamed until it settles (see sample_force_settled)
+    instead of a fixed 100 sample average, the settle time and drift go in the trial's
+    sidecar json at meta_path. phase durations are added to timings if given.
+    with a db_writer nothing is committed here, the step is queued once its fields are set.
+    precrop (see get_precrop_settings) goes in the job, frames are cropped just before upload
+
+    :return: (new CompressionStep, kwargs for finish_trial_step or None if no frames were taken)
+    """
 
     new_step = CompressionStep(
         name=uuid.uuid4(),
         strain_target=step_strain_target,
         compression_trial_id=trial_id
     )
-    session.add(new_step)
-    session.commit()
-    new_step_id = new_step.id
+    new_step_id = None
+    if not db_writer:
+        session.add(new_step)
+        with timed(timings, 'step_commit'):
+            session.commit()
+        new_step_id = new_step.id
+
+    def queue_step():
+        step_values = column_values(new_step)
+        db_writer.submit(lambda session: session.add(CompressionStep(**step_values)))
 
     if not is_calibration:  # if not phantom trial then move crush stepper
         enc = components.get('e5')
@@ -384,85 +1206,252 @@ def run_trial_step(
         compression_dist_encoder_counts = mm_to_counts(compression_dist_mm)
         stepper_setpoint = encoder_sample_height_count + compression_dist_encoder_counts
 
-        move_stepper_PID_target(
-            stepper=components.get('big_stepper'),
-            pid=components.get('big_stepper_PID'),
-            enc=components.get('e5'),
-            stepper_dc=85, 
-            setpoint=stepper_setpoint, 
-            error=1
-        )
-        
-        # time.sleep(1)  # let force sensor cook
+        with timed(timings, 'move'):
+            move_stepper_PID_target(
+                stepper=components.get('big_stepper'),
+                pid=components.get('big_stepper_PID'),
+                enc=components.get('e5'),
+                stepper_dc=85, 
+                setpoint=stepper_setpoint, 
+                error=1
+            )
 
         new_sample_height_counts = abs(enc.get_encoder_count() - encoder_sample_height_count)
         new_sample_height_mm = counts_to_mm(new_sample_height_counts)
         actual_strain = new_sample_height_mm / sample_height_mm
         new_step.strain_encoder = actual_strain
 
-        force = np.mean(sample_force_sensor(n_samples=100, components=components))
+        with timed(timings, 'force'):
+            if settle_tolerance:
+                settled = sample_force_settled(
+                    read_force=lambda: np.mean(sample_force_sensor(n_samples=1, components=components)),
+                    tolerance=settle_tolerance,
+                    timeout_s=settle_timeout_s
+                )
+                force = settled.get('force')
+                set_if_column(new_step, meta_path=meta_path, force_settle_s=settled.get('settle_s'), force_drift=settled.get('drift'))
+                logging.info(f"Force settled in {settled.get('settle_s'):.2f} s, drift {settled.get('drift'):.4f} / s")
+            else:
+                force = np.mean(sample_force_sensor(n_samples=100, components=components))
         new_step.force = force
-        session.commit()
+        if not db_writer:
+            with timed(timings, 'force_commit'):
+                session.commit()
         print(f"Force @ Strain {actual_strain}: {force}")
 
-    cam_settings = get_cam_settings(session=session, id=cam_settings_id)  # get cam settings from steps object!
-    cam_ports = init_cameras(cam_settings=cam_settings)
+    with timed(timings, 'init_cameras'):
+        if camera_manager:
+            cam_ports = camera_manager.ports(cam_settings_id=cam_settings_id)
+        else:
+            cam_settings = get_cam_settings(session=session, id=cam_settings_id)  # get cam settings from steps object!
+            cam_ports = init_cameras(cam_settings=cam_settings)
     
-    if photos_per_step_target > 0:
-        cam_steper_freq = num_photos_2_cam_stepper_freq(
-            num_photos=photos_per_step_target
-        )
+    if not photos_per_step_target > 0:
+        if timings is not None:
+            set_if_column(new_step, meta_path=meta_path, phase_timings=json.dumps(timings))
+        if db_writer:
+            queue_step()
+        else:
+            session.commit()
+        return new_step, None
 
-        capture_step_frames(cam_ports=cam_ports, components=components, stepper_freq=cam_steper_freq)
-        current_directory = os.getcwd()
-        ext = 'jpg'
-        for filename in os.listdir(current_directory):
-            if filename.endswith(ext):
-                filepath = os.path.join(current_directory, filename)
-                os.remove(filepath)
-                id = uuid.uuid4()
-                filename = f"{id}.%C"  # %C uses extension assigned by cam
-        
-        transfer_step_frames(cam_ports=cam_ports)
-        clear_cam_frames(cam_ports=cam_ports)
-
-        # move files to db store
-        absolute_filepaths_rpi = []
-        current_directory = os.getcwd()
-        ext = 'jpg'
-        for filename in os.listdir(current_directory):
-            if filename.endswith(ext):
-                original_filepath = os.path.join(current_directory, filename)
-                id = uuid.uuid4()
-                new_filename = f"{id}.{ext}"  # %C uses extension assigned by cam
-                new_filepath = os.path.join(current_directory, new_filename)
-                os.rename(original_filepath, new_filepath)
-                absolute_filepaths_rpi.append(new_filepath)
-
-        absolute_filepaths_rpi = decimate_frames(file_paths=absolute_filepaths_rpi, desired_size=photos_per_step_target)
-        
-        trial_frames_dir = f'{postgres_db_dir}/{trial_name}'
-        move_trial_assets(
-            absolute_asset_filepaths=absolute_filepaths_rpi,
-            dest_asset_dir=trial_frames_dir,
-            dest_machine_user=dest_machine_user,
-            dest_machine_addr=dest_machine_addr,
-            interfaces=['eth0']
-        )
+    cam_steper_freq = num_photos_2_cam_stepper_freq(
+        num_photos=photos_per_step_target
+    )
 
-        filenames = [os.path.basename(filepath) for filepath in absolute_filepaths_rpi]
-        for filename in filenames:
-            name = os.path.splitext(filename)[0]
-            file_ext = os.path.splitext(filename)[1].strip(".")
-            new_frame = Frame(
-                name=name,
-                file_extension=file_ext,
-                file_name=filename,
-                camera_setting_id=cam_settings_id,
-                compression_step_id=new_step_id
+    # frames land in their own spool so the next step's capture cant touch them
+    spool = StepSpool(spool_dir=os.path.join(spool_root, f'step_{new_step_id if new_step_id else new_step.name}'))
+
+    spool_step_frames(
+        cam_ports=cam_ports,
+        components=components,
+        spool=spool,
+        photos_per_step_target=photos_per_step_target,
+        stepper_freq=cam_steper_freq,
+        camera_manager=camera_manager,
+        concurrent_download=concurrent_download,
+        angular_decimation=angular_decimation,
+        selective_download=selective_download,
+        timings=timings
+    )
+    if db_writer:
+        queue_step()
+    else:
+        session.commit()
+
+    return new_step, {
+        'step_id': new_step_id,
+        'step_name': new_step.name,
+        'db_writer': db_writer,
+        'transport': transport,
+        'spool_dir': spool.spool_dir,
+        'trial_frames_dir': f'{postgres_db_dir}/{trial_name}',
+        'cam_settings_id': cam_settings_id,
+        'dest_machine_addr': dest_machine_addr,
+        'dest_machine_user': dest_machine_user,
+        'timings': timings,
+        'precrop': precrop,
+        'meta_path': meta_path,
+    }
+
+
+def spool_step_frames(
+        cam_ports,
+        components,
+        spool: StepSpool,
+        photos_per_step_target: int,
+        stepper_freq: float,
+        camera_manager: CameraManager = None,
+        concurrent_download: bool = False,
+        angular_decimation: bool = False,
+        timings: dict = None,
+        selective_download: bool = False,
+        ):
+    """
+    capture one turntable rotation, download it into spool and decimate down to
+    photos_per_step_target. with selective_download the cameras are listed first, the
+    frames to keep are picked off the listing and only those are pulled over usb
+    """
+    try:
+        with timed(timings, 'capture'):
+            capture_step_frames(cam_ports=cam_ports, components=components, stepper_freq=stepper_freq)
+
+        select = None
+        if selective_download:
+            with timed(timings, 'list'):
+                listed = list_frames(cam_ports=cam_ports, concurrent=concurrent_download, list_files=list_port_frames)
+                keep = set(pick_frames(
+                    frames=listed,
+                    desired_size=photos_per_step_target,
+                    stepper_freq=stepper_freq,
+                    angular_decimation=angular_decimation
+                ))
+                select = dict()
+                for frame in listed:
+                    if frame.get('file_name') in keep:
+                        select.setdefault(frame.get('port'), []).append(frame.get('number'))
+                logging.info(f"Downloading {len(keep)} / {len(listed)} listed frames.")
+
+        with timed(timings, 'download'):
+            downloaded_filepaths, download_stats = download_frames(
+                cam_ports=cam_ports, 
+                staging_root=spool.staging_dir, 
+                concurrent=concurrent_download,
+                download=download_port_frames,
+                clear=clear_port_frames,
+                select=select
             )
-            session.add(new_frame)
-    session.commit()
+    except Exception:
+        if camera_manager:
+            camera_manager.invalidate()  # re-detect and push full settings on the next step
+        raise
+
+    with timed(timings, 'spool'):
+        ports = {filepath: stat.get('port') for stat in download_stats for filepath in stat.get('filepaths')}
+        spool.ingest(filepaths=downloaded_filepaths, ports=ports)
+        if len(spool.file_names()) > photos_per_step_target:
+            spool.keep(file_names=pick_frames(
+                frames=spool.frames,
+                desired_size=photos_per_step_target,
+                stepper_freq=stepper_freq,
+                angular_decimation=angular_decimation
+            ))
+    return spool
+
+
+def finish_trial_step(
+        session,
+        step_id: int,
+        spool_dir: str,
+        trial_frames_dir: str,
+        cam_settings_id: int,
+        dest_machine_addr: str = '192.168.1.3',
+        dest_machine_user: str = 'domanlab',
+        timings: dict = None,
+        step_name: str = None,
+        db_writer: DBWriter = None,
+        transport: str = 'sftp',
+        precrop: dict = None,
+        meta_path: str = None,
+        ):
+    """
+    upload a step's spooled frames to the db store and register them as Frames,
+    the step's phase timings are stored once the last phase is done, in the trial's
+    sidecar json at meta_path as CompressionStep has no column for them. with a db_writer
+    the step is looked up by step_name (it may not have an id yet when the job is made)
+    and the writer is flushed before the spool is removed. transport is passed on to
+    move_trial_assets, 'tar' streams the whole step as one archive
+
+    uploads are checked against the spool manifest's sha256s and only frames confirmed on
+    the server are registered. frames that didnt make it stay in the spool and this raises,
+    running it again on the same spool (see finish_spooled_steps) only sends what is left
+
+    with precrop (kwargs for precrop.precrop_spool) pending frames are cropped before they go up,
+    the originals are only deleted once the crops are confirmed on the server
+    """
+    spool = StepSpool(spool_dir=spool_dir)
+    pending_filepaths = spool.pending_filepaths()
+    if pending_filepaths and precrop:
+        with timed(timings, 'precrop'):
+            precrop_spool(spool=spool, **precrop)
+        pending_filepaths = spool.pending_filepaths()  # crops go up under their own names
+    if pending_filepaths:
+        checksums = spool.checksums()
+        with timed(timings, 'transfer'):
+            transfer_stats = move_trial_assets(
+                absolute_asset_filepaths=pending_filepaths,
+                dest_asset_dir=trial_frames_dir,
+                dest_machine_user=dest_machine_user,
+                dest_machine_addr=dest_machine_addr,
+                interfaces=upload_interfaces(),
+                transport=transport,
+                checksums={os.path.basename(filepath): checksums.get(os.path.basename(filepath)) for filepath in pending_filepaths}
+            )
+        spool.mark_uploaded(file_names=[os.path.basename(filepath) for filepath in transfer_stats.get('confirmed')])
+
+    filenames = spool.uploaded_file_names()
+    crop_boxes = spool.crop_boxes()
+    if db_writer:
+        def register_frames(session):
+            step = session.query(CompressionStep).filter(CompressionStep.name == step_name).one()
+            add_step_frames(session=session, step_id=step.id, filenames=filenames, cam_settings_id=cam_settings_id, crop_boxes=crop_boxes, meta_path=meta_path)
+
+        db_writer.submit(register_frames)
+        with timed(timings, 'frame_commit'):
+            db_writer.flush()
+
+        # the writer swallows errors, only drop the spool once the frames are really in
+        step = session.query(CompressionStep).filter(CompressionStep.name == step_name).first()
+        if not step:
+            raise RuntimeError(f"Step {step_name} was never written (DB writer errors: "
+                               f"{[str(e) for write, e in db_writer.errors]}), keeping {spool.spool_dir}")
+        n_registered = session.query(Frame).filter(Frame.compression_step_id == step.id).count() if step else 0
+        if n_registered < len(filenames):
+            raise RuntimeError(f"Frames for step {step_name} were not registered, keeping {spool.spool_dir}")
+        step_id = step.id
+    else:
+        add_step_frames(session=session, step_id=step_id, filenames=filenames, cam_settings_id=cam_settings_id, crop_boxes=crop_boxes, meta_path=meta_path)
+        with timed(timings, 'frame_commit'):
+            session.commit()
+
+    unconfirmed = [frame.get('file_name') for frame in spool.frames if not frame.get('uploaded')]
+    if unconfirmed:
+        spool.keep(file_names=unconfirmed)  # registered frames are done with, leave only what still has to go up
+    else:
+        spool.remove()
+
+    if timings is not None:
+        phase_timings = json.dumps(timings)
+        if db_writer:
+            db_writer.submit(lambda session: set_if_column(session.get(CompressionStep, step_id), meta_path=meta_path, phase_timings=phase_timings))
+        else:
+            step = session.get(CompressionStep, step_id)
+            set_if_column(step, meta_path=meta_path, phase_timings=phase_timings)
+            session.commit()
+
+    if unconfirmed:
+        raise RuntimeError(f"{len(unconfirmed)} frame(s) of step {step_id} not confirmed on the server, "
+                           f"left in {spool.spool_dir}")
     return
 
 
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import glob
+import os
+import shutil
+import socket
+import time
+
+from typing import List
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+from spool import file_sha256
+
+# columns that name or date a settings row without changing what it produces
+IGNORED_SETTING_COLUMNS = ['id', 'name', 'created_at', 'updated_at']
+HASHES_DIRNAME = 'hashes'
+
+
+def settings_values(settings):
+    """
+    the column values of a settings row that affect its output, so duplicated rows with
+    different ids give the same dict. every column is kept whatever its type (Numeric gives
+    Decimal, ARRAY / JSON give lists and dicts), artifact_key serialises them with str.
+    relationships and private attributes are left out
+
+    :param settings: a row or its __dict__
+    """
+    values = settings if isinstance(settings, dict) else vars(settings)
+    state = values.get('_sa_instance_state')
+    if state is None:
+        return {key: value for key, value in values.items() if not key.startswith('_') and key not in IGNORED_SETTING_COLUMNS}
+
+    row = state.obj()
+    return {
+        attr.key: getattr(row, attr.key) if row is not None else values.get(attr.key)
+        for attr in state.mapper.column_attrs
+        if attr.key not in IGNORED_SETTING_COLUMNS
+    }
+
+
+def artifact_key(kind: str, inputs: List[str], settings: dict):
+    """
+    :param inputs: sha256s of the input files, order matters so sort them if it doesnt
+    :return: sha256 identifying the artifact made from inputs with settings
+    """
+    payload = json.dumps({'kind': kind, 'inputs': inputs, 'settings': settings}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ArtifactCache:
+    """
+    content addressed index of derived reconstruction artifacts (full / processed plys and
+    raw / processed stls). an artifact's key is the hash of its inputs' sha256s plus the
+    resolved settings values (see artifact_key), so the same work asked for by another step,
+    trial or a duplicated settings row is found however the settings ids differ. entries
+    are one json file per key under root/index with the artifact's filepath, sha256 and any
+    values measured while making it (scaling factor, volume). file hashes are memoised by
+    size and mtime under root/hashes so unchanged inputs are not re-read, each process
+    writes its own <host>-<pid>.json there and reads everyone's
+
+    :param root: cache dir, normally next to the trial dirs so every trial shares it
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.index_dir = os.path.join(root, 'index')
+        self.hashes_dir = os.path.join(root, HASHES_DIRNAME)
+        self.hashes_path = os.path.join(self.hashes_dir, f"{socket.gethostname()}-{os.getpid()}.json")
+        os.makedirs(self.index_dir, exist_ok=True)
+        os.makedirs(self.hashes_dir, exist_ok=True)
+        self.hashes = self.load_hashes()
+        self.new_hashes = dict()
+
+    @staticmethod
+    def read_hashes(filepath: str):
+        try:
+            with open(filepath, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def load_hashes(self):
+        """
+        :return: every process's memoised hashes merged, a stale one is caught by its size / mtime
+        """
+        hashes = dict()
+        for filepath in sorted(glob.glob(os.path.join(self.hashes_dir, '*.json'))):
+            hashes.update(self.read_hashes(filepath=filepath))
+        return hashes
+
+    def save_hashes(self):
+        """
+        merge this process's new file hashes into its own file under root/hashes. no other
+        process writes that file so parallel workers cant drop each other's hashes
+        """
+        if not self.new_hashes:
+            return
+        hashes = self.read_hashes(filepath=self.hashes_path)
+        hashes.update(self.new_hashes)
+        tmp_path = f"{self.hashes_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(hashes, f)
+        os.replace(tmp_path, self.hashes_path)
+        self.hashes.update(self.new_hashes)
+        self.new_hashes = dict()
+
+    def file_hash(self, filepath: str):
+        stat = os.stat(filepath)
+        key = os.path.abspath(filepath)
+        known = self.new_hashes.get(key) or self.hashes.get(key)
+        if known and known.get('size') == stat.st_size and known.get('mtime_ns') == stat.st_mtime_ns:
+            return known.get('sha256')
+
+        sha256 = file_sha256(filepath)
+        self.new_hashes[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        return sha256
+
+    def entry_path(self, key: str):
+        return os.path.join(self.index_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        """
+        :return: the entry for key or None, entries whose file is gone or changed are dropped.
+                 the file hashes made so far (the inputs hashed for key) are saved either way,
+                 a run where every stage hits the cache still keeps them for the next run
+        """
+        try:
+            with open(self.entry_path(key=key), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.save_hashes()
+            return None
+
+        filepath = entry.get('filepath')
+        if not os.path.exists(filepath) or self.file_hash(filepath) != entry.get('sha256'):
+            logging.info(f"Cached {entry.get('kind')} {filepath} is gone or changed, dropping it.")
+            try:
+                os.remove(self.entry_path(key=key))
+            except OSError:
+                pass  # another worker dropped it first
+            entry = None
+        else:
+            logging.info(f"Reusing cached {entry.get('kind')} {filepath}")
+
+        self.save_hashes()
+        return entry
+
+    def put(self, key: str, kind: str, filepath: str, **values):
+        """
+        :param values: measured alongside the artifact and handed back on reuse, i.e. volume
+        """
+        entry_path = self.entry_path(key=key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'kind': kind,
+                'filepath': filepath,
+                'sha256': self.file_hash(filepath),
+                'values': values,
+                'created_at': time.time(),
+            }, f, indent=1)
+        os.replace(tmp_path, entry_path)
+        self.save_hashes()
+
+    def reuse(self, entry: dict, dest_dir: str):
+        """
+        make a cached artifact available in dest_dir (copied if it lives in another trial's dir)
+
+        :return: its file name in dest_dir
+        """
+        filepath = entry.get('filepath')
+        file_name = os.path.basename(filepath)
+        dest = os.path.join(dest_dir, file_name)
+        if os.path.abspath(dest) != os.path.abspath(filepath) and not os.path.exists(dest):
+            shutil.copyfile(filepath, dest)
+        return file_name
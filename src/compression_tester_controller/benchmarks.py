@@ -0,0 +1,239 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+from compression_testing_data.meta import get_session
+from compression_testing_data.models.samples import Sample
+from compression_testing_data.models.acquisition_settings import CameraSetting
+from compression_testing_data.models.testing import CompressionTrial, CompressionStep
+
+import sim_components
+from file_management import move_trial_assets, move_file
+from spool import file_sha256
+
+
+def use_bench_backends():
+    """
+    default to the simulated rig and the local transfer backend unless the environment says
+    otherwise. hardware picks its backend when first imported so this has to run before
+    acquisition_protocols is, the bench entry points call it and import it after
+    """
+    os.environ.setdefault('COMPRESSION_TESTER_BACKEND', 'sim')
+    # uploads land in a local dir instead of the nas, see file_management.get_transfer_backend
+    os.environ.setdefault('TRANSFER_BACKEND', 'local')
+
+
+def create_bench_trial(
+        session,
+        frames_per_step_target: int,
+        strain_delta_target: float,
+        strain_limit: float,
+):
+    from acquisition_protocols import add_default_camera_params
+
+    if not session.query(CameraSetting).filter(CameraSetting.id == 1).first():
+        add_default_camera_params(session=session)
+
+    new_sample = Sample(
+        geometry_units='mm',
+        cell_size=0.5,
+        relative_density=0.1,
+        n_perimeters=1
+    )
+    session.add(new_sample)
+    session.commit()
+
+    new_trial = CompressionTrial(
+        name=uuid.uuid4(),
+        frames_per_step_target=frames_per_step_target,
+        strain_delta_target=strain_delta_target,
+        strain_limit=strain_limit,
+        force_limit=1000,
+        force_unit='N',
+        sample_id=new_sample.id
+    )
+    session.add(new_trial)
+    session.commit()
+    return new_trial.id
+
+
+def bench_trial(
+        db_conn: str = 'sqlite:///sim_bench.db',
+        frames_per_step_target: int = 30,
+        strain_delta_target: float = 0.1,
+        strain_limit: float = 0.5,
+        sim_config: dict = None,
+        server_ip: str = '127.0.0.1',
+        trial_runner: str = 'run_trial',
+        **run_trial_kwargs
+):
+    """
+    run a full trial against the simulated rig and report throughput. run_trial_kwargs go
+    straight to run_trial so pipelined / concurrent_download etc. can be compared. uploads
+    go to the local transfer backend unless TRANSFER_BACKEND is set to something else
+
+    :param db_conn: any sqlalchemy url, tables are created if missing
+    :param sim_config: overrides for sim_components.SIM_CONFIG, i.e. {'time_scale': 0.01}
+    :param trial_runner: name of the acquisition_protocols runner, run_trial or run_continuous_trial
+    :return: dict of results, steps_per_hour is in rig time (wall time / time_scale)
+    """
+    use_bench_backends()
+    import hardware
+    import acquisition_protocols
+
+    if hardware.BACKEND != 'sim':
+        raise RuntimeError("bench_trial needs COMPRESSION_TESTER_BACKEND=sim")
+    trial_runner = getattr(acquisition_protocols, trial_runner)
+
+    if sim_config:
+        sim_components.configure(**sim_config)
+    time_scale = sim_components.SIM_CONFIG.get('time_scale')
+
+    Session = get_session(conn_str=db_conn)
+    session = Session()
+    CompressionTrial.metadata.create_all(bind=session.get_bind())
+
+    trial_id = create_bench_trial(
+        session=session,
+        frames_per_step_target=frames_per_step_target,
+        strain_delta_target=strain_delta_target,
+        strain_limit=strain_limit
+    )
+
+    start = time.monotonic()
+    trial_runner(db_conn=db_conn, trial_id=trial_id, server_ip=server_ip, **run_trial_kwargs)
+    wall_s = time.monotonic() - start
+
+    n_steps = session.query(CompressionStep).filter(CompressionStep.compression_trial_id == trial_id).count()
+    session.close()
+
+    rig_s = wall_s / time_scale
+    results = {
+        'trial_id': trial_id,
+        'n_steps': n_steps,
+        'wall_s': wall_s,
+        'rig_s': rig_s,
+        'steps_per_hour': n_steps / (rig_s / 3600) if rig_s > 0 else 0.0,
+        'trial_runner': trial_runner.__name__,
+        'run_trial_kwargs': run_trial_kwargs,
+    }
+    print(f"{trial_runner.__name__} {trial_id}: {n_steps} steps in {rig_s:.0f} rig s ({wall_s:.1f} wall s) "
+          f"-> {results.get('steps_per_hour'):.1f} steps/hour {run_trial_kwargs}")
+    return results
+
+
+def write_bench_frames(dest_dir: str, n_files: int, file_bytes: int):
+    os.makedirs(dest_dir, exist_ok=True)
+    filepaths = []
+    for i in range(n_files):
+        filepath = os.path.join(dest_dir, f"{uuid.uuid4()}.jpg")
+        with open(filepath, 'wb') as f:
+            f.write(b'\xff\xd8' + os.urandom(file_bytes - 4) + b'\xff\xd9')
+        filepaths.append(filepath)
+    return filepaths
+
+
+def transfer_results(name: str, n_files: int, n_bytes: int, seconds: float, latencies: list):
+    results = {
+        'name': name,
+        'n_files': n_files,
+        'mb': n_bytes / 1e6,
+        'seconds': seconds,
+        'files_per_s': n_files / seconds if seconds > 0 else 0.0,
+        'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+    }
+    if latencies:
+        for pct in [50, 90, 99]:
+            results[f'p{pct}_ms'] = float(np.percentile(latencies, pct)) * 1000
+
+    latency = ' '.join(f"p{pct} {results.get(f'p{pct}_ms'):.1f} ms" for pct in [50, 90, 99] if f'p{pct}_ms' in results)
+    print(f"{name}: {n_files} files, {results.get('mb'):.0f} MB in {seconds:.2f} s -> "
+          f"{results.get('files_per_s'):.1f} files/s, {results.get('mb_per_s'):.1f} MB/s {latency}")
+    return results
+
+
+def bench_transfer(
+        n_files: int = 200,
+        file_bytes: int = 6_000_000,
+        transport: str = 'sftp',
+        verify: bool = False,
+        dest_asset_dir: str = '/bench/postgres_data/transfer',
+        dest_machine_addr: str = '127.0.0.1',
+        dest_machine_user: str = 'domanlab',
+        interfaces: list = None,
+):
+    """
+    push one realistic step batch through move_trial_assets and report files/s, MB/s and per
+    file latency percentiles (not available for tar). with the default TRANSFER_BACKEND=local
+    nothing leaves the machine, set TRANSFER_BACKEND=ssh for loopback ssh on 127.0.0.1 or
+    point dest_machine_addr at the nas for the real thing
+
+    :param verify: pass sha256s so the transfer goes through put_verified
+    """
+    use_bench_backends()
+    work_dir = tempfile.mkdtemp(prefix='bench_transfer_')
+    try:
+        filepaths = write_bench_frames(dest_dir=work_dir, n_files=n_files, file_bytes=file_bytes)
+        checksums = {os.path.basename(filepath): file_sha256(filepath) for filepath in filepaths} if verify else None
+        n_bytes = sum(os.path.getsize(filepath) for filepath in filepaths)
+
+        start = time.monotonic()
+        stats = move_trial_assets(
+            absolute_asset_filepaths=filepaths,
+            interfaces=interfaces if interfaces else ['lo'],
+            dest_asset_dir=f"{dest_asset_dir}/{uuid.uuid4()}",
+            dest_machine_user=dest_machine_user,
+            dest_machine_addr=dest_machine_addr,
+            transport=transport,
+            checksums=checksums
+        )
+        seconds = time.monotonic() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies = [stat.get('seconds') for stat in stats.get('files', [])] if stats else []
+    name = f"{transport}{' verified' if verify else ''} ({os.environ.get('TRANSFER_BACKEND', 'ssh')})"
+    return transfer_results(name=name, n_files=n_files, n_bytes=n_bytes, seconds=seconds, latencies=latencies)
+
+
+def bench_move_file(n_files: int = 200, file_bytes: int = 6_000_000, dest_dir: str = None):
+    """
+    time move_file over a step batch, a dest_dir on another filesystem makes it a copy
+    """
+    work_dir = tempfile.mkdtemp(prefix='bench_move_')
+    dest_dir = dest_dir if dest_dir else os.path.join(work_dir, 'dest')
+    try:
+        filepaths = write_bench_frames(dest_dir=os.path.join(work_dir, 'src'), n_files=n_files, file_bytes=file_bytes)
+        n_bytes = sum(os.path.getsize(filepath) for filepath in filepaths)
+
+        latencies = []
+        start = time.monotonic()
+        for filepath in filepaths:
+            file_start = time.monotonic()
+            move_file(source=filepath, destination=os.path.join(dest_dir, os.path.basename(filepath)))
+            latencies.append(time.monotonic() - file_start)
+        seconds = time.monotonic() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return transfer_results(name='move_file', n_files=n_files, n_bytes=n_bytes, seconds=seconds, latencies=latencies)
+
+
+if __name__ == '__main__':
+    sim = {'time_scale': 0.02}
+    bench_trial(sim_config=sim)
+    bench_trial(sim_config=sim, pipelined=True, concurrent_download=True, angular_decimation=True, background_db_writes=True, selective_download=True)
+    bench_trial(sim_config=sim, trial_runner='run_continuous_trial', concurrent_download=True, angular_decimation=True)
+
+    for transport in ['sftp', 'tar']:
+        bench_transfer(transport=transport)
+        bench_transfer(transport=transport, verify=True)
+    bench_move_file()
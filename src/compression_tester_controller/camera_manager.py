@@ -0,0 +1,74 @@
+import logging
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+from hardware import init_cameras, set_port_config
+
+
+def diff_cam_settings(applied, wanted):
+    """
+    settings in wanted that differ from applied, works on both the dict and the
+    list form of parsed gphoto settings
+
+    :return: same type as wanted, empty if nothing changed
+    """
+    if isinstance(wanted, dict):
+        applied = applied if isinstance(applied, dict) else {}
+        return {key: val for key, val in wanted.items() if key not in applied or applied[key] != val}
+
+    applied = list(applied) if applied else []
+    return [setting for setting in wanted if setting not in applied]
+
+
+class CameraManager:
+    """
+    long lived camera state for a trial. camera settings are loaded once per settings id,
+    ports are discovered on the first apply and reused, and later applies only push
+    settings that changed to the known ports (see set_port_config). call invalidate() after
+    a camera error to force a full re-init
+
+    :param load_settings: callable taking a camera settings id, returns parsed gphoto settings
+    """
+
+    def __init__(self, load_settings):
+        self.load_settings = load_settings
+        self.settings_cache = {}
+        self.applied = None
+        self.cam_ports = None
+
+    def get_settings(self, cam_settings_id: int):
+        if cam_settings_id not in self.settings_cache:
+            self.settings_cache[cam_settings_id] = self.load_settings(cam_settings_id)
+        return self.settings_cache[cam_settings_id]
+
+    def ports(self, cam_settings_id: int = 1):
+        """
+        make sure cameras are initialised with the given settings
+
+        :return: active camera ports
+        """
+        wanted = self.get_settings(cam_settings_id)
+
+        if self.cam_ports is None:
+            logging.info("Initialising cameras.")
+            self.cam_ports = init_cameras(cam_settings=wanted)
+            self.applied = wanted
+            return self.cam_ports
+
+        changed = diff_cam_settings(applied=self.applied, wanted=wanted)
+        if changed:
+            logging.info(f"Applying changed camera settings to {self.cam_ports}: {changed}")
+            try:
+                for port in self.cam_ports:
+                    set_port_config(port=port, cam_settings=changed)
+            except Exception as e:
+                logging.info(f"Could not apply changed camera settings, re-initialising cameras: {e}")
+                self.cam_ports = init_cameras(cam_settings=wanted)
+            self.applied = wanted
+
+        return self.cam_ports
+
+    def invalidate(self):
+        self.cam_ports = None
+        self.applied = None
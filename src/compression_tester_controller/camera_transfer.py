@@ -0,0 +1,220 @@
+import logging
+import os
+import re
+import subprocess
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+def port_dirname(port: str):
+    """
+    gphoto2 ports look like usb:001,005, make them safe as a dir name
+    """
+    return port.translate({ord(i): '_' for i in ':,/\\'})
+
+
+GPHOTO2_FILE_LINE = re.compile(r'^#(\d+)\s+(\S+).*?(?:\s(\d{9,}))?\s*$')
+
+
+def number_ranges(numbers: List[int]):
+    """
+    gphoto2 file number ranges, [1, 2, 3, 7] -> '1-3,7'
+    """
+    numbers = sorted(set(numbers))
+    ranges = []
+    start = prev = None
+    for number in numbers:
+        if start is None:
+            start = prev = number
+        elif number == prev + 1:
+            prev = number
+        else:
+            ranges.append(f"{start}-{prev}" if prev > start else f"{start}")
+            start = prev = number
+    if start is not None:
+        ranges.append(f"{start}-{prev}" if prev > start else f"{start}")
+    return ','.join(ranges)
+
+
+def spread_whole_seconds(frames):
+    """
+    gphoto2 only lists file times to the second, spread the frames of a camera that share
+    a second evenly across it (in file number order) so they can still be placed in angle
+    """
+    groups = {}
+    for frame in frames:
+        if frame.get('captured_at') is not None:
+            groups.setdefault((frame.get('port'), int(frame.get('captured_at'))), []).append(frame)
+
+    for (port, second), group in groups.items():
+        group.sort(key=lambda frame: frame.get('number'))
+        for i, frame in enumerate(group):
+            frame['captured_at'] = second + i / len(group)
+    return frames
+
+
+def list_port_frames(port: str):
+    """
+    list the files on the camera at port without downloading anything
+
+    :return: list of dicts with port, number (gphoto2 file number), name, file_name
+             (unique across cameras) and captured_at (unix seconds or None)
+    """
+    result = subprocess.run(
+        ['gphoto2', '--port', port, '--list-files'],
+        check=True,
+        capture_output=True,
+        text=True
+    )
+
+    frames = []
+    for line in result.stdout.splitlines():
+        match = GPHOTO2_FILE_LINE.match(line.strip())
+        if not match:
+            continue
+        number, name, mtime = match.groups()
+        frames.append({
+            'port': port,
+            'number': int(number),
+            'name': name,
+            'file_name': f"{port_dirname(port)}/{name}",
+            'captured_at': float(mtime) if mtime else None,
+        })
+    return spread_whole_seconds(frames)
+
+
+def download_port_frames(port: str, staging_dir: str, ext: str = 'jpg', numbers: List[int] = None):
+    """
+    pull files off the camera at port into staging_dir, every file or only the given
+    gphoto2 file numbers (see list_port_frames)
+
+    :return: dict with the port, downloaded filepaths, bytes, seconds and MB/s
+    """
+    os.makedirs(staging_dir, exist_ok=True)
+
+    if numbers is None:
+        get_files = ['--get-all-files']
+    elif numbers:
+        get_files = ['--get-file', number_ranges(numbers)]
+    else:
+        get_files = []
+
+    start = time.monotonic()
+    if get_files:
+        subprocess.run(
+            ['gphoto2', '--port', port] + get_files + ['--skip-existing', '--filename', '%f.%C'],
+            cwd=staging_dir,
+            check=True,
+            stdout=subprocess.DEVNULL
+        )
+    seconds = time.monotonic() - start
+
+    filepaths = [os.path.join(staging_dir, f) for f in os.listdir(staging_dir) if f.lower().endswith(ext)]
+    n_bytes = sum(os.path.getsize(f) for f in filepaths)
+
+    return {
+        'port': port,
+        'filepaths': filepaths,
+        'bytes': n_bytes,
+        'seconds': seconds,
+        'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+    }
+
+
+def gphoto2_config_args(cam_settings):
+    """
+    --set-config arguments for parsed gphoto settings, a dict of name -> value or a list of
+    name=value strings / (name, value) pairs
+
+    :return: list of gphoto2 arguments
+    """
+    items = cam_settings.items() if isinstance(cam_settings, dict) else cam_settings
+    args = []
+    for item in items:
+        if isinstance(item, str):
+            args += [item] if item.startswith('-') else ['--set-config', item]
+        else:
+            name, value = item
+            args += ['--set-config', f"{name}={value}"]
+    return args
+
+
+def set_port_config(port: str, cam_settings):
+    """
+    push settings to the camera at port, without re-detecting ports
+    """
+    args = gphoto2_config_args(cam_settings=cam_settings)
+    if args:
+        subprocess.run(
+            ['gphoto2', '--port', port] + args,
+            check=True,
+            stdout=subprocess.DEVNULL
+        )
+
+
+def clear_port_frames(port: str):
+    subprocess.run(
+        ['gphoto2', '--port', port, '--delete-all-files', '--recurse'],
+        check=True,
+        stdout=subprocess.DEVNULL
+    )
+
+
+def list_frames(
+        cam_ports: List[str],
+        concurrent: bool = True,
+        list_files=list_port_frames
+):
+    """
+    :param list_files: per port list function, swapped out by the sim backend
+    :return: listings of every camera in one list
+    """
+    n_workers = max(len(cam_ports), 1) if concurrent else 1
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        listings = list(pool.map(lambda port: list_files(port=port), cam_ports))
+    return [frame for listing in listings for frame in listing]
+
+
+def download_frames(
+        cam_ports: List[str],
+        staging_root: str,
+        concurrent: bool = True,
+        clear_after: bool = True,
+        download=download_port_frames,
+        clear=clear_port_frames,
+        select: dict = None
+):
+    """
+    drain every camera into its own staging dir under staging_root. when concurrent there is
+    one worker thread per camera so step time is bounded by the slowest camera instead of the sum.
+    with select only the listed file numbers are pulled, clear_after still wipes everything
+
+    :param download: per port download function, swapped out by the sim backend
+    :param clear: per port clear function, swapped out by the sim backend
+    :param select: dict of port -> gphoto2 file numbers to download
+    :return: (all downloaded filepaths, list of per camera stats from download)
+    """
+    def download_port(port):
+        staging_dir = os.path.join(staging_root, port_dirname(port))
+        if select is None:
+            return download(port=port, staging_dir=staging_dir)
+        return download(port=port, staging_dir=staging_dir, numbers=select.get(port, []))
+
+    n_workers = max(len(cam_ports), 1) if concurrent else 1
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        stats = list(pool.map(download_port, cam_ports))
+
+        if clear_after:
+            list(pool.map(clear, cam_ports))
+
+    for stat in stats:
+        logging.info(f"Camera @ {stat.get('port')}: {len(stat.get('filepaths'))} frames, "
+                     f"{stat.get('bytes') / 1e6:.1f} MB in {stat.get('seconds'):.1f} s ({stat.get('mb_per_s'):.1f} MB/s)")
+
+    filepaths = [f for stat in stats for f in stat.get('filepaths')]
+    return filepaths, stats
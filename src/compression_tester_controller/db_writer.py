@@ -0,0 +1,120 @@
+import logging
+import queue
+import threading
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+class DBWriter:
+    """
+    takes database writes off the control loop. writes are callables run as
+    write(session) on a background thread with its own session, in the order they
+    were submitted. whatever is queued when the thread wakes up is committed as one
+    batch, so a slow database just means bigger batches rather than a stalled rig.
+    flush() is the barrier, it blocks until everything submitted before it is committed.
+    writes that fail are kept in errors and logged at the next flush() and at close(),
+    check() raises if there were any
+
+    :param Session: session factory, the writer thread gets its own session
+    :param batch_size: max writes per commit
+    """
+
+    def __init__(self, Session, batch_size: int = 64):
+        self.Session = Session
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.errors = []
+        self.n_reported = 0
+        self.n_commits = 0
+        self.n_writes = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, write):
+        """
+        :param write: callable taking the writer's session, must not commit itself
+        """
+        self.queue.put(write)
+
+    def flush(self, timeout: float = None):
+        """
+        block until every write submitted so far is committed (or has failed)
+
+        :return: True if the barrier was reached within timeout
+        """
+        barrier = threading.Event()
+        self.queue.put(barrier)
+        reached = barrier.wait(timeout)
+        self.report_errors()
+        return reached
+
+    def report_errors(self):
+        """
+        log writes that failed since the last report
+        """
+        new_errors = self.errors[self.n_reported:]
+        self.n_reported += len(new_errors)
+        if new_errors:
+            logging.info(f"{len(new_errors)} DB write(s) failed: {[str(e) for write, e in new_errors]}")
+        return new_errors
+
+    def check(self):
+        """
+        raise if any write failed since the writer started, for the end of a trial
+        """
+        if self.errors:
+            raise RuntimeError(f"{len(self.errors)} DB write(s) failed: {[str(e) for write, e in self.errors]}")
+
+    def _run(self):
+        session = self.Session()
+        closing = False
+        while not closing:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            writes = [item for item in batch if callable(item)]
+            barriers = [item for item in batch if isinstance(item, threading.Event)]
+            closing = any(item is None for item in batch)
+
+            if writes:
+                self._commit(session=session, writes=writes)
+            for barrier in barriers:
+                barrier.set()
+
+        session.close()
+
+    def _commit(self, session, writes):
+        try:
+            for write in writes:
+                write(session)
+            session.commit()
+            self.n_commits += 1
+            self.n_writes += len(writes)
+            return
+        except Exception as e:
+            logging.info(f"Batch of {len(writes)} writes failed ({e}), retrying one at a time.")
+            session.rollback()
+
+        # dont let one bad record take the rest of the batch with it
+        for write in writes:
+            try:
+                write(session)
+                session.commit()
+                self.n_commits += 1
+                self.n_writes += 1
+            except Exception as e:
+                logging.exception(f"DB write failed: {e}")
+                session.rollback()
+                self.errors.append((write, e))
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+        logging.info(f"DB writer closed: {self.n_writes} writes in {self.n_commits} commits")
+        self.report_errors()
@@ -0,0 +1,101 @@
+import logging
+import random
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+def pick_frames(
+        frames,
+        desired_size: int,
+        stepper_freq: float,
+        angular_decimation: bool = False,
+):
+    """
+    decimation is done per camera (frames grouped by port) so every camera keeps an even
+    share and its own angular coverage, frames without a port are treated as one camera
+
+    :param frames: dicts with file_name, port and captured_at, spool manifest entries or camera listings
+    :return: file names of the frames to keep
+    """
+    file_names = [frame.get('file_name') for frame in frames]
+    if len(file_names) <= desired_size:
+        return file_names
+
+    by_port = dict()
+    for frame in frames:
+        by_port.setdefault(frame.get('port'), []).append(frame)
+
+    keep = []
+    quotas = camera_quotas(counts={port: len(port_frames) for port, port_frames in by_port.items()}, desired_size=desired_size)
+    for port, port_frames in by_port.items():
+        quota = quotas.get(port)
+        if quota == 0:
+            continue
+        if angular_decimation and all(frame.get('captured_at') is not None for frame in port_frames):
+            keep += decimate_frames_by_angle(frames=port_frames, desired_size=quota, stepper_freq=stepper_freq)
+        else:
+            keep += random.sample([frame.get('file_name') for frame in port_frames], quota)
+    return keep
+
+
+def camera_quotas(counts: dict, desired_size: int):
+    """
+    split desired_size frames across cameras as evenly as their frame counts allow,
+    a camera short of its share hands the rest to the others
+
+    :param counts: port -> number of frames the camera has
+    :return: port -> number of frames to keep
+    """
+    quotas = {port: 0 for port in counts}
+    remaining = min(desired_size, sum(counts.values()))
+    while remaining > 0:
+        open_ports = sorted((port for port in counts if quotas.get(port) < counts.get(port)), key=str)
+        for port in open_ports[:remaining]:
+            quotas[port] += 1
+        remaining -= min(len(open_ports), remaining)
+    return quotas
+
+
+def decimate_frames_by_angle(
+        frames,
+        desired_size: int,
+        stepper_freq: float,
+        steps_per_rotation: int = 54600,
+):
+    """
+    pick frames evenly spaced in turntable angle. capture times are mapped to angle using
+    the camera stepper frequency, the turn is split into desired_size equal sectors and the
+    frame closest to each sector centre is kept, single pass so O(n). sectors with no frame
+    (camera stalled) are topped up from the leftovers so the count still matches
+
+    :param frames: spool manifest entries, need file_name and captured_at
+    :return: file names to keep
+    """
+    if len(frames) <= desired_size:
+        return [frame.get('file_name') for frame in frames]
+
+    t0 = min(frame.get('captured_at') for frame in frames)
+    degs_per_second = stepper_freq / steps_per_rotation * 360
+    sector = 360 / desired_size
+
+    best = [None] * desired_size
+    best_err = [None] * desired_size
+    for frame in frames:
+        angle = ((frame.get('captured_at') - t0) * degs_per_second) % 360
+        idx = int(angle // sector) % desired_size
+        err = abs(angle - (idx + 0.5) * sector)
+        if best[idx] is None or err < best_err[idx]:
+            best[idx] = frame.get('file_name')
+            best_err[idx] = err
+
+    keep = [file_name for file_name in best if file_name]
+    n_missing = desired_size - len(keep)
+    if n_missing > 0:
+        logging.info(f"{n_missing} empty angular sectors, topping up from remaining frames.")
+        kept = set(keep)
+        leftovers = [frame.get('file_name') for frame in frames if frame.get('file_name') not in kept]
+        stride = len(leftovers) / n_missing
+        keep += [leftovers[int(i * stride)] for i in range(n_missing)]
+
+    return keep
@@ -7,6 +7,9 @@ import os
 
 from typing import List
 
+from multilink import get_transport, link_up
+from local_transport import LocalTransport
+
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
 
@@ -21,6 +24,9 @@ def transfer_files(
         remove_after=False
 ):
     """
+    one scp per file
+
+    :return: filepaths that were transferred
 
     :param file_list:
     :param dest_machine_addr:
@@ -28,19 +34,20 @@ def transfer_files(
     :param dest_machine_user:
     :param interfaces: order by priority
     :param remove_after:
-    :return:
     """
 
     use_interface = None
     for interface in interfaces:
-        if os.system(f"ip link show {interface}") == 0:
+        if link_up(interface):
             use_interface = interface
+            break
 
     if not use_interface:
         logging.info("No connection found in interfaces")
 
     # Replace these with actual destination machine details
     dest_machine = f"{dest_machine_user}@{dest_machine_addr}"
+    transferred = []
     for file in file_list:
         # Constructing the SCP command
         scp_command = f"sshpass -p {dest_pass} " \
@@ -49,6 +56,7 @@ def transfer_files(
         try:
             subprocess.run(scp_command, check=True, shell=True)
             print(f"Transferred {file}:{dest_machine_dir} successfully.")
+            transferred.append(file)
 
             # Optionally remove the file after transfer
             if remove_after:
@@ -57,7 +65,38 @@ def transfer_files(
         except subprocess.CalledProcessError as e:
             print(f"Error in transferring {file}: {e}")
 
-    pass
+    return transferred
+
+
+def upload_interfaces():
+    """
+    interfaces the pi may upload over in priority order, UPLOAD_INTERFACES in .env
+    (comma separated, i.e. eth0,wlan0), eth0 if unset
+    """
+    return [interface.strip() for interface in os.environ.get('UPLOAD_INTERFACES', 'eth0').split(',') if interface.strip()]
+
+
+def get_transfer_backend(
+        dest_machine_addr: str,
+        dest_machine_user: str,
+        dest_pass: str,
+        interfaces: List[str],
+        n_channels: int = 4
+):
+    """
+    TRANSFER_BACKEND=local in the environment swaps the nas for a LocalTransport under
+    LOCAL_TRANSFER_ROOT (default local_nas), anything else is the ssh transport
+    """
+    if os.environ.get('TRANSFER_BACKEND') == 'local':
+        return LocalTransport(root=os.environ.get('LOCAL_TRANSFER_ROOT', 'local_nas'), n_channels=n_channels)
+
+    return get_transport(
+        hostname=dest_machine_addr,
+        username=dest_machine_user,
+        password=dest_pass,
+        interfaces=interfaces,
+        n_channels=n_channels
+    )
 
 
 def bash_to_windows_paths(bash_paths, bash_machine_ip):
@@ -77,10 +116,67 @@ def move_trial_assets(
         interfaces,
         dest_asset_dir: str,
         dest_machine_user: str = 'domanlab',
-        dest_machine_addr: str = '192.168.1.3'):
+        dest_machine_addr: str = '192.168.1.3',
+        transport: str = 'sftp',
+        n_channels: int = 4,
+        checksums: dict = None):
+    """
+    upload files to dest_asset_dir on the db machine and remove them locally. the default
+    sftp transport reuses a pooled set of sessions (see sftp_transport.SFTPPool), striped over
+    every healthy interface when more than one is given (see multilink.StripedTransport), transport='tar'
+    streams everything as one tar over one of those sessions (for batches of small frames),
+    transport='scp' is the old one scp per file path. the sftp and tar transports can be pointed
+    at a local dir with TRANSFER_BACKEND=local (see get_transfer_backend). the tar transport always
+    checks the unpacked files on the host. with checksums (file name -> sha256) the sftp and
+    tar transports check every file on the host, skip files already there, resume partial
+    ones and retry (see SFTPPool.put_verified). only confirmed files are removed
+
+    :return: transfer stats, confirmed holds the filepaths known to be on the host
+    """
 
     dest_pass = os.environ.get('DOMANLAB_PASS')
 
+    if transport in ['sftp', 'tar']:
+        pool = get_transfer_backend(
+            dest_machine_addr=dest_machine_addr,
+            dest_machine_user=dest_machine_user,
+            dest_pass=dest_pass,
+            interfaces=interfaces,
+            n_channels=n_channels
+        )
+        if transport == 'tar':
+            tar_stats = pool.put_tar(
+                filepaths=absolute_asset_filepaths,
+                remote_dir=dest_asset_dir,
+                remove_after=True,
+                checksums=checksums
+            )
+            if not checksums or not tar_stats.get('failed'):
+                return tar_stats
+
+            # the tar is checked on the host already, only re-send what didnt make it
+            stats = pool.put_verified(
+                filepaths=tar_stats.get('failed'),
+                checksums=checksums,
+                remote_dir=dest_asset_dir,
+                remove_after=True
+            )
+            stats['confirmed'] = tar_stats.get('confirmed') + stats.get('confirmed')
+            return stats
+
+        if checksums:
+            return pool.put_verified(
+                filepaths=absolute_asset_filepaths,
+                checksums=checksums,
+                remote_dir=dest_asset_dir,
+                remove_after=True
+            )
+        return pool.put_files(
+            filepaths=absolute_asset_filepaths,
+            remote_dir=dest_asset_dir,
+            remove_after=True
+        )
+
     check_and_create_directory(
         hostname=dest_machine_addr,
         port=22,
@@ -89,7 +185,7 @@ def move_trial_assets(
         directory=dest_asset_dir
     )
 
-    transfer_files(
+    transferred = transfer_files(
         file_list=absolute_asset_filepaths,
         dest_machine_dir=dest_asset_dir,
         dest_machine_user=dest_machine_user,
@@ -99,7 +195,10 @@ def move_trial_assets(
         remove_after=True
     )
 
-    pass
+    return {
+        'confirmed': transferred,
+        'failed': [filepath for filepath in absolute_asset_filepaths if filepath not in transferred],
+    }
 
 
 def move_file(source, destination):
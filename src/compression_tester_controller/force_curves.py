@@ -0,0 +1,142 @@
+import glob
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+FORCE_CURVE_COLUMNS = ['t', 'counts', 'force', 'strain']
+
+
+def force_curve_filename(trial_name: str):
+    return f"{trial_name}_force_curve.npz"
+
+
+class ForceCurveWriter:
+    """
+    appendable columnar store for a continuous force trial. appends are buffered in memory
+    and written as an npz chunk every flush_s seconds or flush_rows rows, so the sd card sees
+    a handful of files per trial and a crash mid-trial loses at most the last flush_s.
+    finalize() merges the chunks into a single npz named after the trial
+
+    chunks left in chunk_dir by an earlier run that never finalized would be merged into
+    this curve, so they are refused unless overwrite is set (which deletes them)
+
+    :param trial_name: CompressionTrial.name, the curve file is keyed on it
+    :param curve_dir: local directory for the chunks and the merged file
+    :param meta: scalars stored alongside the columns (force_zero, sample height etc.)
+    """
+
+    def __init__(
+            self,
+            trial_name: str,
+            curve_dir: str = 'force_curves',
+            meta: dict = None,
+            flush_s: float = 5.0,
+            flush_rows: int = 5000,
+            overwrite: bool = False,
+    ):
+        self.trial_name = trial_name
+        self.curve_dir = curve_dir
+        self.chunk_dir = os.path.join(curve_dir, f"{trial_name}_chunks")
+        self.meta = meta if meta else {}
+        self.flush_s = flush_s
+        self.flush_rows = flush_rows
+        self.n_chunks = 0
+        self.n_rows = 0
+
+        self.buffer = {key: [] for key in FORCE_CURVE_COLUMNS}
+        self.n_buffered = 0
+        self.last_flush = time.monotonic()
+
+        stale_chunks = sorted(glob.glob(os.path.join(self.chunk_dir, '*.npz')))
+        if stale_chunks:
+            if not overwrite:
+                raise FileExistsError(f"{self.chunk_dir} holds {len(stale_chunks)} chunks from an earlier run of "
+                                      f"{trial_name}, move them away or pass overwrite=True to delete them")
+            logging.info(f"Deleting {len(stale_chunks)} stale force curve chunks in {self.chunk_dir}")
+            for chunk_path in stale_chunks:
+                os.remove(chunk_path)
+        os.makedirs(self.chunk_dir, exist_ok=True)
+
+    @property
+    def filepath(self):
+        return os.path.join(self.curve_dir, force_curve_filename(self.trial_name))
+
+    def append(self, **columns):
+        n = len(columns.get('t', []))
+        if n > 0:
+            for key in FORCE_CURVE_COLUMNS:
+                self.buffer[key].append(np.asarray(columns.get(key)))
+            self.n_buffered += n
+            self.n_rows += n
+
+        if self.n_buffered >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_s:
+            self.flush()
+
+    def flush(self):
+        """
+        write the buffered rows as one chunk
+        """
+        self.last_flush = time.monotonic()
+        if self.n_buffered == 0:
+            return
+
+        chunk_path = os.path.join(self.chunk_dir, f"{self.n_chunks:06d}.npz")
+        np.savez(chunk_path, **{key: np.concatenate(self.buffer.get(key)) for key in FORCE_CURVE_COLUMNS})
+        self.n_chunks += 1
+        self.buffer = {key: [] for key in FORCE_CURVE_COLUMNS}
+        self.n_buffered = 0
+
+    def finalize(self):
+        """
+        merge chunks into the trial npz and remove the chunk dir
+        :return: path of the merged file
+        """
+        self.flush()
+        chunk_paths = sorted(glob.glob(os.path.join(self.chunk_dir, '*.npz')))
+        merged = {key: [] for key in FORCE_CURVE_COLUMNS}
+        for chunk_path in chunk_paths:
+            with np.load(chunk_path) as chunk:
+                for key in FORCE_CURVE_COLUMNS:
+                    merged[key].append(chunk[key])
+
+        merged = {key: np.concatenate(val) if val else np.array([]) for key, val in merged.items()}
+        meta = {f"meta_{key}": np.asarray(val) for key, val in self.meta.items()}
+        np.savez_compressed(self.filepath, **merged, **meta)
+
+        for chunk_path in chunk_paths:
+            os.remove(chunk_path)
+        os.rmdir(self.chunk_dir)
+
+        logging.info(f"Force curve written: {self.filepath} ({self.n_rows} rows)")
+        return self.filepath
+
+
+def load_force_curve(filepath: str):
+    """
+    read a force curve written by ForceCurveWriter
+
+    :return: (DataFrame with t, counts, force, strain columns, dict of meta scalars)
+    """
+    with np.load(filepath) as data:
+        df = pd.DataFrame({key: data[key] for key in FORCE_CURVE_COLUMNS})
+        meta = {key[len('meta_'):]: data[key].item() for key in data.files if key.startswith('meta_')}
+    return df, meta
+
+
+def load_trial_force_curve(trial_name: str, base_path: str):
+    """
+    :param base_path: dir holding the trial folders i.e. postgres_data on the NAS
+    :return: (df, meta) or (None, None) if the trial has no force curve
+    """
+    filepath = os.path.join(base_path, trial_name, force_curve_filename(trial_name))
+    if not os.path.exists(filepath):
+        logging.info(f"No force curve found @ {filepath}")
+        return None, None
+
+    return load_force_curve(filepath)
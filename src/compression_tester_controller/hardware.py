@@ -0,0 +1,25 @@
+import logging
+import os
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+from dotenv import load_dotenv
+from os.path import join, dirname
+
+dotenv_path = join(dirname(__file__), '.env')
+load_dotenv(dotenv_path)
+
+# COMPRESSION_TESTER_BACKEND=sim swaps the rig for sim_components so trials run on any linux box
+BACKEND = os.environ.get('COMPRESSION_TESTER_BACKEND', 'rig')
+
+if BACKEND == 'sim':
+    logging.info("Using simulated hardware backend.")
+    from sim_components import sys_init, platon_setup, init_cameras, home_camera_system, capture_step_frames, camera_system_setup, clear_cam_frames, transfer_step_frames
+    from sim_components import sample_force_sensor, get_a201_Rf, move_stepper_PID_target
+    from sim_components import download_port_frames, clear_port_frames, list_port_frames, set_port_config, gphoto2_get_active_ports, gpohoto2_get_camera_settings
+else:
+    from compression_tester_controls.sys_protocols import sys_init, platon_setup, init_cameras, home_camera_system, capture_step_frames, camera_system_setup, clear_cam_frames, transfer_step_frames
+    from compression_tester_controls.sys_functions import sample_force_sensor, get_a201_Rf, move_stepper_PID_target
+    from compression_tester_controls.components.canon_eosr50 import gphoto2_get_active_ports, gpohoto2_get_camera_settings
+    from camera_transfer import download_port_frames, clear_port_frames, list_port_frames, set_port_config
@@ -0,0 +1,110 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+from spool import file_sha256
+from transport import Transport, write_tar
+
+
+class LocalTransport(Transport):
+    """
+    stand in for the nas that writes under a local root dir instead, selected with
+    TRANSFER_BACKEND=local (see file_management.get_transfer_backend). remote dirs are
+    mapped to root + remote_dir so trials and benchmarks run without the pi or the nas.
+    the batch uploads (put_files, put_verified, put_tar) are the Transport ones, only the
+    host side is swapped. for a loopback ssh measurement keep the default backend and
+    point it at 127.0.0.1
+
+    :param root: local dir standing in for / on the host
+    :param n_channels: parallel copies
+    """
+
+    def __init__(self, root: str = 'local_nas', n_channels: int = 4):
+        super().__init__(hostname='local', n_channels=n_channels)
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def local_path(self, remote_path: str):
+        return os.path.join(self.root, remote_path.lstrip('/'))
+
+    def exec(self, command: str):
+        result = subprocess.run(command, shell=True, cwd=self.root, capture_output=True, text=True)
+        return result.returncode, result.stdout, result.stderr
+
+    def makedirs(self, remote_dir: str):
+        if remote_dir in self.known_dirs:
+            return
+        os.makedirs(self.local_path(remote_dir), exist_ok=True)
+        with self._lock:
+            self.known_dirs.add(remote_dir)
+
+    def put(self, filepath: str, remote_dir: str):
+        start = time.monotonic()
+        shutil.copyfile(filepath, os.path.join(self.local_path(remote_dir), os.path.basename(filepath)))
+        seconds = time.monotonic() - start
+
+        n_bytes = os.path.getsize(filepath)
+        return {
+            'file': filepath,
+            'bytes': n_bytes,
+            'seconds': seconds,
+            'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+        }
+
+    def resume_put(self, filepath: str, remote_dir: str, chunk_size: int = 2 ** 15):
+        dest = os.path.join(self.local_path(remote_dir), os.path.basename(filepath))
+        local_size = os.path.getsize(filepath)
+        offset = os.path.getsize(dest) if os.path.exists(dest) else 0
+        if offset >= local_size:
+            offset = 0
+
+        start = time.monotonic()
+        with open(filepath, 'rb') as f, open(dest, 'ab' if offset else 'wb') as remote:
+            f.seek(offset)
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                remote.write(chunk)
+        seconds = time.monotonic() - start
+
+        n_bytes = local_size - offset
+        return {
+            'file': filepath,
+            'bytes': n_bytes,
+            'resumed_from': offset,
+            'seconds': seconds,
+            'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+        }
+
+    def verify_remote(self, remote_dir: str, expected: dict):
+        verified = set()
+        mismatched = set()
+        for name, (sha256, size) in expected.items():
+            dest = os.path.join(self.local_path(remote_dir), name)
+            if not os.path.exists(dest):
+                continue
+            if file_sha256(dest) == sha256:
+                verified.add(name)
+            else:
+                mismatched.add(name)
+        return verified, mismatched
+
+    def stream_tar(self, members: dict, remote_dir: str):
+        """
+        the stream goes into a local tar -x
+        """
+        dest_dir = self.local_path(remote_dir)
+        os.makedirs(dest_dir, exist_ok=True)
+        # stderr goes to a file so a long complaint cant fill a pipe while we are still writing
+        with tempfile.TemporaryFile() as err:
+            proc = subprocess.Popen(['tar', '-xf', '-', '-C', dest_dir], stdin=subprocess.PIPE, stderr=err)
+            write_tar(fileobj=proc.stdin, members=members)
+            proc.stdin.close()
+            exit_status = proc.wait()
+            err.seek(0)
+            stderr = err.read().decode()
+        return exit_status, stderr
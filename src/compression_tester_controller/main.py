@@ -182,7 +182,8 @@ if __name__ == '__main__':
     #             make_full_ply=True,
     #             make_processed_ply=True,
     #             make_raw_stl=True, 
-    #             make_processed_stl=True
+    #             make_processed_stl=True,
+    #             skip_step_ids=[627, 629, 630, 604, 623, 610, 615, 643, 645, 646]
     #         )
 
     # determine_plane_colors(
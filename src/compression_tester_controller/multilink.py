@@ -0,0 +1,345 @@
+import fcntl
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+from typing import List
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+from sftp_transport import SFTPPool, get_pool
+from transport import Transport
+
+SIOCGIFADDR = 0x8915
+
+
+def link_up(interface: str):
+    """
+    true if the kernel reports the interface as up with a carrier, a plugged in but dead
+    link or a missing interface is false
+    """
+    try:
+        with open(f'/sys/class/net/{interface}/operstate', 'r') as f:
+            operstate = f.read().strip()
+        with open(f'/sys/class/net/{interface}/carrier', 'r') as f:
+            carrier = f.read().strip()
+    except OSError:
+        return False
+    return operstate in ['up', 'unknown'] and carrier == '1'
+
+
+def interface_ipv4(interface: str):
+    """
+    :return: the interface's ipv4 address or None
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            packed = fcntl.ioctl(s.fileno(), SIOCGIFADDR, struct.pack('256s', interface[:15].encode()))
+        except OSError:
+            return None
+    return socket.inet_ntoa(packed[20:24])
+
+
+def probe_bandwidth(pool: SFTPPool, probe_bytes: int = 2 ** 22):
+    """
+    push probe_bytes through one of the pool's sessions into cat > /dev/null on the host
+
+    :return: MB/s
+    """
+    chunk = os.urandom(2 ** 16)
+    with pool.session() as sftp:
+        channel = sftp.get_channel().get_transport().open_session()
+        try:
+            start = time.monotonic()
+            channel.exec_command('cat > /dev/null')
+            sent = 0
+            while sent < probe_bytes:
+                channel.sendall(chunk)
+                sent += len(chunk)
+            channel.shutdown_write()
+            channel.recv_exit_status()
+            seconds = time.monotonic() - start
+        finally:
+            channel.close()
+    return (sent / 1e6) / seconds if seconds > 0 else 0.0
+
+
+class StripedTransport(Transport):
+    """
+    Transport over several interfaces at once. each interface gets its own SFTPPool bound to
+    its address, links are only used while /sys reports them up and their measured throughput
+    is over min_mb_per_s. files are taken off one shared queue by every link's sessions so
+    faster links end up carrying more, and a link that drops mid batch hands its file back to
+    the queue for the others. single session work (mkdir, verification, tar) goes over the
+    fastest link
+
+    a link's throughput comes from the files it actually carried, the probe (see
+    probe_bandwidth) only runs for a link that is new, came back up or has carried nothing
+    for probe_interval_s. self.links is shared by every uploading thread, it is only
+    touched under _links_lock, probes run outside it
+
+    :param interfaces: candidate interfaces, i.e. ['eth0', 'wlan0']
+    :param n_channels: sessions on the fastest link, slower links get proportionally fewer
+    :param min_mb_per_s: links slower than this are left out
+    :param probe_interval_s: how long a throughput measurement is trusted
+    :param min_measure_bytes: a link has to carry this much in a batch to update its throughput
+    """
+
+    def __init__(
+            self,
+            hostname: str,
+            username: str,
+            password: str,
+            interfaces: List[str],
+            port: int = 22,
+            n_channels: int = 4,
+            min_mb_per_s: float = 0.5,
+            probe_interval_s: float = 300,
+            min_measure_bytes: int = 2 ** 22,
+    ):
+        super().__init__(hostname=hostname, n_channels=n_channels)
+        self.username = username
+        self.password = password
+        self.port = port
+        self.interfaces = interfaces
+        self.min_mb_per_s = min_mb_per_s
+        self.probe_interval_s = probe_interval_s
+        self.min_measure_bytes = min_measure_bytes
+
+        self.links = {}  # interface -> dict(pool, mb_per_s, probed_at)
+        self._probing = set()  # interfaces a refresh is probing right now
+        self._links_lock = threading.Lock()
+
+    def refresh(self):
+        """
+        re-check link state, probe links that are new or havent been measured for
+        probe_interval_s. the probes run outside _links_lock so uploaders calling this mid
+        batch arent held up behind one, a link another caller is already probing is skipped
+
+        :return: healthy links, fastest first, as (interface, pool, n_channels)
+        """
+        to_probe = []
+        with self._links_lock:
+            now = time.monotonic()
+            for interface in self.interfaces:
+                ip = interface_ipv4(interface) if link_up(interface) else None
+                link = self.links.get(interface)
+                if not ip:
+                    if link and link.get('mb_per_s'):
+                        logging.info(f"Link {interface} is down.")
+                    self.links[interface] = {'pool': None, 'mb_per_s': 0.0, 'probed_at': now}
+                    continue
+
+                if interface in self._probing:
+                    continue
+                if link and link.get('pool') and link.get('pool').source_ip == ip and now - link.get('probed_at') < self.probe_interval_s:
+                    continue
+                self._probing.add(interface)
+                to_probe.append((interface, ip))
+
+        probed = {}
+        for interface, ip in to_probe:
+            pool = get_pool(
+                hostname=self.hostname,
+                username=self.username,
+                password=self.password,
+                port=self.port,
+                n_channels=self.n_channels,
+                source_ip=ip
+            )
+            try:
+                mb_per_s = probe_bandwidth(pool=pool)
+            except Exception as e:
+                logging.info(f"Bandwidth probe over {interface} ({ip}) failed: {e}")
+                mb_per_s = 0.0
+            logging.info(f"Link {interface} ({ip}): {mb_per_s:.1f} MB/s")
+            probed[interface] = {'pool': pool, 'mb_per_s': mb_per_s, 'probed_at': time.monotonic()}
+
+        with self._links_lock:
+            for interface, ip in to_probe:
+                self._probing.discard(interface)
+            self.links.update(probed)
+            healthy = [(interface, link) for interface, link in self.links.items()
+                       if link.get('pool') and link.get('mb_per_s') >= self.min_mb_per_s]
+        healthy.sort(key=lambda item: item[1].get('mb_per_s'), reverse=True)
+        if not healthy:
+            return []
+
+        fastest = healthy[0][1].get('mb_per_s')
+        return [
+            (interface, link.get('pool'), max(1, int(round(self.n_channels * link.get('mb_per_s') / fastest))))
+            for interface, link in healthy
+        ]
+
+    def drop(self, interface: str):
+        with self._links_lock:
+            self.links[interface] = {'pool': None, 'mb_per_s': 0.0, 'probed_at': time.monotonic()}
+
+    def measured(self, interface: str, n_bytes: int, seconds: float):
+        """
+        take a link's throughput from a batch it carried, resets its probe clock
+        """
+        if n_bytes < self.min_measure_bytes or seconds <= 0:
+            return
+        with self._links_lock:
+            link = self.links.get(interface)
+            if link and link.get('pool'):
+                link['mb_per_s'] = (n_bytes / 1e6) / seconds
+                link['probed_at'] = time.monotonic()
+
+    def primary(self):
+        """
+        :return: the pool of the fastest healthy link
+        """
+        links = self.refresh()
+        if not links:
+            raise ConnectionError(f"No healthy link to {self.hostname} out of {self.interfaces}")
+        return links[0][1]
+
+    def makedirs(self, remote_dir: str):
+        self.primary().makedirs(remote_dir)
+
+    def put(self, filepath: str, remote_dir: str):
+        return self.primary().put(filepath=filepath, remote_dir=remote_dir)
+
+    def resume_put(self, filepath: str, remote_dir: str):
+        return self.primary().resume_put(filepath=filepath, remote_dir=remote_dir)
+
+    def exec(self, command: str):
+        return self.primary().exec(command)
+
+    def verify_remote(self, remote_dir: str, expected: dict):
+        return self.primary().verify_remote(remote_dir=remote_dir, expected=expected)
+
+    def stream_tar(self, members: dict, remote_dir: str):
+        return self.primary().stream_tar(members=members, remote_dir=remote_dir)
+
+    def put_many(self, filepaths: List[str], remote_dir: str, resume: bool = False):
+        """
+        stripe filepaths over every healthy link, failing over when a link drops. each
+        link's throughput over the batch is kept as its measurement (see measured)
+
+        :return: per file stats in the order of filepaths (with the interface used), None where
+                 the upload failed on every link
+        """
+        results = [None] * len(filepaths)
+        work = queue.Queue()
+        for idx, filepath in enumerate(filepaths):
+            work.put((idx, filepath))
+        attempts = [0] * len(filepaths)
+        spans = {}  # interface -> [first thread start, last thread end]
+        spans_lock = threading.Lock()
+
+        def run_link(interface, pool):
+            put = pool.resume_put if resume else pool.put
+            start = time.monotonic()
+            try:
+                while True:
+                    try:
+                        idx, filepath = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        stat = put(filepath=filepath, remote_dir=remote_dir)
+                        stat['interface'] = interface
+                        results[idx] = stat
+                    except Exception as e:
+                        if not link_up(interface):
+                            logging.info(f"Link {interface} dropped, failing over: {e}")
+                            self.drop(interface)
+                            work.put((idx, filepath))
+                            return
+                        attempts[idx] += 1
+                        logging.info(f"Error in transferring {filepath} over {interface}: {e}")
+                        if attempts[idx] < 2:
+                            work.put((idx, filepath))
+            finally:
+                end = time.monotonic()
+                with spans_lock:
+                    span = spans.setdefault(interface, [start, end])
+                    span[0] = min(span[0], start)
+                    span[1] = max(span[1], end)
+
+        # another round if a link dropped after the others ran out of work
+        while not work.empty():
+            links = self.refresh()
+            if not links:
+                logging.info(f"No healthy link to {self.hostname}, {work.qsize()} file(s) not sent.")
+                break
+
+            threads = [
+                threading.Thread(target=run_link, args=(interface, pool), daemon=True)
+                for interface, pool, n_channels in links for i in range(n_channels)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        per_link = {}
+        link_bytes = {}
+        for stat in results:
+            if stat:
+                interface = stat.get('interface')
+                per_link[interface] = per_link.get(interface, 0) + 1
+                link_bytes[interface] = link_bytes.get(interface, 0) + stat.get('bytes')
+        for interface, n_bytes in link_bytes.items():
+            start, end = spans.get(interface)
+            self.measured(interface=interface, n_bytes=n_bytes, seconds=end - start)
+        logging.info(f"Files per link: {per_link}")
+        return results
+
+    def close(self):
+        with self._links_lock:
+            self.links = {}
+        super().close()
+
+
+_TRANSPORTS = {}
+_TRANSPORTS_LOCK = threading.Lock()
+
+
+def get_transport(
+        hostname: str,
+        username: str,
+        password: str,
+        interfaces: List[str],
+        port: int = 22,
+        n_channels: int = 4
+):
+    """
+    process wide transport for a host. more than one interface gives a StripedTransport,
+    a single interface gives a pool bound to it (or the default route if it has no address)
+    """
+    if len(interfaces) > 1:
+        key = (hostname, port, username, tuple(interfaces))
+        with _TRANSPORTS_LOCK:
+            if key not in _TRANSPORTS:
+                _TRANSPORTS[key] = StripedTransport(
+                    hostname=hostname,
+                    username=username,
+                    password=password,
+                    interfaces=interfaces,
+                    port=port,
+                    n_channels=n_channels
+                )
+            return _TRANSPORTS[key]
+
+    source_ip = None
+    if interfaces:
+        source_ip = interface_ipv4(interfaces[0]) if link_up(interfaces[0]) else None
+        if not source_ip:
+            logging.info(f"{interfaces[0]} is not up, using the default route.")
+    return get_pool(
+        hostname=hostname,
+        username=username,
+        password=password,
+        port=port,
+        n_channels=n_channels,
+        source_ip=source_ip
+    )
@@ -0,0 +1,62 @@
+import logging
+import queue
+import threading
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+class StepFinisher:
+    """
+    runs the tail of each trial step (upload + Frame registration) on a background
+    thread so the next step can start compressing. jobs run one at a time in the
+    order they were submitted. submit() blocks once max_in_flight jobs are waiting,
+    which caps how many steps worth of frames sit on the pi at once
+
+    :param Session: session factory, the worker thread gets its own session
+    :param finish: callable run as finish(session=session, **job)
+    :param max_in_flight: max number of queued jobs
+    """
+
+    def __init__(self, Session, finish, max_in_flight: int = 2):
+        self.Session = Session
+        self.finish = finish
+        self.queue = queue.Queue(maxsize=max_in_flight)
+        self.errors = []
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, job: dict):
+        self.queue.put(job)
+
+    def _run(self):
+        session = self.Session()
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                break
+
+            try:
+                self.finish(session=session, **job)
+            except Exception as e:
+                logging.exception(f"Finishing step {job.get('step_id')} failed: {e}")
+                session.rollback()
+                self.errors.append((job, e))
+            finally:
+                self.queue.task_done()
+
+        session.close()
+
+    def join(self):
+        """
+        block until every submitted job is finished
+        """
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+        if self.errors:
+            logging.info(f"{len(self.errors)} step(s) failed to finish: {[job.get('step_id') for job, e in self.errors]}")
@@ -2,8 +2,15 @@ import logging
 import uuid
 import os
 import glob
+import json
+import time
+import traceback
+import multiprocessing
 import pymeshfix
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List
+
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
 
@@ -22,6 +29,9 @@ from pipelines import create_full_ply, process_full_ply, determine_plane_colors,
 from image_processing.utils import crop_image_by_color
 
 from file_management import move_trial_assets,  move_file, bash_to_windows_paths
+from spool import file_sha256
+from precrop import is_precropped
+from artifact_cache import ArtifactCache, artifact_key, settings_values
 
 dotenv_path = join(dirname(__file__), '.env')
 load_dotenv(dotenv_path)
@@ -44,6 +54,84 @@ def add_reconstruction_defaults(session):
     pass
 
 
+def crop_sidecar_path(dest_path: str):
+    return f"{os.path.splitext(dest_path)[0]}.json"
+
+
+def crop_frame_cached(source_path: str, dest_path: str, rgb_min, rgb_max):
+    """
+    crop_image_by_color with a json sidecar next to the crop recording the source's sha256
+    and the rgb bounds it was made with. the crop is only redone if either changed, the
+    source is only re-hashed if its size or mtime moved since the sidecar was written
+
+    :return: True if the frame was cropped, False if the existing crop was current
+    """
+    rgb_min = [float(value) for value in rgb_min]
+    rgb_max = [float(value) for value in rgb_max]
+    source_stat = os.stat(source_path)
+    sidecar_path = crop_sidecar_path(dest_path=dest_path)
+
+    sidecar = None
+    if os.path.exists(dest_path) and os.path.exists(sidecar_path):
+        try:
+            with open(sidecar_path, 'r') as f:
+                sidecar = json.load(f)
+        except (OSError, ValueError):
+            sidecar = None
+
+    source_sha256 = None
+    cropped = True
+    if sidecar and sidecar.get('rgb_min') == rgb_min and sidecar.get('rgb_max') == rgb_max:
+        if sidecar.get('source_size') == source_stat.st_size and sidecar.get('source_mtime_ns') == source_stat.st_mtime_ns:
+            return False
+        # touched but maybe not changed, i.e. copied back onto the nas
+        source_sha256 = file_sha256(source_path)
+        cropped = source_sha256 != sidecar.get('source_sha256')
+
+    if cropped:
+        crop_image_by_color(
+            source_path=source_path,
+            dest_path=dest_path,
+            rgb_max=np.array(rgb_max),
+            rgb_min=np.array(rgb_min)
+        )
+
+    tmp_path = f"{sidecar_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'source_sha256': source_sha256 if source_sha256 else file_sha256(source_path),
+            'source_size': source_stat.st_size,
+            'source_mtime_ns': source_stat.st_mtime_ns,
+            'rgb_min': rgb_min,
+            'rgb_max': rgb_max,
+        }, f, indent=1)
+    os.replace(tmp_path, sidecar_path)
+    return cropped
+
+
+def crop_frames(frame_paths, rgb_min, rgb_max, max_workers: int = 8):
+    """
+    crop frames to <name>_crop.<ext> on a thread pool (the work is nas io and numpy),
+    frames whose crop is current are skipped (see crop_frame_cached)
+
+    :return: cropped frame paths in the order of frame_paths
+    """
+    dest_paths = []
+    for frame_path in frame_paths:
+        s = frame_path.split(".")
+        dest_paths.append(f'{".".join(s[:-1])}_crop.{s[-1]}')
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        cropped = list(pool.map(
+            lambda paths: crop_frame_cached(source_path=paths[0], dest_path=paths[1], rgb_min=rgb_min, rgb_max=rgb_max),
+            zip(frame_paths, dest_paths)
+        ))
+    logging.info(f"Cropped {sum(cropped)} / {len(frame_paths)} frames in {time.monotonic() - start:.1f} s, "
+                 f"{len(frame_paths) - sum(cropped)} crops were current")
+    return dest_paths
+
+
 def get_full_ply(
         session,
         step,
@@ -51,9 +139,19 @@ def get_full_ply(
         metashape_ply_generation_settings_id: int,
         metashape_ply_export_settings_id: int,
         platon_side_color_setting_id: int,
-        make_full_ply: bool = True
+        make_full_ply: bool = True,
+        crop_workers: int = 8,
+        artifact_cache: ArtifactCache = None
 
 ):
+    """
+    :param crop_workers: threads for the frame cropping pass, see crop_frames
+    :param artifact_cache: reuse a point cloud made from the same cropped frames and settings values.
+                           on a hit the step gets a MetashapeProject row for the project the
+                           ply came from when that project is in this trial's dir. one made
+                           for another trial stays there and is only logged, the step then
+                           has a FullPointCloud but no MetashapeProject of its own
+    """
     full_point_cloud = None
 
     metashape_ply_gen_options = session.query(MetashapePlyGenerationSetting).filter(MetashapePlyGenerationSetting.id == metashape_ply_generation_settings_id).first()
@@ -110,58 +208,88 @@ def get_full_ply(
     if not full_point_cloud and make_full_ply:
         
         frame_paths = [os.path.join(source_base_path, frame.file_name).__str__() for frame in frames]
-        cropped_frame_paths = []
-        for frame in frame_paths:
-            s = frame.split(".")
-            dest_path=f'{".".join(s[:-1])}_crop.{s[-1]}'
-            crop_image_by_color(
-                source_path=frame,
-                dest_path=dest_path,
-                rgb_max=np.array(platon_side_rgb_max),
-                rgb_min=np.array(platon_side_rgb_min)
+        # frames cropped on the pi before upload (see precrop.precrop_spool) are used as they are
+        to_crop = [frame_path for frame, frame_path in zip(frames, frame_paths) if not is_precropped(file_name=frame.file_name)]
+        crops = dict(zip(to_crop, crop_frames(
+            frame_paths=to_crop,
+            rgb_min=platon_side_rgb_min,
+            rgb_max=platon_side_rgb_max,
+            max_workers=crop_workers
+        )))
+        cropped_frame_paths = [crops.get(frame_path, frame_path) for frame_path in frame_paths]
+
+        cached = None
+        if artifact_cache:
+            full_ply_key = artifact_key(
+                kind='full_ply',
+                inputs=sorted(artifact_cache.file_hash(frame_path) for frame_path in cropped_frame_paths),
+                settings={
+                    'generation': settings_values(metashape_ply_gen_options),
+                    'export': settings_values(metashape_ply_export_options),
+                }
             )
-            cropped_frame_paths.append(dest_path)
-
-        metashape_project_ext = 'psx'
-        metashape_project_name = f'{uuid.uuid4()}'
-        metashape_project_filename = f'{metashape_project_name}.{metashape_project_ext}'
-        metashape_project_source_filepath = f'.\\{metashape_project_filename}'
-        metashape_project_dest_filepath = f'{source_base_path}\\{metashape_project_filename}'
-
-        metashape_project_files_source_filepath = f'.\\{metashape_project_name}.files'
-        metashape_project_files_dest_filepath = f'{source_base_path}\\{metashape_project_name}.files'
-
+            cached = artifact_cache.get(key=full_ply_key)
 
         point_cloud_ext = 'ply'
-        metashape_ply_name = f'{uuid.uuid4()}'
-        metashape_ply_filename=f'{metashape_ply_name}.{point_cloud_ext}'
-        metashape_ply_source_filepath=f'.\\{metashape_ply_filename}'
-        metashape_ply_dest_filepath=f'{source_base_path}\\{metashape_ply_filename}'
-
-        # for sim
-        # with open(metashape_project_source_filepath, 'w') as file:
-        #     file.write("")
-        
-        # with open(metashape_ply_source_filepath, 'w') as file:
-        #     file.write("")
-
-        create_full_ply(
-            frames=cropped_frame_paths,
-            metashape_point_cloud_gen_options=metashape_ply_gen_options,
-            metashape_project_path=metashape_project_source_filepath,
-            metashape_ply_path=metashape_ply_source_filepath,
-        )
+        if cached:
+            metashape_ply_filename = artifact_cache.reuse(entry=cached, dest_dir=source_base_path)
+            metashape_ply_name = os.path.splitext(metashape_ply_filename)[0]
+
+            metashape_project_filename = cached.get('values').get('metashape_project')
+            if metashape_project_filename:
+                cached_dir = os.path.dirname(cached.get('filepath'))
+                if os.path.abspath(cached_dir) == os.path.abspath(source_base_path):
+                    session.add(MetashapeProject(
+                        name=os.path.splitext(metashape_project_filename)[0],
+                        file_extension=os.path.splitext(metashape_project_filename)[1].strip('.'),
+                        file_name=metashape_project_filename,
+                        compression_step_id=step.id
+                    ))
+                else:
+                    logging.info(f"Step {step.id} reuses the point cloud of Metashape project {os.path.join(cached_dir, metashape_project_filename)}")
+        else:
+            metashape_project_ext = 'psx'
+            metashape_project_name = f'{uuid.uuid4()}'
+            metashape_project_filename = f'{metashape_project_name}.{metashape_project_ext}'
+            metashape_project_source_filepath = f'.\\{metashape_project_filename}'
+            metashape_project_dest_filepath = f'{source_base_path}\\{metashape_project_filename}'
+
+            metashape_project_files_source_filepath = f'.\\{metashape_project_name}.files'
+            metashape_project_files_dest_filepath = f'{source_base_path}\\{metashape_project_name}.files'
+
+            metashape_ply_name = f'{uuid.uuid4()}'
+            metashape_ply_filename=f'{metashape_ply_name}.{point_cloud_ext}'
+            metashape_ply_source_filepath=f'.\\{metashape_ply_filename}'
+            metashape_ply_dest_filepath=f'{source_base_path}\\{metashape_ply_filename}'
+
+            # for sim
+            # with open(metashape_project_source_filepath, 'w') as file:
+            #     file.write("")
+            
+            # with open(metashape_ply_source_filepath, 'w') as file:
+            #     file.write("")
+
+            create_full_ply(
+                frames=cropped_frame_paths,
+                metashape_point_cloud_gen_options=metashape_ply_gen_options,
+                metashape_project_path=metashape_project_source_filepath,
+                metashape_ply_path=metashape_ply_source_filepath,
+            )
 
-        move_file(source=metashape_project_source_filepath, destination=metashape_project_dest_filepath)
-        new_meta_proj = MetashapeProject(
-            name=metashape_project_name,
-            file_extension=metashape_project_ext,
-            file_name=metashape_project_filename,
-            compression_step_id=step.id
-        )
-        session.add(new_meta_proj)
+            move_file(source=metashape_project_source_filepath, destination=metashape_project_dest_filepath)
+            new_meta_proj = MetashapeProject(
+                name=metashape_project_name,
+                file_extension=metashape_project_ext,
+                file_name=metashape_project_filename,
+                compression_step_id=step.id
+            )
+            session.add(new_meta_proj)
+
+            move_file(source=metashape_ply_source_filepath, destination=metashape_ply_dest_filepath)
+            move_file(source=metashape_project_files_source_filepath, destination=metashape_project_files_dest_filepath)
+            if artifact_cache:
+                artifact_cache.put(key=full_ply_key, kind='full_ply', filepath=metashape_ply_dest_filepath, metashape_project=metashape_project_filename)
 
-        move_file(source=metashape_ply_source_filepath, destination=metashape_ply_dest_filepath)
         new_meta_ply = FullPointCloud(
             name=metashape_ply_name,
             file_extension=point_cloud_ext,
@@ -173,8 +301,6 @@ def get_full_ply(
         session.add(new_meta_ply)
         session.commit()
 
-        move_file(source=metashape_project_files_source_filepath, destination=metashape_project_files_dest_filepath)
-
         full_point_clouds = step.full_point_clouds
         for pcd in full_point_clouds:
             if (pcd.metashape_ply_export_setting_id == metashape_ply_export_settings_id) and (pcd.metashape_ply_generation_setting_id == metashape_ply_generation_settings_id):
@@ -198,8 +324,12 @@ def get_processed_ply(
         platon_face_color_setting_id: int,
         full_ply_filepath: str,
         source_base_path: str,
-        is_calibration: bool = False
+        is_calibration: bool = False,
+        artifact_cache: ArtifactCache = None
 ):
+    """
+    :param artifact_cache: reuse a processed cloud made from the same full ply and settings values
+    """
     processed_point_cloud = None
 
     o3d_plane_segmentaion_settings = session.query(Open3DSegmentationSetting).filter(Open3DSegmentationSetting.id == o3d_plane_segmentaion_settings_id).first()
@@ -282,25 +412,48 @@ def get_processed_ply(
         # else:
         num_platons = 2
 
-        # for sim
-        # with open(processed_ply_source_filepath, 'w') as file:
-        #     file.write("")
-        # scaling_factor = 5
-
-        scaling_factor = process_full_ply(
-            full_ply_path=full_ply_filepath,
-            processed_ply_path=processed_ply_source_filepath,
-            num_platons=num_platons,
-            o3d_plane_segmentaion_settings=o3d_plane_segmentaion_settings,
-            o3d_dbscan_clustering_settings=o3d_dbscan_clustering_settings,
-            known_platon_dims=platon_dimensions,
-            platon_side_rgb_max=platon_side_rgb_max,
-            platon_side_rgb_min=platon_side_rgb_min,
-            platon_face_rgb_max=platon_face_rgb_max,
-            platon_face_rgb_min=platon_face_rgb_min
-        )        
-
-        move_file(source=processed_ply_source_filepath, destination=processed_ply_dest_filepath)
+        cached = None
+        if artifact_cache:
+            processed_ply_key = artifact_key(
+                kind='processed_ply',
+                inputs=[artifact_cache.file_hash(full_ply_filepath)],
+                settings={
+                    'num_platons': num_platons,
+                    'segmentation': settings_values(o3d_plane_segmentaion_settings),
+                    'dbscan_clustering': settings_values(o3d_dbscan_clustering_settings),
+                    'platon_dimensions': settings_values(platon_dimensions),
+                    'platon_side_rgb': [platon_side_rgb_min, platon_side_rgb_max],
+                    'platon_face_rgb': [platon_face_rgb_min, platon_face_rgb_max],
+                }
+            )
+            cached = artifact_cache.get(key=processed_ply_key)
+
+        if cached:
+            processed_ply_filename = artifact_cache.reuse(entry=cached, dest_dir=source_base_path)
+            processed_ply_name = os.path.splitext(processed_ply_filename)[0]
+            scaling_factor = cached.get('values').get('scaling_factor')
+        else:
+            # for sim
+            # with open(processed_ply_source_filepath, 'w') as file:
+            #     file.write("")
+            # scaling_factor = 5
+
+            scaling_factor = process_full_ply(
+                full_ply_path=full_ply_filepath,
+                processed_ply_path=processed_ply_source_filepath,
+                num_platons=num_platons,
+                o3d_plane_segmentaion_settings=o3d_plane_segmentaion_settings,
+                o3d_dbscan_clustering_settings=o3d_dbscan_clustering_settings,
+                known_platon_dims=platon_dimensions,
+                platon_side_rgb_max=platon_side_rgb_max,
+                platon_side_rgb_min=platon_side_rgb_min,
+                platon_face_rgb_max=platon_face_rgb_max,
+                platon_face_rgb_min=platon_face_rgb_min
+            )        
+
+            move_file(source=processed_ply_source_filepath, destination=processed_ply_dest_filepath)
+            if artifact_cache:
+                artifact_cache.put(key=processed_ply_key, kind='processed_ply', filepath=processed_ply_dest_filepath, scaling_factor=scaling_factor)
         new_proc_ply = ProcessedPointCloud(
             name=processed_ply_name,
             file_extension=point_cloud_ext,
@@ -335,7 +488,11 @@ def get_raw_stl(
         source_base_path: str,
         full_ply_path: str,
         metashape_stl_generation_settings_id: int,
+        artifact_cache: ArtifactCache = None,
 ):
+    """
+    :param artifact_cache: reuse an stl built from the same processed ply, scaling and settings values
+    """
     raw_stl = None
 
     metashape_stl_gen_options = session.query(MetashapeBuildModelSetting).filter(MetashapeBuildModelSetting.id == metashape_stl_generation_settings_id).first()
@@ -367,20 +524,40 @@ def get_raw_stl(
         raw_stl_source_filepath = f'.\\{raw_stl_filename}'
         raw_stl_dest_filepath = f'{source_base_path}\\{raw_stl_filename}'
 
-        build_stl(
-            full_ply_path=full_ply_path,
-            stl_write_path=raw_stl_source_filepath,
-            metashape_stl_generation_settings=metashape_stl_gen_options
-        )
+        cached = None
+        if artifact_cache:
+            raw_stl_key = artifact_key(
+                kind='raw_stl',
+                inputs=[artifact_cache.file_hash(full_ply_path)],
+                settings={
+                    'build_model': settings_values(metashape_stl_gen_options),
+                    'ply_scaling_factor': ply_scaling_factor,
+                    'stl_scaling_factor': stl_scaling_factor,
+                }
+            )
+            cached = artifact_cache.get(key=raw_stl_key)
 
-        volume = get_volume(
-            scaling_factor=ply_scaling_factor,
-            stl_path=raw_stl_source_filepath
-        )
-        volume = volume * stl_scaling_factor
-        volume = abs(volume)
+        if cached:
+            raw_stl_filename = artifact_cache.reuse(entry=cached, dest_dir=source_base_path)
+            raw_stl_name = os.path.splitext(raw_stl_filename)[0]
+            volume = cached.get('values').get('volume')
+        else:
+            build_stl(
+                full_ply_path=full_ply_path,
+                stl_write_path=raw_stl_source_filepath,
+                metashape_stl_generation_settings=metashape_stl_gen_options
+            )
+
+            volume = get_volume(
+                scaling_factor=ply_scaling_factor,
+                stl_path=raw_stl_source_filepath
+            )
+            volume = volume * stl_scaling_factor
+            volume = abs(volume)
 
-        move_file(source=raw_stl_source_filepath, destination=raw_stl_dest_filepath)
+            move_file(source=raw_stl_source_filepath, destination=raw_stl_dest_filepath)
+            if artifact_cache:
+                artifact_cache.put(key=raw_stl_key, kind='raw_stl', filepath=raw_stl_dest_filepath, volume=volume)
         new_stl = RawSTL(
             name=raw_stl_name,
             file_extension=raw_stl_ext,
@@ -410,7 +587,11 @@ def get_processed_stl(
         raw_stl,
         raw_stl_filepath: str,
         source_base_path: str,
+        artifact_cache: ArtifactCache = None,
 ):
+    """
+    :param artifact_cache: reuse a sealed stl made from the same raw stl
+    """
     processed_stl = None
 
     # since we can only have one processed stl per raw stl
@@ -425,15 +606,31 @@ def get_processed_stl(
         processed_stl_filename = f'{processed_stl_name}.{processed_stl_ext}'
         processed_stl_dest_filepath = f'{source_base_path}\\{processed_stl_filename}'
 
-        logging.info(f"Cleaning and Sealing STL...")
-        pymeshfix.clean_from_file(raw_stl_filepath, processed_stl_dest_filepath)
-        
         scaling_factor = raw_stl.processed_point_cloud.scaling_factor
-        volume = get_volume(
-            scaling_factor=scaling_factor,  # still need scaling factor since stl isnt being scaled, simply the volume calculation
-            stl_path=processed_stl_dest_filepath
-        )
-        volume = abs(volume)
+        cached = None
+        if artifact_cache:
+            processed_stl_key = artifact_key(
+                kind='processed_stl',
+                inputs=[artifact_cache.file_hash(raw_stl_filepath)],
+                settings={'scaling_factor': scaling_factor}
+            )
+            cached = artifact_cache.get(key=processed_stl_key)
+
+        if cached:
+            processed_stl_filename = artifact_cache.reuse(entry=cached, dest_dir=source_base_path)
+            processed_stl_name = os.path.splitext(processed_stl_filename)[0]
+            volume = cached.get('values').get('volume')
+        else:
+            logging.info(f"Cleaning and Sealing STL...")
+            pymeshfix.clean_from_file(raw_stl_filepath, processed_stl_dest_filepath)
+            
+            volume = get_volume(
+                scaling_factor=scaling_factor,  # still need scaling factor since stl isnt being scaled, simply the volume calculation
+                stl_path=processed_stl_dest_filepath
+            )
+            volume = abs(volume)
+            if artifact_cache:
+                artifact_cache.put(key=processed_stl_key, kind='processed_stl', filepath=processed_stl_dest_filepath, volume=volume)
 
         # will need to adjust by scaling factor! or we could adjust the raw
 
@@ -456,6 +653,138 @@ def get_processed_stl(
     return processed_stl
 
 
+def process_step(
+        session,
+        step,
+        trial_name: str,
+        metashape_ply_generation_settings_id: int,
+        metashape_ply_export_settings_id: int,
+        metashape_stl_generation_settings_id: int,
+        o3d_plane_segmentaion_settings_id: int,
+        o3d_dbscan_clustering_settings_id: int,
+        platon_side_color_setting_id: int,
+        platon_face_color_setting_id: int,
+        platon_dims_id: int,
+        stl_scaling_factor_id: int,
+        source_base_path: str,
+        make_full_ply: bool = True,
+        make_processed_ply: bool = True,
+        make_raw_stl: bool = True,
+        make_processed_stl: bool = True,
+        artifact_cache_dir: str = None
+        ):
+    """
+    full ply -> processed ply -> raw stl -> processed stl for one step, each stage is
+    skipped if it already exists for these settings. with artifact_cache_dir a stage that
+    has no row for these setting ids reuses an equivalent artifact (see ArtifactCache)
+
+    :return: dict of the ids of the assets the step ended up with
+    """
+    results = {'step_id': step.id}
+    trial_path = os.path.join(source_base_path, trial_name)
+    artifact_cache = ArtifactCache(root=artifact_cache_dir) if artifact_cache_dir else None
+
+    frames = step.frames
+    if not len(frames) > 0:  # check for frames, cant create anything without frames
+        logging.info(f"No Frames assigned to Step ID: {step.name}")
+        return results
+
+    # to check for assets try inserting and rely on unique conditions to reject insertion?
+    # if asset exists get its filepath to use in processing
+    # make sure all options are accessible
+
+    # gen point clouds
+    full_point_cloud = get_full_ply(
+        session =session,
+        step=step,
+        platon_side_color_setting_id=platon_side_color_setting_id,
+        source_base_path=trial_path,
+        metashape_ply_generation_settings_id=metashape_ply_generation_settings_id,
+        metashape_ply_export_settings_id=metashape_ply_export_settings_id,
+        make_full_ply=make_full_ply,
+        artifact_cache=artifact_cache
+    )
+    if not full_point_cloud or not make_processed_ply:
+        return results
+    results['full_point_cloud_id'] = full_point_cloud.id
+
+    processed_ply = get_processed_ply(
+        session=session,
+        step=step,
+        o3d_plane_segmentaion_settings_id=o3d_plane_segmentaion_settings_id,
+        o3d_dbscan_clustering_settings_id=o3d_dbscan_clustering_settings_id,
+        platon_side_color_setting_id=platon_side_color_setting_id,
+        platon_face_color_setting_id=platon_face_color_setting_id,
+        source_base_path=trial_path,
+        platon_dims_id=platon_dims_id,
+        full_ply_filepath=os.path.join(trial_path, full_point_cloud.file_name),
+        artifact_cache=artifact_cache
+    )
+    if not processed_ply or not make_raw_stl:
+        return results
+    results['processed_ply_id'] = processed_ply.id
+
+    raw_stl = get_raw_stl(
+        session=session,
+        step=step,
+        processed_ply=processed_ply,
+        ply_scaling_factor=processed_ply.scaling_factor,
+        stl_scaling_factor_id=stl_scaling_factor_id,
+        source_base_path=trial_path,
+        full_ply_path=os.path.join(trial_path, processed_ply.file_name),
+        metashape_stl_generation_settings_id=metashape_stl_generation_settings_id, 
+        artifact_cache=artifact_cache
+    )
+    if not raw_stl or not make_processed_stl:
+        return results
+    results['raw_stl_id'] = raw_stl.id
+
+    processed_stl = get_processed_stl(
+        session=session,
+        step=step,
+        raw_stl=raw_stl,
+        source_base_path=trial_path,
+        raw_stl_filepath=os.path.join(trial_path, raw_stl.file_name),
+        artifact_cache=artifact_cache
+    )
+    if processed_stl:
+        results['processed_stl_id'] = processed_stl.id
+    return results
+
+
+_worker_Session = None
+
+
+def init_step_worker(db_conn: str):
+    """
+    process pool initializer, every worker gets its own engine and session factory
+    """
+    global _worker_Session
+    _worker_Session = get_session(conn_str=db_conn)
+
+
+def process_step_worker(step_id: int, trial_name: str, **kwargs):
+    """
+    run process_step in a pool worker on a session of its own. errors are caught and
+    returned so one bad step doesnt take the pool down
+
+    :return: process_step's results plus seconds and error (None if it went through)
+    """
+    start = time.monotonic()
+    session = _worker_Session()
+    try:
+        step = session.query(CompressionStep).filter(CompressionStep.id == step_id).first()
+        results = process_step(session=session, step=step, trial_name=trial_name, **kwargs)
+        results['error'] = None
+    except Exception:
+        session.rollback()
+        results = {'step_id': step_id, 'error': traceback.format_exc()}
+    finally:
+        session.close()
+    results['seconds'] = time.monotonic() - start
+    return results
+
+
 def process_trial(
         trial_id: int,
         metashape_ply_generation_settings_id: int,
@@ -472,9 +801,44 @@ def process_trial(
         make_full_ply: bool = True,
         make_processed_ply: bool = True,
         make_raw_stl: bool = True,
-        make_processed_stl: bool = True
+        make_processed_stl: bool = True,
+        parallel: bool = False,
+        max_workers: int = 2,
+        artifact_cache: bool = False,
+        skip_step_ids: List[int] = None
         ):
-    
+    """
+    run process_step over every step of a trial in strain order. with parallel the steps are
+    fanned out to a pool of max_workers processes, each worker opens its own db session (see
+    init_step_worker). max_workers defaults to 2 since every worker runs metashape and open3d,
+    which are multithreaded themselves and hold a full point cloud in memory, so one worker
+    per core oversubscribes the cpu and can run the box out of ram. progress is logged as steps come back and a
+    step that fails is logged and collected instead of stopping the rest. with artifact_cache
+    equivalent artifacts are looked up in source_base_path/artifact_cache before anything is
+    rebuilt, across steps and trials
+
+    :param skip_step_ids: ids of steps to leave out, i.e. ones known to have bad frames
+    :return: dict of step id -> process_step results, failed steps carry the traceback in error
+    """
+    step_kwargs = dict(
+        metashape_ply_generation_settings_id=metashape_ply_generation_settings_id,
+        metashape_ply_export_settings_id=metashape_ply_export_settings_id,
+        metashape_stl_generation_settings_id=metashape_stl_generation_settings_id,
+        o3d_plane_segmentaion_settings_id=o3d_plane_segmentaion_settings_id,
+        o3d_dbscan_clustering_settings_id=o3d_dbscan_clustering_settings_id,
+        platon_side_color_setting_id=platon_side_color_setting_id,
+        platon_face_color_setting_id=platon_face_color_setting_id,
+        platon_dims_id=platon_dims_id,
+        stl_scaling_factor_id=stl_scaling_factor_id,
+        source_base_path=source_base_path,
+        make_full_ply=make_full_ply,
+        make_processed_ply=make_processed_ply,
+        make_raw_stl=make_raw_stl,
+        make_processed_stl=make_processed_stl,
+        artifact_cache_dir=os.path.join(source_base_path, 'artifact_cache') if artifact_cache else None
+    )
+    results = dict()
+
     Session = get_session(conn_str=db_conn)
     session = Session()
     trial = session.query(CompressionTrial).filter(CompressionTrial.id == trial_id).first()
@@ -484,82 +848,44 @@ def process_trial(
         steps  = trial.steps
         if len(steps) > 0:
             steps = sorted(steps, key=lambda x: x.strain_target)
-
-            i = 0
-            for step in steps:
-                if step.id in [627, 629, 630, 604, 623, 610, 615, 643, 645, 646]:
-                    continue 
-                #if step.id not in [499]:
-                 #   continue
-                logging.info(f"Processing Step {step.id}: {i + 1} / {len(steps)}")
-                i += 1
-                frames = step.frames
-                if not len(frames) > 0:  # check for frames, cant create anything without frames
-                    logging.info(f"No Frames assigned to Step ID: {step.name}")
-                    continue
-
-                # check if all options exist
-                
-                
-                # to check for assets try inserting and rely on unique conditions to reject insertion?
-                # if asset exists get its filepath to use in processing
-                # make sure all options are accessible
-
-                # gen point clouds
-                # source_base_path = os.path.join(source_base_path, trial.name)
-                full_point_cloud = get_full_ply(
-                    session =session,
-                    step=step,
-                    platon_side_color_setting_id=platon_side_color_setting_id,
-                    source_base_path=os.path.join(source_base_path, trial.name),
-                    metashape_ply_generation_settings_id=metashape_ply_generation_settings_id,
-                    metashape_ply_export_settings_id=metashape_ply_export_settings_id,
-                    make_full_ply=make_full_ply
-                )
-
-                if full_point_cloud and make_processed_ply:
-                    full_point_cloud_filepath = os.path.join(source_base_path, trial.name, full_point_cloud.file_name)
-
-                    processed_ply = get_processed_ply(
-                        session=session,
-                        step=step,
-                        o3d_plane_segmentaion_settings_id=o3d_plane_segmentaion_settings_id,
-                        o3d_dbscan_clustering_settings_id=o3d_dbscan_clustering_settings_id,
-                        platon_side_color_setting_id=platon_side_color_setting_id,
-                        platon_face_color_setting_id=platon_face_color_setting_id,
-                        source_base_path=os.path.join(source_base_path, trial.name),
-                        platon_dims_id=platon_dims_id,
-                        full_ply_filepath=full_point_cloud_filepath,
-                    )
-
-                    if processed_ply and make_raw_stl:
-                        processed_ply_filepath = os.path.join(source_base_path, trial.name, processed_ply.file_name)
-
-                        raw_stl = get_raw_stl(
-                            session=session,
-                            step=step,
-                            processed_ply=processed_ply,
-                            ply_scaling_factor=processed_ply.scaling_factor,
-                            stl_scaling_factor_id=stl_scaling_factor_id,
-                            source_base_path=os.path.join(source_base_path, trial.name),
-                            full_ply_path=processed_ply_filepath,
-                            metashape_stl_generation_settings_id=metashape_stl_generation_settings_id, 
-                        )
-                            
-                        if raw_stl and make_processed_stl:
-                            raw_stl_filepath = os.path.join(source_base_path, trial.name, raw_stl.file_name)
-
-                            processed_stl = get_processed_stl(
-                                session=session,
-                                step=step,
-                                raw_stl=raw_stl,
-                                source_base_path=os.path.join(source_base_path, trial.name),
-                                raw_stl_filepath=raw_stl_filepath,
-                            )
+            if skip_step_ids:
+                steps = [step for step in steps if step.id not in skip_step_ids]
+            #steps = [step for step in steps if step.id in [499]]
+
+            if parallel:
+                step_ids = [step.id for step in steps]
+                trial_name = trial.name
+                session.close()  # workers have their own sessions, dont hold a connection open meanwhile
+
+                # spawn so no worker inherits the parent's engine or open connections
+                with ProcessPoolExecutor(
+                        max_workers=max_workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=init_step_worker,
+                        initargs=(db_conn,)
+                ) as pool:
+                    futures = [
+                        pool.submit(process_step_worker, step_id=step_id, trial_name=trial_name, **step_kwargs)
+                        for step_id in step_ids
+                    ]
+                    for i, future in enumerate(as_completed(futures)):
+                        step_results = future.result()
+                        results[step_results.get('step_id')] = step_results
+                        if step_results.get('error'):
+                            logging.info(f"Step {step_results.get('step_id')} failed ({i + 1} / {len(step_ids)}):\n{step_results.get('error')}")
+                        else:
+                            logging.info(f"Step {step_results.get('step_id')} done in {step_results.get('seconds'):.0f} s: {i + 1} / {len(step_ids)}")
+            else:
+                for i, step in enumerate(steps):
+                    logging.info(f"Processing Step {step.id}: {i + 1} / {len(steps)}")
+                    results[step.id] = process_step(session=session, step=step, trial_name=trial.name, **step_kwargs)
 
         session.close()
 
-    pass
+        failed = [step_id for step_id, step_results in results.items() if step_results.get('error')]
+        logging.info(f"Trial {trial_id}: {len(results) - len(failed)} / {len(results)} steps processed, failed: {failed}")
+
+    return results
 
 
 def determine_plane_colors(
@@ -0,0 +1,201 @@
+import logging
+import os
+import shutil
+import subprocess
+
+from typing import List
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+import numpy as np
+
+try:
+    from PIL import Image, JpegImagePlugin
+except ImportError:
+    Image = None
+
+from spool import StepSpool, file_sha256
+
+# jpeg crops are snapped to the 16 px iMCU grid so jpegtran can cut them losslessly
+MCU_PX = 16
+# pre-cropped frames are uploaded as <name>_precrop.<ext>, the Frame's file name is the marker
+PRECROP_SUFFIX = '_precrop'
+
+
+def precropped_name(file_name: str):
+    stem, ext = os.path.splitext(file_name)
+    return f"{stem}{PRECROP_SUFFIX}{ext}"
+
+
+def is_precropped(file_name: str):
+    """
+    true for a frame cropped on the pi before upload (see precrop_spool)
+    """
+    return os.path.splitext(file_name)[0].endswith(PRECROP_SUFFIX)
+
+
+def color_bounds(color_definition: dict):
+    """
+    rgb window of a ColorDefinition, mean +- standard_dev_range stdvs clipped to 0-255.
+    same window post_protocols.get_full_ply hands to crop_image_by_color
+
+    :param color_definition: ColorDefinition column values
+    :return: (rgb_min, rgb_max) lists
+    """
+    rgb_max = []
+    rgb_min = []
+    for channel in ['red', 'green', 'blue']:
+        mean = color_definition.get(f'{channel}_mean_val')
+        spread = color_definition.get(f'{channel}_mean_stdv') * color_definition.get('standard_dev_range')
+        rgb_max.append(mean + spread if mean + spread <= 255 else 255)
+        rgb_min.append(mean - spread if mean - spread >= 0 else 0)
+    return rgb_min, rgb_max
+
+
+def snap_box(box: List[int], width: int, height: int, margin: float = 0.0):
+    """
+    grow box by margin (fraction of its size) on every side, snap it outwards to the
+    MCU grid and clip it to the image
+
+    :return: [left, top, right, bottom]
+    """
+    left, top, right, bottom = box
+    pad_x = int((right - left) * margin)
+    pad_y = int((bottom - top) * margin)
+    left = max(0, (left - pad_x) // MCU_PX * MCU_PX)
+    top = max(0, (top - pad_y) // MCU_PX * MCU_PX)
+    right = min(width, right + pad_x)
+    bottom = min(height, bottom + pad_y)
+    return [left, top, right, bottom]
+
+
+def color_crop_box(
+        filepath: str,
+        rgb_min: List[float],
+        rgb_max: List[float],
+        margin: float = 0.1,
+        scale: int = 8,
+        min_fraction: float = 0.001,
+):
+    """
+    bounding box of the pixels inside the rgb window, found on a 1/scale jpeg draft so it
+    is cheap enough for the pi. the box is padded by margin so it stays a superset of
+    what crop_image_by_color keeps
+
+    :param min_fraction: fewer matching pixels than this (fraction of the draft) gives no box
+    :return: [left, top, right, bottom] in full resolution pixels or None
+    """
+    with Image.open(filepath) as img:
+        width, height = img.size
+        img.draft('RGB', (width // scale, height // scale))
+        pixels = np.asarray(img.convert('RGB'))
+
+    mask = np.all((pixels >= np.array(rgb_min)) & (pixels <= np.array(rgb_max)), axis=-1)
+    if mask.sum() < min_fraction * mask.size:
+        return None
+
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    x_scale = width / mask.shape[1]
+    y_scale = height / mask.shape[0]
+    box = [
+        int(cols[0] * x_scale),
+        int(rows[0] * y_scale),
+        int(np.ceil((cols[-1] + 1) * x_scale)),
+        int(np.ceil((rows[-1] + 1) * y_scale)),
+    ]
+    return snap_box(box=box, width=width, height=height, margin=margin)
+
+
+def crop_frame(filepath: str, box: List[int], dest_path: str):
+    """
+    crop filepath to box into dest_path. jpegtran is used when it is installed (lossless,
+    keeps exif), otherwise PIL re-encodes with the source quantisation tables
+    """
+    left, top, right, bottom = box
+    tmp_path = f"{dest_path}.tmp"
+    jpegtran = shutil.which('jpegtran')
+    if jpegtran and os.path.splitext(filepath)[1].lower() in ['.jpg', '.jpeg']:
+        subprocess.run(
+            [jpegtran, '-copy', 'all', '-crop', f'{right - left}x{bottom - top}+{left}+{top}', '-outfile', tmp_path, filepath],
+            check=True,
+            capture_output=True
+        )
+    else:
+        with Image.open(filepath) as img:
+            exif = img.info.get('exif')
+            cropped = img.crop((left, top, right, bottom))
+            if img.format == 'JPEG':
+                sampling = JpegImagePlugin.get_sampling(img)
+                cropped.save(
+                    tmp_path,
+                    format='JPEG',
+                    qtables=img.quantization,
+                    subsampling=sampling if sampling >= 0 else 2,
+                    exif=exif if exif else b''
+                )
+            else:
+                cropped.save(tmp_path, format=img.format)
+    os.replace(tmp_path, dest_path)
+
+
+def precrop_spool(
+        spool: StepSpool,
+        rgb_min: List[float] = None,
+        rgb_max: List[float] = None,
+        box: List[int] = None,
+        margin: float = 0.1,
+):
+    """
+    crop a step's frames on the pi before they are uploaded, either to the colour window's
+    bounding box (see color_crop_box) or to a fixed box. the crop is written next to the
+    frame as <name>_precrop.<ext> and takes its place in the manifest with its crop box, size
+    and sha256. the original is kept (original_name) until the crop is confirmed on the
+    server, see StepSpool.mark_uploaded. frames already uploaded or already looked at are
+    left alone so this is safe to run again. a frame with no colour match keeps crop_box None
+    and goes up uncropped
+
+    :param box: fixed [left, top, right, bottom], used instead of the colour window
+    :return: dict of n_cropped, bytes_before and bytes_after
+    """
+    stats = {'n_cropped': 0, 'bytes_before': 0, 'bytes_after': 0}
+    if Image is None:
+        logging.info("PIL is not installed, frames go up uncropped.")
+        return stats
+
+    for frame in spool.frames:
+        if frame.get('uploaded') or 'crop_box' in frame:
+            continue
+
+        filepath = os.path.join(spool.spool_dir, frame.get('file_name'))
+        try:
+            if box:
+                with Image.open(filepath) as img:
+                    width, height = img.size
+                frame_box = snap_box(box=box, width=width, height=height)
+            else:
+                frame_box = color_crop_box(filepath=filepath, rgb_min=rgb_min, rgb_max=rgb_max, margin=margin)
+
+            if frame_box:
+                size_before = os.path.getsize(filepath)
+                file_name = precropped_name(file_name=frame.get('file_name'))
+                dest_path = os.path.join(spool.spool_dir, file_name)
+                crop_frame(filepath=filepath, box=frame_box, dest_path=dest_path)
+                frame['original_name'] = frame.get('file_name')
+                frame['file_name'] = file_name
+                frame['size'] = os.path.getsize(dest_path)
+                frame['sha256'] = file_sha256(dest_path)
+                stats['n_cropped'] += 1
+                stats['bytes_before'] += size_before
+                stats['bytes_after'] += frame.get('size')
+        except Exception as e:
+            logging.info(f"Could not pre-crop {filepath}, sending it uncropped: {e}")
+            frame_box = None
+        frame['crop_box'] = frame_box
+        spool.write_manifest()
+
+    if stats.get('n_cropped'):
+        logging.info(f"Pre-cropped {stats.get('n_cropped')} frames, "
+                     f"{stats.get('bytes_before') / 1e6:.1f} -> {stats.get('bytes_after') / 1e6:.1f} MB")
+    return stats
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+class RingSampler:
+    """
+    samples encoder counts and force together on a dedicated thread into
+    preallocated ring buffers, timestamps use time.monotonic
+
+    :param read_counts: callable returning the current encoder count
+    :param read_force: callable returning a single (zeroed) force reading
+    :param rate_hz: target sampling rate, the thread sleeps off whatever is left of each tick
+    :param capacity: ring buffer length, drain() faster than capacity / rate_hz to avoid overruns
+
+    if a read raises the thread logs it and stops, drain() raises once the samples taken
+    before that have been drained
+    """
+
+    def __init__(
+            self,
+            read_counts,
+            read_force,
+            rate_hz: float = 200,
+            capacity: int = 2 ** 16,
+    ):
+        self.read_counts = read_counts
+        self.read_force = read_force
+        self.rate_hz = rate_hz
+        self.capacity = capacity
+
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.force = np.zeros(capacity, dtype=np.float64)
+
+        self.n_written = 0
+        self.n_read = 0
+        self.n_overrun = 0
+        self.t_first = None
+        self.t_last = None
+        self.error = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        logging.info(f"Sampler stopped: {self.n_written} samples @ {self.achieved_rate_hz:.1f} Hz "
+                     f"(target {self.rate_hz} Hz)")
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _run(self):
+        try:
+            self._sample()
+        except Exception as e:
+            logging.exception(f"Sampler thread died after {self.n_written} samples: {e}")
+            self.error = e
+
+    def _sample(self):
+        period = 1 / self.rate_hz
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            t = time.monotonic()
+            counts = self.read_counts()
+            force = self.read_force()
+
+            with self._lock:
+                idx = self.n_written % self.capacity
+                self.t[idx] = t
+                self.counts[idx] = counts
+                self.force[idx] = force
+                self.n_written += 1
+                if self.t_first is None:
+                    self.t_first = t
+                self.t_last = t
+
+            next_tick += period
+            remaining = next_tick - time.monotonic()
+            if remaining > 0:
+                self._stop.wait(remaining)
+            else:
+                next_tick = time.monotonic()  # fell behind, dont try to catch up with a burst
+
+    @property
+    def achieved_rate_hz(self):
+        if self.n_written < 2 or self.t_last == self.t_first:
+            return 0.0
+        return (self.n_written - 1) / (self.t_last - self.t_first)
+
+    def latest(self):
+        """
+        :return: (t, counts, force) of the most recent sample or None
+        """
+        with self._lock:
+            if self.n_written == 0:
+                return None
+            idx = (self.n_written - 1) % self.capacity
+            return self.t[idx], int(self.counts[idx]), self.force[idx]
+
+    def drain(self):
+        """
+        take all samples written since the last drain, oldest samples are lost if
+        the ring wrapped past the read cursor
+
+        :return: dict of arrays with keys t, counts, force
+        :raises RuntimeError: the sampling thread died and there is nothing left to drain
+        """
+        with self._lock:
+            start = self.n_read
+            end = self.n_written
+            if start == end and self.error is not None:
+                raise RuntimeError(f"Sampler thread died after {end} samples: {self.error}") from self.error
+            if end - start > self.capacity:
+                lost = end - start - self.capacity
+                self.n_overrun += lost
+                logging.info(f"Sampler overrun, {lost} samples lost.")
+                start = end - self.capacity
+
+            idxs = np.arange(start, end) % self.capacity
+            chunk = {
+                't': self.t[idxs].copy(),
+                'counts': self.counts[idxs].copy(),
+                'force': self.force[idxs].copy(),
+            }
+            self.n_read = end
+
+        return chunk
+
+
+def chunks_to_df(chunks):
+    """
+    :param chunks: list of dicts from RingSampler.drain()
+    :return: DataFrame with columns t, counts, force
+    """
+    if not chunks:
+        return pd.DataFrame(columns=['t', 'counts', 'force'])
+
+    return pd.DataFrame({
+        key: np.concatenate([chunk[key] for chunk in chunks]) for key in ['t', 'counts', 'force']
+    })
+
+
+def sample_force_settled(
+        read_force,
+        tolerance: float,
+        timeout_s: float = 10,
+        window: int = 20,
+):
+    """
+    stream force readings until the reading has settled. readings are taken in windows,
+    each with an online (welford) mean and variance. the force counts as settled once the
+    standard error of a window and the change from the previous window mean are both
+    under tolerance, or timeout_s runs out
+
+    :param read_force: callable returning a single force reading
+    :param tolerance: in force units
+    :return: dict with force (last window mean), std, settle_s, drift (force / s between the
+             last two windows, or the slope within the window if it timed out on the first),
+             n_samples and converged
+    """
+    start = time.monotonic()
+    prev_mean = None
+    prev_t = None
+    n_samples = 0
+
+    while True:
+        n = 0
+        mean = 0.0
+        m2 = 0.0
+        # running sums for the least squares slope of force against time within the window
+        sum_t = sum_tt = sum_tx = 0.0
+        for i in range(window):
+            x = read_force()
+            xt = time.monotonic() - start
+            n += 1
+            delta = x - mean
+            mean += delta / n
+            m2 += delta * (x - mean)
+            sum_t += xt
+            sum_tt += xt * xt
+            sum_tx += xt * x
+        n_samples += n
+        t = time.monotonic()
+
+        std = np.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+        sem = std / np.sqrt(n)
+        if prev_mean is not None and t > prev_t:
+            drift = (mean - prev_mean) / (t - prev_t)
+        else:
+            t_var = sum_tt - sum_t * sum_t / n
+            drift = (sum_tx - sum_t * mean) / t_var if t_var > 0 else 0.0
+        converged = prev_mean is not None and sem < tolerance and abs(mean - prev_mean) < tolerance
+        timed_out = t - start > timeout_s
+
+        if converged or timed_out:
+            if timed_out and not converged:
+                logging.info(f"Force did not settle within {timeout_s} s, drift {drift:.4f} / s")
+            return {
+                'force': float(mean),
+                'std': float(std),
+                'settle_s': t - start,
+                'drift': float(drift),
+                'n_samples': n_samples,
+                'converged': converged,
+            }
+
+        prev_mean = mean
+        prev_t = t
@@ -0,0 +1,305 @@
+import atexit
+import logging
+import os
+import posixpath
+import queue
+import shlex
+import socket
+import threading
+import time
+
+import paramiko
+
+from contextlib import contextmanager
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+from transport import Transport, write_tar
+
+
+class SFTPPool(Transport):
+    """
+    a fixed number of authenticated sftp sessions to one host, kept open between calls so
+    files, steps and trials all reuse the same handshakes. each session is its own ssh
+    connection so parallel puts dont share a tcp window. remote dirs that are known to
+    exist are cached so each dir is only stat'd / created once per pool. put_files,
+    put_many, put_verified and put_tar come from Transport
+
+    :param n_channels: number of parallel sessions
+    :param source_ip: local address to connect from, pins the pool to one interface
+    """
+
+    def __init__(
+            self,
+            hostname: str,
+            username: str,
+            password: str,
+            port: int = 22,
+            n_channels: int = 4,
+            source_ip: str = None,
+    ):
+        super().__init__(hostname=hostname, n_channels=n_channels)
+        self.username = username
+        self.password = password
+        self.port = port
+        self.source_ip = source_ip
+
+        self.sessions = queue.Queue()
+        self.clients = []
+
+        for i in range(n_channels):
+            self.sessions.put(None)  # connected lazily on first use
+
+    def _connect(self):
+        """
+        :return: (SSHClient, SFTPClient) on a new connection
+        """
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        sock = None
+        if self.source_ip:
+            sock = socket.create_connection((self.hostname, self.port), timeout=10, source_address=(self.source_ip, 0))
+        client.connect(self.hostname, self.port, self.username, self.password, sock=sock)
+        with self._lock:
+            self.clients.append(client)
+        return client, client.open_sftp()
+
+    def _drop(self, connection):
+        """
+        close a pooled connection, sftp session and ssh client both
+        """
+        client, sftp = connection
+        for closeable in [sftp, client]:
+            try:
+                closeable.close()
+            except Exception:
+                pass
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    @staticmethod
+    def _alive(connection):
+        try:
+            return connection[1].get_channel().get_transport().is_active()
+        except Exception:
+            return False
+
+    @contextmanager
+    def session(self):
+        """
+        borrow a connected sftp session. a session whose connection died (ssh errors, or the
+        transport is no longer active) is dropped and reconnected on its next use, errors
+        that leave the connection healthy (a missing local file, a caller's own checks) keep it
+        """
+        connection = self.sessions.get()
+        try:
+            if connection is not None and not self._alive(connection):
+                self._drop(connection)
+                connection = None
+            if connection is None:
+                connection = self._connect()
+            yield connection[1]
+        except Exception as e:
+            if connection is not None and (isinstance(e, (paramiko.SSHException, EOFError, socket.timeout)) or not self._alive(connection)):
+                self._drop(connection)
+                connection = None
+            raise
+        finally:
+            self.sessions.put(connection)
+
+    def makedirs(self, remote_dir: str):
+        """
+        mkdir -p for remote_dir, cached
+        """
+        if remote_dir in self.known_dirs:
+            return
+
+        with self.session() as sftp:
+            missing = []
+            path = remote_dir.rstrip('/')
+            while path and path not in self.known_dirs:
+                try:
+                    sftp.stat(path)
+                    break
+                except IOError:
+                    missing.append(path)
+                    path = posixpath.dirname(path)
+
+            for path in reversed(missing):
+                try:
+                    sftp.mkdir(path)
+                except IOError:
+                    sftp.stat(path)  # made by another session in the mean time, anything else raises
+
+        with self._lock:
+            self.known_dirs.add(remote_dir)
+
+    def put(self, filepath: str, remote_dir: str):
+        """
+        :return: dict with file, bytes, seconds and MB/s
+        """
+        remote_path = posixpath.join(remote_dir, os.path.basename(filepath))
+        with self.session() as sftp:
+            start = time.monotonic()
+            sftp.put(filepath, remote_path)
+            seconds = time.monotonic() - start
+
+        n_bytes = os.path.getsize(filepath)
+        return {
+            'file': filepath,
+            'bytes': n_bytes,
+            'seconds': seconds,
+            'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+        }
+
+    def stream_tar(self, members: dict, remote_dir: str):
+        """
+        one tar stream over a single exec channel, unpacked into remote_dir by tar on the host
+        """
+        with self.session() as sftp:
+            channel = sftp.get_channel().get_transport().open_session()
+            try:
+                quoted_dir = shlex.quote(remote_dir)
+                channel.exec_command(f"mkdir -p {quoted_dir} && tar -xf - -C {quoted_dir}")
+                stdin = channel.makefile('wb')
+                write_tar(fileobj=stdin, members=members)
+                stdin.close()
+                channel.shutdown_write()
+
+                stderr = channel.makefile_stderr('r').read().decode()
+                exit_status = channel.recv_exit_status()
+            finally:
+                channel.close()
+        return exit_status, stderr
+
+    def exec(self, command: str):
+        """
+        run a shell command on the host over a pooled connection
+
+        :return: (exit status, stdout, stderr)
+        """
+        with self.session() as sftp:
+            channel = sftp.get_channel().get_transport().open_session()
+            try:
+                channel.exec_command(command)
+                stdout = channel.makefile('r').read().decode()
+                stderr = channel.makefile_stderr('r').read().decode()
+                exit_status = channel.recv_exit_status()
+            finally:
+                channel.close()
+        return exit_status, stdout, stderr
+
+    def verify_remote(self, remote_dir: str, expected: dict):
+        """
+        check files in remote_dir against their expected sha256 with one sha256sum on the
+        host. if the host has no sha256sum (the shell exits 127) the check falls back to
+        file sizes. sha256sum's complaints about missing files are thrown away, those files
+        just dont show up in its output
+
+        :param expected: dict of file name -> (sha256, size in bytes)
+        :return: (verified names, mismatched names), files that arent there are in neither
+        """
+        if not expected:
+            return set(), set()
+
+        names = ' '.join(shlex.quote(name) for name in expected)
+        exit_status, stdout, stderr = self.exec(f"cd {shlex.quote(remote_dir)} && sha256sum -- {names} 2>/dev/null")
+
+        remote = dict()
+        if exit_status == 127:
+            logging.info(f"No sha256sum on {self.hostname}, verifying by size only.")
+            with self.session() as sftp:
+                for name in expected:
+                    try:
+                        remote[name] = sftp.stat(posixpath.join(remote_dir, name)).st_size
+                    except IOError:
+                        pass
+            verified = {name for name, size in remote.items() if size == expected[name][1]}
+            return verified, set(remote) - verified
+
+        for line in stdout.splitlines():
+            parts = line.strip().split(None, 1)
+            if len(parts) == 2:
+                remote[parts[1].lstrip('*')] = parts[0]
+        verified = {name for name, sha256 in remote.items() if name in expected and sha256 == expected[name][0]}
+        return verified, set(remote) - verified
+
+    def resume_put(self, filepath: str, remote_dir: str, chunk_size: int = 2 ** 15):
+        """
+        upload filepath, carrying on from the end of a partial remote copy if there is one
+
+        :return: dict with file, bytes (sent this time), resumed_from, seconds and MB/s
+        """
+        remote_path = posixpath.join(remote_dir, os.path.basename(filepath))
+        local_size = os.path.getsize(filepath)
+
+        with self.session() as sftp:
+            try:
+                offset = sftp.stat(remote_path).st_size
+            except IOError:
+                offset = 0
+            if offset >= local_size:
+                offset = 0  # full size but failed verification, overwrite
+
+            start = time.monotonic()
+            with open(filepath, 'rb') as f, sftp.open(remote_path, 'ab' if offset else 'wb') as remote:
+                remote.set_pipelined(True)
+                f.seek(offset)
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    remote.write(chunk)
+            seconds = time.monotonic() - start
+
+        n_bytes = local_size - offset
+        return {
+            'file': filepath,
+            'bytes': n_bytes,
+            'resumed_from': offset,
+            'seconds': seconds,
+            'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+        super().close()
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(
+        hostname: str,
+        username: str,
+        password: str,
+        port: int = 22,
+        n_channels: int = 4,
+        source_ip: str = None
+):
+    """
+    the process wide pool for a host (and local address), made on first use and kept until exit
+    """
+    key = (hostname, port, username, source_ip)
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = SFTPPool(
+                hostname=hostname,
+                username=username,
+                password=password,
+                port=port,
+                n_channels=n_channels,
+                source_ip=source_ip
+            )
+        return _POOLS[key]
+
+
+@atexit.register
+def close_pools():
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.close()
+        _POOLS.clear()
@@ -0,0 +1,323 @@
+"""
+simulated stand ins for the compression_tester_controls functions used by the acquisition
+protocols, selected with COMPRESSION_TESTER_BACKEND=sim (see hardware.py). latencies are in
+rig seconds and all get multiplied by time_scale, so a time_scale of 0.01 runs a trial 100x faster
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from typing import List
+
+from camera_transfer import port_dirname, spread_whole_seconds
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+SIM_CONFIG = {
+    'time_scale': 1.0,
+    'encoder_read_s': 0.0005,
+    'force_sample_s': 0.002,  # per sample, the a201 is read through an adc
+    'force_noise': 0.05,
+    'stepper_counts_per_s': 2000,
+    'stepper_slow_counts_per_s': 200,
+    'sample_height_mm': 20.0,
+    'counts_per_mm': 4000 / 6,
+    # foam like force law, linear elastic -> plateau -> densification
+    'elastic_modulus': 400.0,  # force per unit strain
+    'yield_strain': 0.05,
+    'plateau_slope': 20.0,
+    'densification_strain': 0.6,
+    'densification_exponent': 3.0,
+    'n_cameras': 2,
+    'camera_init_s': 2.0,
+    'camera_config_s': 0.3,  # per camera, pushing changed settings to a known port
+    'camera_setup_s': 5.0,
+    'capture_s': 30.0,  # one turntable rotation when no stepper freq is given
+    'steps_per_rotation': 54600,
+    'frames_per_capture': 60,  # per camera
+    'frame_bytes': 200_000,
+    'frame_download_s': 0.15,  # per frame per camera
+    'camera_clear_s': 1.0,
+    'camera_list_s': 0.5,
+}
+
+_CAMERA_FRAMES = {}  # port -> list of simulated capture times
+_CAMERA_LOCK = threading.Lock()
+
+
+def configure(**kwargs):
+    """
+    override SIM_CONFIG entries, i.e. configure(time_scale=0.01, frames_per_capture=30)
+    """
+    unknown = [key for key in kwargs.keys() if key not in SIM_CONFIG]
+    if unknown:
+        raise KeyError(f"Unknown sim settings: {unknown}")
+    SIM_CONFIG.update(kwargs)
+
+
+def sim_sleep(rig_seconds: float):
+    if rig_seconds > 0:
+        time.sleep(rig_seconds * SIM_CONFIG.get('time_scale'))
+
+
+def sim_force(strain: float):
+    """
+    synthetic force-strain law with an elastic knee, a plateau and densification
+    """
+    if strain <= 0:
+        return 0.0
+
+    E = SIM_CONFIG.get('elastic_modulus')
+    eps_y = SIM_CONFIG.get('yield_strain')
+    eps_d = SIM_CONFIG.get('densification_strain')
+
+    if strain < eps_y:
+        return E * strain
+
+    plateau = E * eps_y + SIM_CONFIG.get('plateau_slope') * (strain - eps_y)
+    if strain < eps_d:
+        return plateau
+
+    densify = ((strain - eps_d) / max(1 - strain, 1e-3)) ** SIM_CONFIG.get('densification_exponent')
+    return plateau * (1 + densify)
+
+
+class SimEncoder:
+
+    def __init__(self, count: int = 0):
+        self.count = count
+        self.lock = threading.Lock()
+
+    def get_encoder_count(self):
+        sim_sleep(SIM_CONFIG.get('encoder_read_s'))
+        with self.lock:
+            return int(self.count)
+
+    def set_count(self, count):
+        with self.lock:
+            self.count = count
+
+
+class SimStepper:
+    pass
+
+
+class SimPID:
+    """
+    the PID only sets how fast the simulated platen travels
+    """
+
+    def __init__(self, counts_per_s: float):
+        self.counts_per_s = counts_per_s
+
+
+class SimForceSensor:
+    """
+    platen touches the sample at sample_top_count, counts increase as the sample is compressed
+    """
+
+    def __init__(self, enc: SimEncoder, sample_top_count: int, sample_height_counts: int):
+        self.enc = enc
+        self.sample_top_count = sample_top_count
+        self.sample_height_counts = sample_height_counts
+
+    def read(self):
+        with self.enc.lock:
+            count = self.enc.count
+        strain = (count - self.sample_top_count) / self.sample_height_counts
+        return sim_force(strain) + np.random.normal(0, SIM_CONFIG.get('force_noise'))
+
+
+def sys_init():
+    sample_height_counts = int(round(SIM_CONFIG.get('sample_height_mm') * SIM_CONFIG.get('counts_per_mm')))
+    sample_top_count = -sample_height_counts  # encoder zero is the platen resting on the base
+
+    enc = SimEncoder(count=-2 * sample_height_counts)
+    components = {
+        'e5': enc,
+        'big_stepper': SimStepper(),
+        'big_stepper_PID': SimPID(counts_per_s=SIM_CONFIG.get('stepper_counts_per_s')),
+        'big_stepper_PID_slow': SimPID(counts_per_s=SIM_CONFIG.get('stepper_slow_counts_per_s')),
+        'force_sensor': SimForceSensor(enc=enc, sample_top_count=sample_top_count, sample_height_counts=sample_height_counts),
+        'sample_top_count': sample_top_count,
+    }
+    logging.info("Simulated components initialised.")
+    return components
+
+
+def sample_force_sensor(n_samples: int, components):
+    sensor = components.get('force_sensor')
+    readings = []
+    for i in range(n_samples):
+        sim_sleep(SIM_CONFIG.get('force_sample_s'))
+        readings.append(sensor.read())
+    return readings
+
+
+def get_a201_Rf(*args, **kwargs):
+    return 1.0
+
+
+def move_stepper_PID_target(stepper, pid, enc, stepper_dc, setpoint, error):
+    """
+    moves the encoder count toward setpoint in small increments so a concurrent sampler
+    sees the platen travel
+    """
+    counts_per_s = pid.counts_per_s
+    dt = 0.01
+    with enc.lock:
+        count = float(enc.count)
+
+    while abs(setpoint - count) > error:
+        step = np.sign(setpoint - count) * min(abs(setpoint - count), counts_per_s * dt)
+        count += step
+        enc.set_count(int(round(count)))
+        sim_sleep(dt)
+
+    enc.set_count(int(round(setpoint)))
+    return
+
+
+def platon_setup(components):
+    """
+    home to the base then find the sample top
+
+    :return: (encoder_zero_count, encoder_sample_height_count)
+    """
+    move_stepper_PID_target(
+        stepper=components.get('big_stepper'), 
+        pid=components.get('big_stepper_PID'), 
+        enc=components.get('e5'),
+        stepper_dc=85,
+        setpoint=components.get('sample_top_count'),
+        error=1
+    )
+    return 0, components.get('sample_top_count')
+
+
+def home_camera_system(components):
+    sim_sleep(SIM_CONFIG.get('camera_setup_s'))
+
+
+def camera_system_setup(components):
+    sim_sleep(SIM_CONFIG.get('camera_setup_s'))
+
+
+def init_cameras(cam_settings):
+    sim_sleep(SIM_CONFIG.get('camera_init_s'))
+    ports = gphoto2_get_active_ports()
+    with _CAMERA_LOCK:
+        for port in ports:
+            _CAMERA_FRAMES.setdefault(port, [])
+    return ports
+
+
+def set_port_config(port, cam_settings):
+    sim_sleep(SIM_CONFIG.get('camera_config_s'))
+
+
+def gphoto2_get_active_ports():
+    return [f"sim:{i:03d}" for i in range(SIM_CONFIG.get('n_cameras'))]
+
+
+def gpohoto2_get_camera_settings(port, config_options):
+    return ''
+
+
+def capture_step_frames(cam_ports, components, stepper_freq):
+    """
+    one turntable rotation, every camera fires frames_per_capture times spread over it
+    """
+    rotation_s = SIM_CONFIG.get('capture_s')
+    if stepper_freq:
+        rotation_s = SIM_CONFIG.get('steps_per_rotation') / stepper_freq
+
+    start = time.time()
+    sim_sleep(rotation_s)
+
+    n_frames = SIM_CONFIG.get('frames_per_capture')
+    with _CAMERA_LOCK:
+        for port in cam_ports:
+            _CAMERA_FRAMES.setdefault(port, [])
+            _CAMERA_FRAMES[port] += [start + (i * rotation_s / n_frames) for i in range(n_frames)]
+    return
+
+
+def write_sim_frame(filepath: str, captured_at: float):
+    with open(filepath, 'wb') as f:
+        f.write(b'\xff\xd8' + os.urandom(SIM_CONFIG.get('frame_bytes') - 4) + b'\xff\xd9')
+    os.utime(filepath, (captured_at, captured_at))
+
+
+def list_port_frames(port: str):
+    """
+    same contract as camera_transfer.list_port_frames, times are truncated to the second like gphoto2
+    """
+    sim_sleep(SIM_CONFIG.get('camera_list_s'))
+    with _CAMERA_LOCK:
+        captured = list(_CAMERA_FRAMES.get(port, []))
+
+    frames = [{
+        'port': port,
+        'number': i + 1,
+        'name': f"IMG_{i:04d}.jpg",
+        'file_name': f"{port_dirname(port)}/IMG_{i:04d}.jpg",
+        'captured_at': float(int(captured_at)),
+    } for i, captured_at in enumerate(captured)]
+    return spread_whole_seconds(frames)
+
+
+def download_port_frames(port: str, staging_dir: str, ext: str = 'jpg', numbers: List[int] = None):
+    """
+    same contract as camera_transfer.download_port_frames
+    """
+    os.makedirs(staging_dir, exist_ok=True)
+    with _CAMERA_LOCK:
+        captured = list(_CAMERA_FRAMES.get(port, []))
+
+    wanted = set(numbers) if numbers is not None else None
+    start = time.monotonic()
+    filepaths = []
+    for i, captured_at in enumerate(captured):
+        if wanted is not None and i + 1 not in wanted:
+            continue
+        sim_sleep(SIM_CONFIG.get('frame_download_s'))
+        filepath = os.path.join(staging_dir, f"IMG_{i:04d}.{ext}")
+        write_sim_frame(filepath=filepath, captured_at=captured_at)
+        filepaths.append(filepath)
+    seconds = time.monotonic() - start
+
+    n_bytes = sum(os.path.getsize(f) for f in filepaths)
+    return {
+        'port': port,
+        'filepaths': filepaths,
+        'bytes': n_bytes,
+        'seconds': seconds,
+        'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+    }
+
+
+def clear_port_frames(port: str):
+    sim_sleep(SIM_CONFIG.get('camera_clear_s'))
+    with _CAMERA_LOCK:
+        _CAMERA_FRAMES[port] = []
+
+
+def transfer_step_frames(cam_ports):
+    """
+    download every camera into the cwd like the rig version
+    """
+    for port in cam_ports:
+        stat = download_port_frames(port=port, staging_dir=os.getcwd())
+        for filepath in stat.get('filepaths'):  # rig names are unique per step
+            os.rename(filepath, os.path.join(os.getcwd(), f"{uuid.uuid4()}.jpg"))
+
+
+def clear_cam_frames(cam_ports):
+    for port in cam_ports:
+        clear_port_frames(port=port)
@@ -0,0 +1,177 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+
+from typing import List
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+MANIFEST_FILENAME = 'manifest.json'
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_SUBSEC_TIME_ORIGINAL = 37521
+EXIF_IFD = 0x8769
+
+
+def read_capture_time(filepath: str):
+    """
+    capture time of a frame as a unix timestamp, from EXIF DateTimeOriginal (+ SubSecTimeOriginal)
+    when PIL is available, otherwise the file mtime which gphoto2 sets from the camera
+
+    :return: float seconds
+    """
+    if Image:
+        try:
+            with Image.open(filepath) as img:
+                exif = img.getexif().get_ifd(EXIF_IFD)
+            taken = exif.get(EXIF_DATETIME_ORIGINAL)
+            if taken:
+                ts = datetime.datetime.strptime(taken, '%Y:%m:%d %H:%M:%S').timestamp()
+                subsec = exif.get(EXIF_SUBSEC_TIME_ORIGINAL)
+                if subsec:
+                    ts += float(f"0.{str(subsec).strip()}")
+                return ts
+        except Exception as e:
+            logging.info(f"No EXIF capture time for {filepath}: {e}")
+
+    return os.path.getmtime(filepath)
+
+
+def file_sha256(filepath: str, chunk_size: int = 2 ** 20):
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class StepSpool:
+    """
+    per step directory the camera downloads land in, with a manifest.json listing each
+    frame's name, camera port, size, sha256 and capture time. everything after capture
+    (decimation, upload, Frame registration) works off the manifest instead of listing directories
+
+    :param spool_dir: dir for this step, created if missing
+    """
+
+    def __init__(self, spool_dir: str):
+        self.spool_dir = os.path.abspath(spool_dir)
+        self.staging_dir = os.path.join(self.spool_dir, 'staging')
+        self.manifest_path = os.path.join(self.spool_dir, MANIFEST_FILENAME)
+        self.frames = []
+
+        os.makedirs(self.staging_dir, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.frames = json.load(f).get('frames', [])
+
+    def write_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'frames': self.frames}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def ingest(self, filepaths: List[str], ext: str = 'jpg', ports: dict = None):
+        """
+        move downloaded files into the spool under uuid names and record them in the manifest
+
+        :param ports: filepath -> port of the camera it came off, decimation is per camera
+        """
+        ports = ports if ports else dict()
+        for filepath in filepaths:
+            captured_at = read_capture_time(filepath)
+            file_name = f"{uuid.uuid4()}.{ext}"
+            dest = os.path.join(self.spool_dir, file_name)
+            os.rename(filepath, dest)
+
+            self.frames.append({
+                'file_name': file_name,
+                'source_name': os.path.basename(filepath),
+                'port': ports.get(filepath),
+                'size': os.path.getsize(dest),
+                'sha256': file_sha256(dest),
+                'captured_at': captured_at,
+            })
+
+        self.frames.sort(key=lambda frame: frame.get('captured_at'))
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        self.write_manifest()
+
+    def file_names(self):
+        return [frame.get('file_name') for frame in self.frames]
+
+    def checksums(self):
+        """
+        :return: dict of file name -> sha256, hashed now for frames spooled without one
+        """
+        for frame in self.frames:
+            if not frame.get('sha256'):
+                frame['sha256'] = file_sha256(os.path.join(self.spool_dir, frame.get('file_name')))
+        return {frame.get('file_name'): frame.get('sha256') for frame in self.frames}
+
+    def crop_boxes(self):
+        """
+        :return: dict of file name -> [left, top, right, bottom] for frames pre-cropped on the pi
+        """
+        return {frame.get('file_name'): frame.get('crop_box') for frame in self.frames if frame.get('crop_box')}
+
+    def filepaths(self):
+        return [os.path.join(self.spool_dir, file_name) for file_name in self.file_names()]
+
+    def mark_uploaded(self, file_names: List[str]):
+        """
+        record frames as confirmed on the server, a re-run of the step's finish skips them.
+        the originals of pre-cropped frames (see precrop.precrop_spool) are only deleted now
+        """
+        uploaded = set(file_names)
+        for frame in self.frames:
+            if frame.get('file_name') in uploaded:
+                frame['uploaded'] = True
+                self.remove_original(frame=frame)
+        self.write_manifest()
+
+    def remove_original(self, frame: dict):
+        if frame.get('original_name'):
+            original_path = os.path.join(self.spool_dir, frame.pop('original_name'))
+            if os.path.exists(original_path):
+                os.remove(original_path)
+
+    def uploaded_file_names(self):
+        return [frame.get('file_name') for frame in self.frames if frame.get('uploaded')]
+
+    def pending_filepaths(self):
+        """
+        :return: filepaths of frames not confirmed on the server yet
+        """
+        return [os.path.join(self.spool_dir, frame.get('file_name')) for frame in self.frames if not frame.get('uploaded')]
+
+    def keep(self, file_names: List[str]):
+        """
+        drop every frame not in file_names from disk and the manifest
+        """
+        keep = set(file_names)
+        kept = []
+        for frame in self.frames:
+            if frame.get('file_name') in keep:
+                kept.append(frame)
+            else:
+                filepath = os.path.join(self.spool_dir, frame.get('file_name'))
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                self.remove_original(frame=frame)
+        logging.info(f"Kept {len(kept)} / {len(self.frames)} frames.")
+
+        self.frames = kept
+        self.write_manifest()
+
+    def remove(self):
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
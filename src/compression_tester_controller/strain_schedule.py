@@ -0,0 +1,49 @@
+import logging
+
+from typing import List
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+def adaptive_strain_delta(
+        strains: List[float],
+        forces: List[float],
+        delta_min: float,
+        delta_max: float,
+        curvature_sensitivity: float = 0.25,
+):
+    """
+    next strain increment from the force at the last few steps. steep sections (elastic
+    region, densification) and sections where the slope is changing (the knee) get
+    delta_min, the flat plateau gets delta_max, anything between is interpolated
+
+    slopes are normalised by the steepest slope seen so far in the trial so the
+    schedule doesnt depend on sample stiffness
+
+    :param strains: strain of each completed step, in step order
+    :param forces: force of each completed step
+    :param curvature_sensitivity: normalised slope change that counts as fully curved
+    :return: strain delta for the next step
+    """
+    if len(strains) < 3:
+        return delta_min  # no slope history yet, dont step over an early knee
+
+    slopes = []
+    for i in range(1, len(strains)):
+        d_strain = strains[i] - strains[i - 1]
+        if d_strain > 0:
+            slopes.append((forces[i] - forces[i - 1]) / d_strain)
+
+    if len(slopes) < 2:
+        return delta_min
+
+    slope_ref = max(abs(slope) for slope in slopes)
+    if slope_ref == 0:
+        return delta_max
+
+    steepness = abs(slopes[-1]) / slope_ref
+    curvature = abs(slopes[-1] - slopes[-2]) / slope_ref
+    fine = min(1.0, max(steepness, curvature / curvature_sensitivity))
+
+    return delta_max - (delta_max - delta_min) * fine
@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from contextlib import contextmanager
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+@contextmanager
+def timed(timings: dict, phase: str):
+    """
+    add the wall time of the with block to timings[phase], timings may be None
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + time.monotonic() - start
+
+
+class PhaseTimer:
+    """
+    per step phase durations for a trial. new_step() hands out the dict a step's
+    phases are recorded into with timed(), it can be passed along to whichever
+    thread finishes the step
+    """
+
+    def __init__(self):
+        self.steps = []
+        self._lock = threading.Lock()
+
+    def new_step(self):
+        timings = dict()
+        with self._lock:
+            self.steps.append(timings)
+        return timings
+
+    def to_df(self):
+        """
+        :return: one row per step, one column per phase in seconds
+        """
+        with self._lock:
+            df = pd.DataFrame([dict(timings) for timings in self.steps])
+        return df.fillna(0.0)
+
+    def summary(self):
+        """
+        :return: per phase total, mean and max seconds plus share of the summed phase time
+        """
+        df = self.to_df()
+        if df.empty:
+            return pd.DataFrame(columns=['total_s', 'mean_s', 'max_s', 'share'])
+
+        summary = pd.DataFrame({
+            'total_s': df.sum(),
+            'mean_s': df.mean(),
+            'max_s': df.max(),
+        })
+        summary['share'] = summary['total_s'] / summary['total_s'].sum()
+        return summary.sort_values(by='total_s', ascending=False)
+
+    def print_summary(self, title: str = 'Trial Phase Timing'):
+        print(f"{title} ({len(self.steps)} steps)")
+        print(self.summary().round(3))
+
+    def to_csv(self, filepath: str):
+        self.to_df().to_csv(filepath, index_label='step')
@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+from file_management import move_trial_assets, upload_interfaces
+from spool import StepSpool
+from precrop import precrop_spool
+
+TRANSFER_JOB_FILENAME = 'transfer.json'
+STATUS_FILENAME = 'status.json'
+HEARTBEAT_FILENAME = 'transfer_daemon.json'
+
+
+def write_json(filepath: str, obj: dict):
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp_path, filepath)
+
+
+def read_json(filepath: str):
+    try:
+        with open(filepath, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_status(spool_dir: str):
+    """
+    :return: the step's transfer status dict or None if it was never queued
+    """
+    return read_json(os.path.join(spool_dir, STATUS_FILENAME))
+
+
+def enqueue_transfer(
+        spool_dir: str,
+        trial_frames_dir: str,
+        dest_machine_addr: str,
+        dest_machine_user: str,
+        transport: str = 'sftp',
+        precrop: dict = None,
+):
+    """
+    hand a step spool to the transfer daemon, returns straight away
+
+    :param precrop: kwargs for precrop.precrop_spool, the daemon crops before uploading
+    """
+    # the status goes first, the daemon only picks the spool up once transfer.json exists so
+    # it can't have written uploading yet for this to overwrite
+    write_json(os.path.join(spool_dir, STATUS_FILENAME), {'state': 'queued', 'attempts': 0, 'updated_at': time.time()})
+    write_json(os.path.join(spool_dir, TRANSFER_JOB_FILENAME), {
+        'trial_frames_dir': trial_frames_dir,
+        'dest_machine_addr': dest_machine_addr,
+        'dest_machine_user': dest_machine_user,
+        'transport': transport,
+        'precrop': precrop,
+    })
+
+
+def upload_stale(status: dict, stale_s: float):
+    """
+    true for an uploading status the daemon stopped refreshing, i.e. it died mid upload
+    """
+    return status.get('state') == 'uploading' and time.time() - status.get('updated_at', 0) > stale_s
+
+
+def daemon_running(spool_root: str = 'spool', max_age_s: float = 10):
+    """
+    true if a daemon has written its heartbeat into spool_root within max_age_s
+    """
+    heartbeat = read_json(os.path.join(spool_root, HEARTBEAT_FILENAME))
+    return bool(heartbeat) and time.time() - heartbeat.get('updated_at', 0) < max_age_s
+
+
+class TransferDaemon:
+    """
+    long running uploader for the step spools under spool_root. a spool is picked up once it
+    has a transfer.json (see enqueue_transfer), its pending frames are uploaded with checksum
+    verification and confirmed frames are marked uploaded in the spool manifest. progress is
+    reported in each spool's status.json, state is one of queued, uploading, uploaded or failed.
+    failed spools are retried every retry_s up to max_attempts. the daemon refreshes the
+    status of its uploads every poll, an uploading status older than stale_s was left by a
+    daemon that died mid upload and counts as failed. runs as its own process
+    (python transfer_daemon.py) or as a thread with start()
+
+    :param max_concurrent: spools uploading at once
+    :param stale_s: age at which an uploading status is taken as failed
+    """
+
+    def __init__(
+            self,
+            spool_root: str = 'spool',
+            max_concurrent: int = 2,
+            poll_s: float = 1.0,
+            max_attempts: int = 5,
+            retry_s: float = 30,
+            stale_s: float = 30,
+    ):
+        self.spool_root = os.path.abspath(spool_root)
+        self.max_concurrent = max_concurrent
+        self.poll_s = poll_s
+        self.max_attempts = max_attempts
+        self.retry_s = retry_s
+        self.stale_s = stale_s
+
+        self.active = set()
+        self._lock = threading.Lock()
+        self._status_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    def due(self):
+        """
+        :return: spool dirs waiting on an upload, oldest first
+        """
+        if not os.path.isdir(self.spool_root):
+            return []
+
+        due = []
+        now = time.time()
+        for dirname in os.listdir(self.spool_root):
+            spool_dir = os.path.join(self.spool_root, dirname)
+            if spool_dir in self.active or not os.path.exists(os.path.join(spool_dir, TRANSFER_JOB_FILENAME)):
+                continue
+
+            status = read_status(spool_dir) or {'state': 'queued', 'attempts': 0, 'updated_at': 0}
+            state = status.get('state')
+            stale = upload_stale(status=status, stale_s=self.stale_s)
+            if stale:
+                logging.info(f"{dirname} was left uploading {now - status.get('updated_at'):.0f} s ago, retrying it.")
+            failed = state == 'failed' and now - status.get('updated_at') > self.retry_s
+            retry = (failed or stale) and status.get('attempts') < self.max_attempts
+            if state == 'queued' or retry:
+                due.append((status.get('updated_at'), spool_dir))
+
+        return [spool_dir for updated_at, spool_dir in sorted(due)]
+
+    def upload(self, spool_dir: str):
+        job = read_json(os.path.join(spool_dir, TRANSFER_JOB_FILENAME))
+        status = read_status(spool_dir) or {'attempts': 0}
+        attempts = status.get('attempts', 0) + 1
+        self.write_status(spool_dir=spool_dir, status={'state': 'uploading', 'attempts': attempts, 'updated_at': time.time()})
+
+        start = time.monotonic()
+        try:
+            spool = StepSpool(spool_dir=spool_dir)
+            pending_filepaths = spool.pending_filepaths()
+            if pending_filepaths and job.get('precrop'):
+                precrop_spool(spool=spool, **job.get('precrop'))
+                pending_filepaths = spool.pending_filepaths()  # crops go up under their own names
+            if pending_filepaths:
+                checksums = spool.checksums()
+                stats = move_trial_assets(
+                    absolute_asset_filepaths=pending_filepaths,
+                    dest_asset_dir=job.get('trial_frames_dir'),
+                    dest_machine_user=job.get('dest_machine_user'),
+                    dest_machine_addr=job.get('dest_machine_addr'),
+                    interfaces=upload_interfaces(),
+                    transport=job.get('transport'),
+                    checksums={os.path.basename(filepath): checksums.get(os.path.basename(filepath)) for filepath in pending_filepaths}
+                )
+                spool.mark_uploaded(file_names=[os.path.basename(filepath) for filepath in stats.get('confirmed')])
+            failed = [os.path.basename(filepath) for filepath in spool.pending_filepaths()]
+            error = None
+        except Exception as e:
+            logging.exception(f"Upload of {spool_dir} failed: {e}")
+            failed = None
+            error = str(e)
+
+        seconds = time.monotonic() - start
+        state = 'uploaded' if failed == [] else 'failed'
+        self.write_status(spool_dir=spool_dir, status={
+            'state': state,
+            'attempts': attempts,
+            'failed': failed,
+            'error': error,
+            'seconds': seconds,
+            'updated_at': time.time(),
+        })
+        logging.info(f"{os.path.basename(spool_dir)} {state} in {seconds:.1f} s (attempt {attempts})")
+
+    def write_status(self, spool_dir: str, status: dict):
+        with self._status_lock:
+            write_json(os.path.join(spool_dir, STATUS_FILENAME), status)
+
+    def refresh_uploading(self):
+        """
+        bump updated_at on the status of every upload in progress so it doesnt go stale
+        """
+        with self._lock:
+            active = list(self.active)
+        for spool_dir in active:
+            with self._status_lock:
+                status = read_status(spool_dir)
+                if status and status.get('state') == 'uploading':
+                    status['updated_at'] = time.time()
+                    write_json(os.path.join(spool_dir, STATUS_FILENAME), status)
+
+    def _upload(self, spool_dir: str):
+        try:
+            self.upload(spool_dir=spool_dir)
+        finally:
+            with self._lock:
+                self.active.discard(spool_dir)
+
+    def run_once(self):
+        os.makedirs(self.spool_root, exist_ok=True)
+        write_json(os.path.join(self.spool_root, HEARTBEAT_FILENAME), {'pid': os.getpid(), 'updated_at': time.time()})
+        self.refresh_uploading()
+
+        for spool_dir in self.due():
+            with self._lock:
+                if len(self.active) >= self.max_concurrent:
+                    break
+                self.active.add(spool_dir)
+            self._pool.submit(self._upload, spool_dir)
+
+    def run_forever(self):
+        logging.info(f"Transfer daemon watching {self.spool_root}")
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrent)
+        try:
+            while not self._stop.is_set():
+                self.run_once()
+                self._stop.wait(self.poll_s)
+        finally:
+            self._pool.shutdown(wait=True)
+            heartbeat_path = os.path.join(self.spool_root, HEARTBEAT_FILENAME)
+            if os.path.exists(heartbeat_path):
+                os.remove(heartbeat_path)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+class TransferQueue:
+    """
+    trial side of the transfer daemon. submit() enqueues a step's spool and returns, collect()
+    registers the Frames of every step the daemon has finished by running finish on it (with
+    nothing left to upload that only registers and cleans up). steps the daemon gave up on
+    stay in the spool for finish_spooled_steps. throttle() holds acquisition back while
+    max_queued steps are waiting so the spool cant fill the sd card
+
+    :param finish: callable run as finish(session=session, **job), i.e. finish_trial_step
+    :param max_queued: steps allowed to wait on the daemon before acquisition blocks
+    :param spool_root: where the daemon watched by this queue writes its heartbeat
+    """
+
+    def __init__(
+            self,
+            finish,
+            max_attempts: int = 5,
+            max_queued: int = 8,
+            stale_s: float = 30,
+            spool_root: str = 'spool',
+    ):
+        self.finish = finish
+        self.max_attempts = max_attempts
+        self.max_queued = max_queued
+        self.stale_s = stale_s
+        self.spool_root = spool_root
+        self.jobs = {}
+
+    def submit(self, job: dict):
+        enqueue_transfer(
+            spool_dir=job.get('spool_dir'),
+            trial_frames_dir=job.get('trial_frames_dir'),
+            dest_machine_addr=job.get('dest_machine_addr'),
+            dest_machine_user=job.get('dest_machine_user'),
+            transport=job.get('transport', 'sftp'),
+            precrop=job.get('precrop')
+        )
+        self.jobs[job.get('spool_dir')] = job
+
+    def collect(self, session):
+        """
+        :return: number of steps registered
+        """
+        n_collected = 0
+        for spool_dir, job in list(self.jobs.items()):
+            status = read_status(spool_dir) or {}
+            failed = status.get('state') == 'failed' or upload_stale(status=status, stale_s=self.stale_s)
+            if status.get('state') == 'uploaded':
+                timings = job.get('timings')
+                if timings is not None:
+                    timings['transfer'] = status.get('seconds')
+                try:
+                    self.finish(session=session, **job)
+                    n_collected += 1
+                except Exception as e:
+                    logging.exception(f"Registering step {job.get('step_id')} failed: {e}")
+                    session.rollback()
+                del self.jobs[spool_dir]
+            elif failed and status.get('attempts') >= self.max_attempts:
+                logging.info(f"Giving up on {spool_dir}: {status.get('error') or status.get('failed')}")
+                del self.jobs[spool_dir]
+        return n_collected
+
+    def wait(self, session, timeout_s: float = None, poll_s: float = 1.0, max_outstanding: int = 0):
+        """
+        collect until no more than max_outstanding submitted steps are left (none by default).
+        stops early if timeout_s runs out or the daemon stops writing its heartbeat, nothing
+        would finish the rest
+
+        :return: spool dirs still outstanding
+        """
+        start = time.monotonic()
+        self.collect(session=session)
+        while len(self.jobs) > max_outstanding:
+            if not daemon_running(spool_root=self.spool_root):
+                logging.info(f"The transfer daemon for {self.spool_root} is not running.")
+                break
+            if timeout_s is not None and time.monotonic() - start > timeout_s:
+                logging.info(f"Gave up waiting on the transfer daemon after {timeout_s} s.")
+                break
+            time.sleep(poll_s)
+            self.collect(session=session)
+
+        if len(self.jobs) > max_outstanding:
+            logging.info(f"{len(self.jobs)} step upload(s) still outstanding: {list(self.jobs)}")
+        return list(self.jobs)
+
+    def throttle(self, session, timeout_s: float = None, poll_s: float = 1.0):
+        """
+        collect finished steps, blocking while max_queued or more are still waiting on the daemon
+
+        :raises RuntimeError: the spool is still full because the daemon stopped or timeout_s ran out
+        """
+        outstanding = self.wait(session=session, timeout_s=timeout_s, poll_s=poll_s, max_outstanding=self.max_queued - 1)
+        if len(outstanding) >= self.max_queued:
+            raise RuntimeError(f"{len(outstanding)} steps are waiting on the transfer daemon, "
+                               f"not acquiring more until they are uploaded")
+
+
+if __name__ == '__main__':
+    TransferDaemon().run_forever()
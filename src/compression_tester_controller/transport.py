@@ -0,0 +1,242 @@
+import logging
+import os
+import tarfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+from spool import file_sha256
+
+
+def write_tar(fileobj, members: dict):
+    """
+    write members (arcname -> filepath) to fileobj as an uncompressed tar stream
+    """
+    with tarfile.open(fileobj=fileobj, mode='w|') as tar:
+        for name, filepath in members.items():
+            tar.add(filepath, arcname=name)
+
+
+class Transport:
+    """
+    the host independent half of an upload transport. subclasses move the bytes (makedirs,
+    put, resume_put, exec, verify_remote, stream_tar), the batch uploads with their stats,
+    verification and retries are built on those here so the sftp pool, the striped links
+    and the local stand in all behave the same
+
+    :param hostname: host the files go to, for logs
+    :param n_channels: uploads run in parallel
+    """
+
+    def __init__(self, hostname: str, n_channels: int = 4):
+        self.hostname = hostname
+        self.n_channels = n_channels
+        self.known_dirs = set()
+        self._lock = threading.Lock()
+
+    def makedirs(self, remote_dir: str):
+        """
+        mkdir -p for remote_dir
+        """
+        raise NotImplementedError
+
+    def put(self, filepath: str, remote_dir: str):
+        """
+        :return: dict with file, bytes, seconds and MB/s
+        """
+        raise NotImplementedError
+
+    def resume_put(self, filepath: str, remote_dir: str):
+        """
+        upload filepath, carrying on from the end of a partial remote copy if there is one
+
+        :return: dict with file, bytes (sent this time), resumed_from, seconds and MB/s
+        """
+        raise NotImplementedError
+
+    def exec(self, command: str):
+        """
+        :return: (exit status, stdout, stderr)
+        """
+        raise NotImplementedError
+
+    def verify_remote(self, remote_dir: str, expected: dict):
+        """
+        :param expected: dict of file name -> (sha256, size in bytes)
+        :return: (verified names, mismatched names), files that arent there are in neither
+        """
+        raise NotImplementedError
+
+    def stream_tar(self, members: dict, remote_dir: str):
+        """
+        unpack members (arcname -> filepath) into remote_dir from one tar stream
+
+        :return: (exit status, stderr) of the unpacking tar
+        """
+        raise NotImplementedError
+
+    def close(self):
+        self.known_dirs = set()
+
+    def put_tar(self, filepaths: List[str], remote_dir: str, remove_after: bool = False, checksums: dict = None):
+        """
+        send filepaths as one tar stream (see stream_tar), then check the unpacked files with
+        verify_remote. only confirmed files are removed with remove_after
+
+        :param checksums: dict of file name -> sha256, files missing from it are hashed here
+        :return: dict with confirmed and failed filepaths, bytes, seconds and MB/s
+        """
+        checksums = checksums if checksums else dict()
+        members = {os.path.basename(filepath): filepath for filepath in filepaths}
+        start = time.monotonic()
+
+        exit_status, stderr = self.stream_tar(members=members, remote_dir=remote_dir)
+        verified, mismatched = self.verify_remote(remote_dir=remote_dir, expected={
+            name: (checksums.get(name) or file_sha256(filepath), os.path.getsize(filepath))
+            for name, filepath in members.items()
+        })
+        seconds = time.monotonic() - start
+
+        confirmed = [filepath for name, filepath in members.items() if name in verified]
+        failed = [filepath for name, filepath in members.items() if name not in verified]
+        if exit_status != 0 or failed:
+            logging.info(f"tar to {self.hostname}:{remote_dir} exited {exit_status}, "
+                         f"{len(failed)} file(s) not confirmed: {stderr.strip()}")
+
+        n_bytes = sum(os.path.getsize(filepath) for filepath in confirmed)
+        if remove_after:
+            for filepath in confirmed:
+                os.remove(filepath)
+
+        stats = {
+            'confirmed': confirmed,
+            'failed': failed,
+            'bytes': n_bytes,
+            'seconds': seconds,
+            'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+        }
+        logging.info(f"Streamed {len(confirmed)} / {len(filepaths)} files to {self.hostname}:{remote_dir}, "
+                     f"{n_bytes / 1e6:.1f} MB in {seconds:.1f} s ({stats.get('mb_per_s'):.1f} MB/s)")
+        return stats
+
+    def put_files(self, filepaths: List[str], remote_dir: str, remove_after: bool = False):
+        """
+        upload filepaths into remote_dir over all channels in parallel
+
+        :return: dict with per file stats (files), confirmed and failed filepaths, bytes, seconds
+                 and aggregate MB/s
+        """
+        self.makedirs(remote_dir)
+
+        start = time.monotonic()
+        results = self.put_many(filepaths=filepaths, remote_dir=remote_dir)
+        seconds = time.monotonic() - start
+
+        files = [stat for stat in results if stat]
+        failed = [filepath for filepath, stat in zip(filepaths, results) if not stat]
+        if remove_after:
+            for stat in files:
+                os.remove(stat.get('file'))
+        n_bytes = sum(stat.get('bytes') for stat in files)
+        stats = {
+            'files': files,
+            'confirmed': [stat.get('file') for stat in files],
+            'failed': failed,
+            'bytes': n_bytes,
+            'seconds': seconds,
+            'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+        }
+        logging.info(f"Transferred {len(files)} / {len(filepaths)} files to {self.hostname}:{remote_dir}, "
+                     f"{n_bytes / 1e6:.1f} MB in {seconds:.1f} s ({stats.get('mb_per_s'):.1f} MB/s)")
+        return stats
+
+    def put_many(self, filepaths: List[str], remote_dir: str, resume: bool = False):
+        """
+        upload filepaths over all channels in parallel, errors are logged
+
+        :param resume: use resume_put instead of put
+        :return: per file stats in the order of filepaths, None where the upload failed
+        """
+        put = self.resume_put if resume else self.put
+
+        def put_one(filepath):
+            try:
+                return put(filepath=filepath, remote_dir=remote_dir)
+            except Exception as e:
+                logging.info(f"Error in transferring {filepath}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.n_channels) as pool:
+            return list(pool.map(put_one, filepaths))
+
+    def put_verified(
+            self,
+            filepaths: List[str],
+            checksums: dict,
+            remote_dir: str,
+            remove_after: bool = False,
+            retries: int = 3,
+    ):
+        """
+        upload filepaths so that every file ends up on the host with the sha256 in checksums.
+        files already there and verified are skipped, partial copies are resumed and
+        anything that doesnt verify is retried up to retries times. only confirmed files
+        are removed with remove_after
+
+        :param checksums: dict of file name -> sha256
+        :return: dict with confirmed, skipped and failed filepaths, per file stats (files), bytes,
+                 seconds and MB/s
+        """
+        self.makedirs(remote_dir)
+        pending = {os.path.basename(filepath): filepath for filepath in filepaths}
+        expected = {name: (checksums.get(name), os.path.getsize(filepath)) for name, filepath in pending.items()}
+
+        start = time.monotonic()
+        verified, mismatched = self.verify_remote(remote_dir=remote_dir, expected=expected)
+        if mismatched:
+            logging.info(f"{len(mismatched)} file(s) on the host dont match, re-sending: {sorted(mismatched)}")
+        skipped = [pending.pop(name) for name in verified]
+        confirmed = list(skipped)
+        files = []
+
+        for attempt in range(retries):
+            if not pending:
+                break
+            if attempt:
+                logging.info(f"Retrying {len(pending)} unverified file(s) to {self.hostname}:{remote_dir}")
+
+            files += [stat for stat in self.put_many(filepaths=list(pending.values()), remote_dir=remote_dir, resume=True) if stat]
+
+            verified, mismatched = self.verify_remote(
+                remote_dir=remote_dir,
+                expected={name: expected[name] for name in pending}
+            )
+            confirmed += [pending.pop(name) for name in verified]
+        seconds = time.monotonic() - start
+
+        failed = list(pending.values())
+        if remove_after:
+            for filepath in confirmed:
+                os.remove(filepath)
+
+        n_bytes = sum(stat.get('bytes') for stat in files)
+        stats = {
+            'files': files,
+            'confirmed': confirmed,
+            'skipped': skipped,
+            'failed': failed,
+            'bytes': n_bytes,
+            'seconds': seconds,
+            'mb_per_s': (n_bytes / 1e6) / seconds if seconds > 0 else 0.0,
+        }
+        logging.info(f"Confirmed {len(confirmed)} / {len(filepaths)} files on {self.hostname}:{remote_dir} "
+                     f"({len(skipped)} already there), {n_bytes / 1e6:.1f} MB sent in {seconds:.1f} s "
+                     f"({stats.get('mb_per_s'):.1f} MB/s)")
+        if failed:
+            logging.info(f"{len(failed)} file(s) could not be verified: {failed}")
+        return stats
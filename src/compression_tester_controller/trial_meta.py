@@ -0,0 +1,42 @@
+import fcntl
+import json
+import logging
+import os
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+def trial_meta_path(trial_name: str, meta_dir: str = 'trial_meta'):
+    """
+    :return: path of the trial's sidecar json, meta_dir/<trial name>.json like the timing csvs
+    """
+    return os.path.join(meta_dir, f"{trial_name}.json")
+
+
+def read_trial_meta(filepath: str):
+    """
+    :return: {table name: {row name: {field: value}}}, empty if nothing was written yet
+    """
+    try:
+        with open(filepath, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def update_trial_meta(filepath: str, table: str, name: str, fields: dict):
+    """
+    merge fields into the sidecar record of one row, i.e. ('compression_step', <step name>).
+    rows are keyed by name since a step written through a DBWriter has no id yet. the file
+    is locked while it is rewritten, steps are finished on other threads and processes
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    with open(f"{filepath}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        meta = read_trial_meta(filepath=filepath)
+        meta.setdefault(table, dict()).setdefault(str(name), dict()).update(fields)
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=1, default=str)
+        os.replace(tmp_path, filepath)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the controller modules import each other by bare name, as they do when run from their own dir
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'compression_tester_controller'))
@@ -0,0 +1,105 @@
+import os
+
+from decimal import Decimal
+
+from artifact_cache import ArtifactCache, artifact_key, settings_values
+
+
+def test_settings_values_ignore_row_identity():
+    row_a = {'_private': object(), 'id': 1, 'name': 'high', 'created_at': 'monday', 'quality': 4, 'filter': 'mild', 'limit': None}
+    row_b = {'_private': object(), 'id': 7, 'name': 'high copy', 'created_at': 'friday', 'quality': 4, 'filter': 'mild', 'limit': None}
+    assert settings_values(row_a) == settings_values(row_b) == {'quality': 4, 'filter': 'mild', 'limit': None}
+
+
+class Attr:
+
+    def __init__(self, key):
+        self.key = key
+
+
+class State:
+    """
+    the bits of sqlalchemy's InstanceState settings_values reads
+    """
+
+    def __init__(self, row, columns):
+        self.row = row
+        self.mapper = type('Mapper', (), {'column_attrs': [Attr(key=column) for column in columns]})
+
+    def obj(self):
+        return self.row
+
+
+class Row:
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+        self._sa_instance_state = State(row=self, columns=list(values.keys()))
+        self.samples = ['relationship']
+
+
+def test_settings_values_keep_every_column_type():
+    row = Row(id=3, name='a', threshold=Decimal('1.50'), bounds=[1, 2], options={'mode': 'fast'})
+    assert settings_values(row) == {'threshold': Decimal('1.50'), 'bounds': [1, 2], 'options': {'mode': 'fast'}}
+    assert settings_values(row.__dict__) == settings_values(row)
+
+    key = artifact_key(kind='full_ply', inputs=['a'], settings={'generation': settings_values(row)})
+    other = Row(id=4, name='b', threshold=Decimal('1.75'), bounds=[1, 2], options={'mode': 'fast'})
+    assert key != artifact_key(kind='full_ply', inputs=['a'], settings={'generation': settings_values(other)})
+    other = Row(id=4, name='b', threshold=Decimal('1.50'), bounds=[1, 3], options={'mode': 'fast'})
+    assert key != artifact_key(kind='full_ply', inputs=['a'], settings={'generation': settings_values(other)})
+
+
+def test_artifact_key_stable():
+    key = artifact_key(kind='full_ply', inputs=['a', 'b'], settings={'generation': {'quality': 4, 'filter': 'mild'}})
+    assert key == artifact_key(kind='full_ply', inputs=['a', 'b'], settings={'generation': {'filter': 'mild', 'quality': 4}})
+    assert key != artifact_key(kind='full_ply', inputs=['b', 'a'], settings={'generation': {'quality': 4, 'filter': 'mild'}})
+    assert key != artifact_key(kind='full_ply', inputs=['a', 'b'], settings={'generation': {'quality': 2, 'filter': 'mild'}})
+    assert key != artifact_key(kind='raw_stl', inputs=['a', 'b'], settings={'generation': {'quality': 4, 'filter': 'mild'}})
+
+
+def test_get_drops_changed_artifact(tmp_path):
+    cache = ArtifactCache(root=str(tmp_path / 'cache'))
+    filepath = str(tmp_path / 'cloud.ply')
+    with open(filepath, 'w') as f:
+        f.write('cloud')
+
+    cache.put(key='ab12', kind='full_ply', filepath=filepath, volume=1.5)
+    assert cache.get(key='ab12').get('values') == {'volume': 1.5}
+
+    with open(filepath, 'w') as f:
+        f.write('another cloud')
+    assert cache.get(key='ab12') is None
+    assert not os.path.exists(cache.entry_path(key='ab12'))
+    assert cache.get(key='ab12') is None
+
+
+def test_hashes_shared_between_processes(tmp_path):
+    root = str(tmp_path / 'cache')
+    paths = []
+    for i in range(2):
+        paths.append(str(tmp_path / f'frame_{i}.jpg'))
+        with open(paths[-1], 'w') as f:
+            f.write(f'frame {i}')
+
+    first = ArtifactCache(root=root)
+    second = ArtifactCache(root=root)
+    second.hashes_path = os.path.join(second.hashes_dir, 'other-host-1.json')
+    first.file_hash(paths[0])
+    second.file_hash(paths[1])
+    first.save_hashes()
+    second.save_hashes()
+
+    hashes = ArtifactCache(root=root).load_hashes()
+    assert set(hashes.keys()) == {os.path.abspath(path) for path in paths}
+
+
+def test_get_saves_input_hashes(tmp_path):
+    frame_path = str(tmp_path / 'frame.jpg')
+    with open(frame_path, 'w') as f:
+        f.write('frame')
+
+    cache = ArtifactCache(root=str(tmp_path / 'cache'))
+    cache.file_hash(frame_path)
+    assert cache.get(key='cd34') is None
+    assert os.path.abspath(frame_path) in ArtifactCache(root=str(tmp_path / 'cache')).load_hashes()
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+pytest.importorskip('dotenv')
+os.environ.setdefault('COMPRESSION_TESTER_BACKEND', 'sim')
+
+import camera_manager
+from camera_manager import CameraManager, diff_cam_settings
+
+
+def test_diff_cam_settings_dict():
+    applied = {'iso': 10, 'aperture': 4, 'shutterspeed': 37}
+    assert diff_cam_settings(applied=applied, wanted=dict(applied)) == {}
+    assert diff_cam_settings(applied=applied, wanted={'iso': 12, 'aperture': 4, 'shutterspeed': 37, 'focusmode': 0}) == {'iso': 12, 'focusmode': 0}
+    assert diff_cam_settings(applied=None, wanted={'iso': 10}) == {'iso': 10}
+
+
+def test_diff_cam_settings_list():
+    applied = ['iso=10', 'aperture=4']
+    assert diff_cam_settings(applied=applied, wanted=['iso=10', 'aperture=4']) == []
+    assert diff_cam_settings(applied=applied, wanted=['iso=12', 'aperture=4']) == ['iso=12']
+    assert diff_cam_settings(applied=None, wanted=['iso=10']) == ['iso=10']
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = {'init': [], 'set': []}
+
+    def init_cameras(cam_settings):
+        calls['init'].append(cam_settings)
+        return ['usb:001,005', 'usb:001,006']
+
+    def set_port_config(port, cam_settings):
+        calls['set'].append((port, cam_settings))
+
+    monkeypatch.setattr(camera_manager, 'init_cameras', init_cameras)
+    monkeypatch.setattr(camera_manager, 'set_port_config', set_port_config)
+    return calls
+
+
+def test_changed_settings_go_to_known_ports(calls):
+    settings = {1: {'iso': 10, 'aperture': 4}, 2: {'iso': 12, 'aperture': 4}}
+    manager = CameraManager(load_settings=lambda id: settings[id])
+
+    assert manager.ports(cam_settings_id=1) == ['usb:001,005', 'usb:001,006']
+    assert manager.ports(cam_settings_id=1) == ['usb:001,005', 'usb:001,006']
+    assert calls == {'init': [settings[1]], 'set': []}
+
+    assert manager.ports(cam_settings_id=2) == ['usb:001,005', 'usb:001,006']
+    assert calls.get('init') == [settings[1]]
+    assert calls.get('set') == [('usb:001,005', {'iso': 12}), ('usb:001,006', {'iso': 12})]
+
+
+def test_invalidate_forces_full_init(calls):
+    settings = {'iso': 10}
+    manager = CameraManager(load_settings=lambda id: settings)
+    manager.ports()
+    manager.invalidate()
+    manager.ports()
+    assert calls == {'init': [settings, settings], 'set': []}
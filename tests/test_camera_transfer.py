@@ -0,0 +1,53 @@
+import subprocess
+
+import camera_transfer
+from camera_transfer import GPHOTO2_FILE_LINE, gphoto2_config_args, list_port_frames, number_ranges, spread_whole_seconds
+
+LISTING = """There are 4 files in folder '/store_00020001/DCIM/100CANON':
+#1     IMG_0001.JPG               rd  5012 KB 6000x4000 image/jpeg 1650000000
+#2     IMG_0002.JPG               rd  5020 KB 6000x4000 image/jpeg 1650000000
+#3     IMG_0003.JPG               rd  5016 KB 6000x4000 image/jpeg 1650000001
+#4     IMG_0004.JPG               rd  5008 KB image/jpeg
+"""
+
+
+def test_file_line():
+    assert GPHOTO2_FILE_LINE.match('#12    IMG_0012.JPG  rd  5012 KB 6000x4000 image/jpeg 1650000000').groups() == ('12', 'IMG_0012.JPG', '1650000000')
+    assert GPHOTO2_FILE_LINE.match('#3     IMG_0003.JPG  rd  5012 KB image/jpeg').groups() == ('3', 'IMG_0003.JPG', None)
+    assert GPHOTO2_FILE_LINE.match("There are 4 files in folder '/store_00020001/DCIM/100CANON':") is None
+
+
+def test_number_ranges():
+    assert number_ranges([1, 2, 3, 7]) == '1-3,7'
+    assert number_ranges([9, 4, 5, 5, 11, 10]) == '4-5,9-11'
+    assert number_ranges([6]) == '6'
+    assert number_ranges([]) == ''
+
+
+def test_spread_whole_seconds():
+    frames = [
+        {'port': 'usb:001,005', 'number': 2, 'captured_at': 100.0},
+        {'port': 'usb:001,005', 'number': 1, 'captured_at': 100.0},
+        {'port': 'usb:001,006', 'number': 1, 'captured_at': 100.0},
+        {'port': 'usb:001,005', 'number': 3, 'captured_at': None},
+    ]
+    spread_whole_seconds(frames)
+    assert [frame.get('captured_at') for frame in frames] == [100.5, 100.0, 100.0, None]
+
+
+def test_list_port_frames(monkeypatch):
+    def fake_run(args, **kwargs):
+        return subprocess.CompletedProcess(args=args, returncode=0, stdout=LISTING, stderr='')
+
+    monkeypatch.setattr(camera_transfer.subprocess, 'run', fake_run)
+    frames = list_port_frames(port='usb:001,005')
+
+    assert [frame.get('number') for frame in frames] == [1, 2, 3, 4]
+    assert frames[0].get('file_name') == 'usb_001_005/IMG_0001.JPG'
+    assert [frame.get('captured_at') for frame in frames] == [1650000000.0, 1650000000.5, 1650000001.0, None]
+
+
+def test_gphoto2_config_args():
+    assert gphoto2_config_args(cam_settings={'iso': 12, 'aperture': 4}) == ['--set-config', 'iso=12', '--set-config', 'aperture=4']
+    assert gphoto2_config_args(cam_settings=['iso=12', ('aperture', 4)]) == ['--set-config', 'iso=12', '--set-config', 'aperture=4']
+    assert gphoto2_config_args(cam_settings={}) == []
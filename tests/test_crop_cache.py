@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip('pymeshfix')
+pytest.importorskip('dotenv')
+pytest.importorskip('compression_testing_data')
+
+import post_protocols
+
+
+@pytest.fixture
+def crops(monkeypatch):
+    calls = []
+
+    def fake_crop(source_path, dest_path, rgb_max, rgb_min):
+        calls.append(source_path)
+        with open(dest_path, 'wb') as f:
+            f.write(b'crop')
+
+    monkeypatch.setattr(post_protocols, 'crop_image_by_color', fake_crop)
+    return calls
+
+
+def test_crop_redone_only_when_source_or_bounds_change(tmp_path, crops):
+    source_path = str(tmp_path / 'frame.jpg')
+    dest_path = str(tmp_path / 'frame_crop.jpg')
+    with open(source_path, 'wb') as f:
+        f.write(b'frame one')
+
+    assert post_protocols.crop_frame_cached(source_path=source_path, dest_path=dest_path, rgb_min=[0, 0, 0], rgb_max=[10, 10, 10])
+    assert not post_protocols.crop_frame_cached(source_path=source_path, dest_path=dest_path, rgb_min=[0, 0, 0], rgb_max=[10, 10, 10])
+    assert len(crops) == 1
+
+    # new bounds
+    assert post_protocols.crop_frame_cached(source_path=source_path, dest_path=dest_path, rgb_min=[0, 0, 0], rgb_max=[20, 20, 20])
+    assert len(crops) == 2
+
+    # touched, same content: re-hashed but not re-cropped, the sidecar takes the new mtime
+    stat = os.stat(source_path)
+    os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not post_protocols.crop_frame_cached(source_path=source_path, dest_path=dest_path, rgb_min=[0, 0, 0], rgb_max=[20, 20, 20])
+    with open(post_protocols.crop_sidecar_path(dest_path=dest_path), 'r') as f:
+        assert json.load(f).get('source_mtime_ns') == os.stat(source_path).st_mtime_ns
+    assert len(crops) == 2
+
+    # new content
+    with open(source_path, 'wb') as f:
+        f.write(b'frame two, longer')
+    assert post_protocols.crop_frame_cached(source_path=source_path, dest_path=dest_path, rgb_min=[0, 0, 0], rgb_max=[20, 20, 20])
+    assert len(crops) == 3
+
+
+def test_crop_redone_when_crop_missing(tmp_path, crops):
+    source_path = str(tmp_path / 'frame.jpg')
+    dest_path = str(tmp_path / 'frame_crop.jpg')
+    with open(source_path, 'wb') as f:
+        f.write(b'frame one')
+
+    post_protocols.crop_frame_cached(source_path=source_path, dest_path=dest_path, rgb_min=[0, 0, 0], rgb_max=[10, 10, 10])
+    os.remove(dest_path)
+    assert post_protocols.crop_frame_cached(source_path=source_path, dest_path=dest_path, rgb_min=[0, 0, 0], rgb_max=[10, 10, 10])
+    assert len(crops) == 2
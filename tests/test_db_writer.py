@@ -0,0 +1,112 @@
+import threading
+
+import pytest
+
+from db_writer import DBWriter
+
+
+class FakeSession:
+    """
+    records what each commit held, a commit with a 'bad' record fails
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.pending = []
+
+    def add(self, record):
+        self.pending.append(record)
+
+    def commit(self):
+        if 'bad' in self.pending:
+            raise ValueError('bad record')
+        self.store.append(list(self.pending))
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def commits():
+    return []
+
+
+@pytest.fixture
+def writer(commits):
+    writer = DBWriter(Session=lambda: FakeSession(store=commits))
+    yield writer
+    if writer._thread.is_alive():
+        writer.close()
+
+
+def add(record):
+    return lambda session: session.add(record)
+
+
+def hold_writer(writer):
+    """
+    block the writer thread so everything submitted meanwhile lands in one batch
+
+    :return: event releasing it
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocker(session):
+        started.set()
+        release.wait(5)
+        session.add('blocker')
+
+    writer.submit(blocker)
+    assert started.wait(5)
+    return release
+
+
+def test_writes_commit_in_submission_order(writer, commits):
+    release = hold_writer(writer)
+    for record in ['a', 'b', 'c']:
+        writer.submit(add(record))
+    release.set()
+    assert writer.flush(timeout=5)
+
+    assert commits == [['blocker'], ['a', 'b', 'c']]
+    assert writer.errors == []
+
+
+def test_failed_batch_retried_one_at_a_time(writer, commits):
+    release = hold_writer(writer)
+    for record in ['a', 'bad', 'c']:
+        writer.submit(add(record))
+    release.set()
+    assert writer.flush(timeout=5)
+
+    assert commits == [['blocker'], ['a'], ['c']]
+    assert len(writer.errors) == 1
+    assert writer.report_errors() == []  # flush already reported it
+
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.check()
+
+
+def test_flush_is_a_barrier(writer, commits):
+    release = hold_writer(writer)
+    writer.submit(add('a'))
+    flushed = []
+    flusher = threading.Thread(target=lambda: flushed.append(writer.flush(timeout=5)))
+    flusher.start()
+    writer.submit(add('after'))
+
+    flusher.join(0.2)
+    assert flusher.is_alive()  # still held up behind the blocked batch
+    release.set()
+    flusher.join(5)
+    assert flushed == [True]
+    assert ['a'] in commits or ['a', 'after'] in commits
+    writer.close()
+    writer.check()
+    assert [record for batch in commits for record in batch] == ['blocker', 'a', 'after']
@@ -0,0 +1,59 @@
+from collections import Counter
+
+from decimation import camera_quotas, decimate_frames_by_angle, pick_frames
+
+
+def make_frames(port, n, period_s=1.0, t0=0.0):
+    return [
+        {'file_name': f"{port}_{i}.jpg", 'port': port, 'captured_at': t0 + i * period_s}
+        for i in range(n)
+    ]
+
+
+def test_camera_quotas_even_split():
+    assert camera_quotas(counts={'usb:1': 10, 'usb:2': 10}, desired_size=6) == {'usb:1': 3, 'usb:2': 3}
+
+
+def test_camera_quotas_short_camera_hands_over():
+    quotas = camera_quotas(counts={'usb:1': 2, 'usb:2': 20}, desired_size=10)
+    assert quotas == {'usb:1': 2, 'usb:2': 8}
+
+
+def test_camera_quotas_caps_at_frame_count():
+    assert camera_quotas(counts={'usb:1': 2, 'usb:2': 3}, desired_size=10) == {'usb:1': 2, 'usb:2': 3}
+
+
+def test_pick_frames_keeps_all_when_under_size():
+    frames = make_frames(port='usb:1', n=3)
+    assert pick_frames(frames=frames, desired_size=5, stepper_freq=100) == [frame.get('file_name') for frame in frames]
+
+
+def test_pick_frames_is_per_camera():
+    frames = make_frames(port='usb:1', n=30) + make_frames(port='usb:2', n=30, t0=0.5)
+    for angular_decimation in [False, True]:
+        keep = pick_frames(frames=frames, desired_size=10, stepper_freq=1820, angular_decimation=angular_decimation)
+        assert len(keep) == len(set(keep)) == 10
+        assert Counter(file_name.split('_')[0] for file_name in keep) == {'usb:1': 5, 'usb:2': 5}
+
+
+def test_pick_frames_without_ports_is_one_camera():
+    frames = [{'file_name': f"{i}.jpg"} for i in range(20)]
+    keep = pick_frames(frames=frames, desired_size=7, stepper_freq=100)
+    assert len(set(keep)) == 7
+
+
+def test_decimate_by_angle_covers_the_turn():
+    # 54600 steps per rotation at 1820 Hz is one turn in 30 s, one frame a second
+    frames = make_frames(port='usb:1', n=30)
+    keep = decimate_frames_by_angle(frames=frames, desired_size=6, stepper_freq=1820)
+    times = sorted(int(file_name.split('_')[1].split('.')[0]) for file_name in keep)
+    assert len(keep) == 6
+    # one frame per 5 s sector
+    assert [t // 5 for t in times] == list(range(6))
+
+
+def test_decimate_by_angle_tops_up_empty_sectors():
+    # camera stalled for the second half of the turn
+    frames = make_frames(port='usb:1', n=15)
+    keep = decimate_frames_by_angle(frames=frames, desired_size=6, stepper_freq=1820)
+    assert len(keep) == len(set(keep)) == 6
@@ -0,0 +1,49 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from force_curves import ForceCurveWriter, load_force_curve
+
+
+def chunk(start, n):
+    t = np.arange(start, start + n, dtype=float)
+    return {'t': t, 'counts': t.astype(int), 'force': t * 2, 'strain': t / 10}
+
+
+def test_appends_are_buffered_into_few_chunks(tmp_path):
+    writer = ForceCurveWriter(trial_name='trial', curve_dir=str(tmp_path), flush_s=3600, flush_rows=100)
+    for i in range(50):
+        writer.append(**chunk(start=i * 20, n=20))
+
+    assert writer.n_chunks == 10
+    filepath = writer.finalize()
+    df, meta = load_force_curve(filepath)
+    assert len(df) == 1000
+    assert np.array_equal(df['t'].values, np.arange(1000, dtype=float))
+    assert not os.path.exists(writer.chunk_dir)
+
+
+def test_finalize_flushes_the_buffer(tmp_path):
+    writer = ForceCurveWriter(trial_name='trial', curve_dir=str(tmp_path), flush_s=3600, meta={'force_zero': 1.5})
+    writer.append(**chunk(start=0, n=7))
+    assert writer.n_chunks == 0
+
+    df, meta = load_force_curve(writer.finalize())
+    assert len(df) == 7
+    assert meta == {'force_zero': 1.5}
+
+
+def test_stale_chunks_are_refused_or_cleared(tmp_path):
+    crashed = ForceCurveWriter(trial_name='trial', curve_dir=str(tmp_path), flush_rows=1)
+    crashed.append(**chunk(start=0, n=5))
+    assert len(glob.glob(os.path.join(crashed.chunk_dir, '*.npz'))) == 1
+
+    with pytest.raises(FileExistsError):
+        ForceCurveWriter(trial_name='trial', curve_dir=str(tmp_path))
+
+    writer = ForceCurveWriter(trial_name='trial', curve_dir=str(tmp_path), overwrite=True)
+    writer.append(**chunk(start=100, n=3))
+    df, meta = load_force_curve(writer.finalize())
+    assert list(df['t']) == [100.0, 101.0, 102.0]
@@ -0,0 +1,55 @@
+import os
+
+from local_transport import LocalTransport
+from spool import file_sha256
+
+
+def write_frames(dest_dir, n_files=3, file_bytes=1000):
+    os.makedirs(dest_dir, exist_ok=True)
+    filepaths = []
+    for i in range(n_files):
+        filepath = os.path.join(dest_dir, f"{i}.jpg")
+        with open(filepath, 'wb') as f:
+            f.write(os.urandom(file_bytes))
+        filepaths.append(filepath)
+    return filepaths
+
+
+def test_put_tar_confirms_on_host(tmp_path):
+    transport = LocalTransport(root=str(tmp_path / 'nas'))
+    filepaths = write_frames(dest_dir=str(tmp_path / 'spool'))
+    checksums = {os.path.basename(filepath): file_sha256(filepath) for filepath in filepaths}
+
+    stats = transport.put_tar(filepaths=filepaths, remote_dir='/trial/a', remove_after=True, checksums=checksums)
+    assert sorted(stats.get('confirmed')) == sorted(filepaths)
+    assert stats.get('failed') == []
+    assert not any(os.path.exists(filepath) for filepath in filepaths)
+    for name, sha256 in checksums.items():
+        assert file_sha256(str(tmp_path / 'nas' / 'trial' / 'a' / name)) == sha256
+
+
+def test_put_tar_wrong_checksum_is_not_confirmed(tmp_path):
+    transport = LocalTransport(root=str(tmp_path / 'nas'))
+    filepaths = write_frames(dest_dir=str(tmp_path / 'spool'), n_files=2)
+    checksums = {os.path.basename(filepaths[0]): file_sha256(filepaths[0]), os.path.basename(filepaths[1]): '0' * 64}
+
+    stats = transport.put_tar(filepaths=filepaths, remote_dir='/trial/a', remove_after=True, checksums=checksums)
+    assert stats.get('confirmed') == [filepaths[0]]
+    assert stats.get('failed') == [filepaths[1]]
+    assert os.path.exists(filepaths[1])
+
+
+def test_put_verified_resends_mismatched(tmp_path):
+    transport = LocalTransport(root=str(tmp_path / 'nas'))
+    filepaths = write_frames(dest_dir=str(tmp_path / 'spool'))
+    checksums = {os.path.basename(filepath): file_sha256(filepath) for filepath in filepaths}
+
+    # a truncated copy of the first frame is already on the host
+    os.makedirs(str(tmp_path / 'nas' / 'trial'))
+    with open(filepaths[0], 'rb') as src, open(str(tmp_path / 'nas' / 'trial' / '0.jpg'), 'wb') as dest:
+        dest.write(src.read(100))
+
+    stats = transport.put_verified(filepaths=filepaths, checksums=checksums, remote_dir='/trial')
+    assert sorted(stats.get('confirmed')) == sorted(filepaths)
+    assert stats.get('failed') == []
+    assert file_sha256(str(tmp_path / 'nas' / 'trial' / '0.jpg')) == checksums.get('0.jpg')
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+import multilink
+from local_transport import LocalTransport
+from multilink import StripedTransport
+
+
+class LinkPool(LocalTransport):
+    """
+    one link's pool writing into the shared stand in nas, with fail set the link goes
+    down on its next put
+    """
+
+    def __init__(self, root, source_ip, mb_per_s, up, interface):
+        super().__init__(root=root, n_channels=2)
+        self.source_ip = source_ip
+        self.mb_per_s = mb_per_s
+        self.up = up
+        self.interface = interface
+        self.fail = False
+        self.sent = []
+
+    def put(self, filepath, remote_dir):
+        if self.fail:
+            self.up[self.interface] = False
+            raise OSError(f"{self.interface} went away")
+        time.sleep(0.01)  # long enough for every link's sessions to get work
+        stat = super().put(filepath=filepath, remote_dir=remote_dir)
+        with self._lock:
+            self.sent.append(os.path.basename(filepath))
+        return stat
+
+
+@pytest.fixture
+def links(tmp_path, monkeypatch):
+    up = {'eth0': True, 'eth1': True}
+    ips = {'eth0': '10.0.0.2', 'eth1': '10.0.1.2'}
+    pools = {
+        ips[interface]: LinkPool(root=str(tmp_path / 'nas'), source_ip=ips[interface], mb_per_s=10.0, up=up, interface=interface)
+        for interface in ['eth0', 'eth1']
+    }
+    monkeypatch.setattr(multilink, 'link_up', lambda interface: up[interface])
+    monkeypatch.setattr(multilink, 'interface_ipv4', lambda interface: ips[interface])
+    monkeypatch.setattr(multilink, 'get_pool', lambda **kwargs: pools[kwargs.get('source_ip')])
+    monkeypatch.setattr(multilink, 'probe_bandwidth', lambda pool: pool.mb_per_s)
+    return {interface: pools[ips[interface]] for interface in ['eth0', 'eth1']}
+
+
+def write_frames(dest_dir, n_files):
+    os.makedirs(dest_dir, exist_ok=True)
+    filepaths = []
+    for i in range(n_files):
+        filepath = os.path.join(dest_dir, f"{i}.jpg")
+        with open(filepath, 'wb') as f:
+            f.write(os.urandom(1000))
+        filepaths.append(filepath)
+    return filepaths
+
+
+def test_failover_sends_every_file_once(links, tmp_path):
+    transport = StripedTransport(hostname='nas', username='user', password='pass', interfaces=['eth0', 'eth1'], n_channels=2)
+    filepaths = write_frames(dest_dir=str(tmp_path / 'spool'), n_files=12)
+    links.get('eth1').fail = True
+
+    stats = transport.put_files(filepaths=filepaths, remote_dir='/trial')
+    assert sorted(stats.get('confirmed')) == sorted(filepaths)
+    assert stats.get('failed') == []
+
+    sent = links.get('eth0').sent + links.get('eth1').sent
+    assert sorted(sent) == sorted(os.path.basename(filepath) for filepath in filepaths)
+    assert sorted(os.listdir(str(tmp_path / 'nas' / 'trial'))) == sorted(sent)
+    assert links.get('eth1').up.get('eth1') is False  # eth1 took work and went down with it
+    assert transport.links.get('eth1').get('pool') is None
+    assert [interface for interface, pool, n_channels in transport.refresh()] == ['eth0']
+
+
+def test_probe_runs_outside_the_lock(links, monkeypatch):
+    transport = StripedTransport(hostname='nas', username='user', password='pass', interfaces=['eth0'], n_channels=2)
+    probing = threading.Event()
+    release = threading.Event()
+
+    def slow_probe(pool):
+        probing.set()
+        release.wait(5)
+        return pool.mb_per_s
+
+    monkeypatch.setattr(multilink, 'probe_bandwidth', slow_probe)
+    refresh = threading.Thread(target=transport.refresh)
+    refresh.start()
+    assert probing.wait(5)
+
+    # an uploader touching the links while the probe is still running isnt blocked
+    measured = threading.Thread(target=transport.measured, kwargs={'interface': 'eth0', 'n_bytes': 2 ** 23, 'seconds': 1.0})
+    measured.start()
+    measured.join(1)
+    assert not measured.is_alive()
+    assert transport.refresh() == []  # eth0 is being probed by the other caller, nothing healthy yet
+
+    release.set()
+    refresh.join(5)
+    assert [interface for interface, pool, n_channels in transport.refresh()] == ['eth0']
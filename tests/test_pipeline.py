@@ -0,0 +1,73 @@
+import threading
+
+from pipeline import StepFinisher
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.n_rollbacks = 0
+
+    def rollback(self):
+        self.n_rollbacks += 1
+
+    def close(self):
+        pass
+
+
+def test_jobs_finish_in_submission_order():
+    done = []
+    finisher = StepFinisher(Session=FakeSession, finish=lambda session, step_id: done.append(step_id), max_in_flight=2)
+    for step_id in range(6):
+        finisher.submit({'step_id': step_id})
+    finisher.close()
+    assert done == list(range(6))
+
+
+def test_submit_blocks_at_max_in_flight():
+    release = threading.Event()
+    started = threading.Event()
+
+    def finish(session, step_id):
+        started.set()
+        release.wait(5)
+
+    finisher = StepFinisher(Session=FakeSession, finish=finish, max_in_flight=2)
+    finisher.submit({'step_id': 0})
+    assert started.wait(5)  # step 0 is being finished, the queue is empty again
+    finisher.submit({'step_id': 1})
+    finisher.submit({'step_id': 2})
+
+    blocked = threading.Thread(target=finisher.submit, args=({'step_id': 3},))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()  # two steps already waiting
+
+    release.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    finisher.close()
+
+
+def test_failed_job_doesnt_stop_later_ones():
+    done = []
+    sessions = []
+
+    def finish(session, step_id):
+        if step_id == 1:
+            raise OSError('nas unreachable')
+        done.append(step_id)
+
+    def Session():
+        sessions.append(FakeSession())
+        return sessions[-1]
+
+    finisher = StepFinisher(Session=Session, finish=finish)
+    for step_id in range(4):
+        finisher.submit({'step_id': step_id})
+    finisher.join()
+    finisher.close()
+
+    assert done == [0, 2, 3]
+    assert [job.get('step_id') for job, e in finisher.errors] == [1]
+    assert sessions[0].n_rollbacks == 1
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from precrop import is_precropped, precrop_spool, precropped_name
+from spool import StepSpool
+
+
+def test_precropped_name_marks_the_frame():
+    assert precropped_name(file_name='abc.jpg') == 'abc_precrop.jpg'
+    assert is_precropped(file_name='abc_precrop.jpg')
+    assert not is_precropped(file_name='abc.jpg')
+
+
+def test_original_kept_until_upload_confirmed(tmp_path):
+    staged = tmp_path / 'download.jpg'
+    Image.new('RGB', (128, 96), color=(0, 0, 0)).save(str(staged), format='JPEG')
+
+    spool = StepSpool(spool_dir=str(tmp_path / 'step_1'))
+    spool.ingest(filepaths=[str(staged)])
+    original_name = spool.file_names()[0]
+
+    stats = precrop_spool(spool=spool, box=[16, 16, 64, 64])
+    assert stats.get('n_cropped') == 1
+
+    cropped_name = spool.file_names()[0]
+    assert is_precropped(file_name=cropped_name)
+    assert spool.pending_filepaths() == [os.path.join(spool.spool_dir, cropped_name)]
+    assert os.path.exists(os.path.join(spool.spool_dir, original_name))
+    with Image.open(os.path.join(spool.spool_dir, cropped_name)) as img:
+        assert img.size == (48, 48)
+
+    # a re-run leaves the frame alone and a reloaded spool still knows the original
+    assert precrop_spool(spool=spool, box=[16, 16, 64, 64]).get('n_cropped') == 0
+    spool = StepSpool(spool_dir=spool.spool_dir)
+    assert spool.frames[0].get('original_name') == original_name
+
+    spool.mark_uploaded(file_names=[cropped_name])
+    assert not os.path.exists(os.path.join(spool.spool_dir, original_name))
+    assert os.path.exists(os.path.join(spool.spool_dir, cropped_name))
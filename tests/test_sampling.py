@@ -0,0 +1,76 @@
+import itertools
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pandas')
+
+from sampling import RingSampler, sample_force_settled
+
+
+def test_settled_converges_on_constant_force():
+    settled = sample_force_settled(read_force=lambda: 5.0, tolerance=0.01, window=10)
+    assert settled.get('converged')
+    assert settled.get('force') == pytest.approx(5.0)
+    assert settled.get('drift') == pytest.approx(0.0)
+
+
+def test_settled_timeout_on_first_window_measures_drift():
+    # force rising 1 / s, the first window alone outlasts the timeout
+    start = time.monotonic()
+
+    def read_force():
+        time.sleep(0.005)
+        return time.monotonic() - start
+
+    settled = sample_force_settled(read_force=read_force, tolerance=1e-6, timeout_s=0.01, window=10)
+    assert not settled.get('converged')
+    assert not np.isnan(settled.get('drift'))
+    assert settled.get('drift') == pytest.approx(1.0, rel=0.2)
+
+
+def test_settled_drift_between_windows():
+    readings = itertools.count()
+    settled = sample_force_settled(read_force=lambda: float(next(readings)), tolerance=1e-6, timeout_s=0.05, window=5)
+    assert not settled.get('converged')
+    assert settled.get('drift') > 0
+
+
+def wait_for(condition, timeout_s: float = 2.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_ring_sampler_overrun_keeps_newest():
+    sampler = RingSampler(read_counts=itertools.count().__next__, read_force=lambda: 1.0, rate_hz=2000, capacity=16)
+    sampler.start()
+    wait_for(lambda: sampler.n_written > 64)
+    sampler.stop()
+
+    chunk = sampler.drain()
+    assert len(chunk.get('counts')) == 16
+    assert sampler.n_overrun == sampler.n_written - 16
+    # oldest lost, the rest in order up to the last sample
+    assert list(np.diff(chunk.get('counts'))) == [1] * 15
+    assert chunk.get('counts')[-1] == sampler.latest()[1]
+    assert len(sampler.drain().get('t')) == 0
+
+
+def test_ring_sampler_read_error_surfaces_in_drain():
+    readings = itertools.count()
+
+    def read_force():
+        if next(readings) >= 5:
+            raise OSError('adc gone')
+        return 1.0
+
+    sampler = RingSampler(read_counts=lambda: 0, read_force=read_force, rate_hz=1000)
+    sampler.start()
+    wait_for(lambda: not sampler.is_alive())
+    assert not sampler.is_alive()
+
+    assert len(sampler.drain().get('force')) == 5
+    with pytest.raises(RuntimeError, match='adc gone'):
+        sampler.drain()
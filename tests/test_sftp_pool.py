@@ -0,0 +1,158 @@
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+import sftp_transport
+from sftp_transport import SFTPPool
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+
+class FakeChannel:
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def get_transport(self):
+        return self.transport
+
+
+class FakeSFTP:
+    """
+    sftp session on a local dir, counts the remote calls
+    """
+
+    def __init__(self, root, calls):
+        self.root = root
+        self.calls = calls
+        self.channel = FakeChannel(transport=FakeTransport())
+        self.closed = False
+
+    def local(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def get_channel(self):
+        return self.channel
+
+    def stat(self, path):
+        self.calls.append(('stat', path))
+        return os.stat(self.local(path))
+
+    def mkdir(self, path):
+        self.calls.append(('mkdir', path))
+        os.mkdir(self.local(path))
+
+    def put(self, filepath, remote_path):
+        self.calls.append(('put', remote_path))
+        shutil.copyfile(filepath, self.local(remote_path))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSSHClient:
+
+    def __init__(self):
+        self.closed = False
+        self.sftp = None
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, *args, **kwargs):
+        pass
+
+    def open_sftp(self):
+        self.sftp = FakeSFTP(root=FakeSSHClient.root, calls=FakeSSHClient.calls)
+        return self.sftp
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    FakeSSHClient.root = str(tmp_path / 'nas')
+    FakeSSHClient.calls = []
+    os.makedirs(FakeSSHClient.root)
+    monkeypatch.setattr(sftp_transport.paramiko, 'SSHClient', FakeSSHClient)
+    pool = SFTPPool(hostname='nas', username='user', password='pass', n_channels=1)
+    yield pool
+    pool.close()
+
+
+def write_frames(dest_dir, n_files=3):
+    os.makedirs(dest_dir, exist_ok=True)
+    filepaths = []
+    for i in range(n_files):
+        filepath = os.path.join(dest_dir, f"{i}.jpg")
+        with open(filepath, 'wb') as f:
+            f.write(os.urandom(100))
+        filepaths.append(filepath)
+    return filepaths
+
+
+def test_reconnects_after_dead_transport(pool):
+    with pool.session() as sftp:
+        first = sftp
+    first_client = pool.clients[0]
+    first.get_channel().get_transport().active = False
+
+    with pool.session() as sftp:
+        assert sftp is not first
+    assert first.closed and first_client.closed
+    assert len(pool.clients) == 1
+
+
+def test_local_error_keeps_session(pool):
+    with pool.session() as sftp:
+        first = sftp
+    with pytest.raises(ValueError):
+        with pool.session() as sftp:
+            raise ValueError('checksum mismatch')
+    with pool.session() as sftp:
+        assert sftp is first
+    assert len(pool.clients) == 1
+
+
+def test_ssh_error_drops_client(pool):
+    with pytest.raises(sftp_transport.paramiko.SSHException):
+        with pool.session() as sftp:
+            first = sftp
+            first_client = pool.clients[0]
+            raise sftp_transport.paramiko.SSHException('connection reset')
+    assert first.closed and first_client.closed
+    assert pool.clients == []
+
+    with pool.session() as sftp:
+        assert sftp is not first
+    assert len(pool.clients) == 1
+
+
+def test_makedirs_cached(pool):
+    pool.makedirs('/trial/a')
+    assert os.path.isdir(os.path.join(FakeSSHClient.root, 'trial', 'a'))
+    n_calls = len(FakeSSHClient.calls)
+    pool.makedirs('/trial/a')
+    assert len(FakeSSHClient.calls) == n_calls
+
+
+def test_put_files_reports_failed(pool, tmp_path):
+    filepaths = write_frames(dest_dir=str(tmp_path / 'spool'))
+    missing = str(tmp_path / 'spool' / 'missing.jpg')
+
+    stats = pool.put_files(filepaths=filepaths + [missing], remote_dir='/trial', remove_after=True)
+    assert sorted(stats.get('confirmed')) == sorted(filepaths)
+    assert stats.get('failed') == [missing]
+    assert sorted(os.listdir(os.path.join(FakeSSHClient.root, 'trial'))) == ['0.jpg', '1.jpg', '2.jpg']
+    assert len(pool.clients) == 1
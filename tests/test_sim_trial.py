@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+pytest.importorskip('paramiko')
+pytest.importorskip('pandas')
+pytest.importorskip('compression_testing_data')
+
+
+def test_run_trial_sim_smoke(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('COMPRESSION_TESTER_BACKEND', 'sim')
+    monkeypatch.setenv('TRANSFER_BACKEND', 'local')
+    monkeypatch.setenv('LOCAL_TRANSFER_ROOT', str(tmp_path / 'nas'))
+
+    import benchmarks
+
+    results = benchmarks.bench_trial(
+        db_conn=f"sqlite:///{tmp_path / 'sim.db'}",
+        frames_per_step_target=4,
+        strain_delta_target=0.1,
+        strain_limit=0.2,
+        sim_config={'time_scale': 0.001, 'frames_per_capture': 6},
+    )
+    assert results.get('n_steps') > 0
+    assert list((tmp_path / 'nas').rglob('*.jpg'))
+
+
+def test_run_trial_sim_pipelined(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('COMPRESSION_TESTER_BACKEND', 'sim')
+    monkeypatch.setenv('TRANSFER_BACKEND', 'local')
+    monkeypatch.setenv('LOCAL_TRANSFER_ROOT', str(tmp_path / 'nas'))
+
+    import benchmarks
+    from compression_testing_data.meta import get_session
+    from compression_testing_data.models.testing import CompressionStep
+
+    db_conn = f"sqlite:///{tmp_path / 'sim.db'}"
+    results = benchmarks.bench_trial(
+        db_conn=db_conn,
+        frames_per_step_target=4,
+        strain_delta_target=0.1,
+        strain_limit=0.3,
+        sim_config={'time_scale': 0.001, 'frames_per_capture': 6},
+        pipelined=True,
+        max_in_flight=1,
+    )
+    session = get_session(conn_str=db_conn)()
+    steps = session.query(CompressionStep).filter(CompressionStep.compression_trial_id == results.get('trial_id')).all()
+    # every step handed to the finisher got its frames registered
+    assert len(steps) == results.get('n_steps') > 0
+    assert all(step.frames for step in steps)
+    session.close()
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_resume_after_failed_upload_keeps_data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('COMPRESSION_TESTER_BACKEND', 'sim')
+    monkeypatch.setenv('TRANSFER_BACKEND', 'local')
+    monkeypatch.setenv('LOCAL_TRANSFER_ROOT', str(tmp_path / 'nas'))
+
+    import benchmarks
+    benchmarks.use_bench_backends()
+    import acquisition_protocols
+    import sim_components
+    from compression_testing_data.meta import get_session
+    from compression_testing_data.models.testing import CompressionStep, CompressionTrial
+
+    sim_components.configure(time_scale=0.001, frames_per_capture=6)
+    db_conn = f"sqlite:///{tmp_path / 'sim.db'}"
+    session = get_session(conn_str=db_conn)()
+    CompressionTrial.metadata.create_all(bind=session.get_bind())
+    trial_id = benchmarks.create_bench_trial(session=session, frames_per_step_target=4, strain_delta_target=0.1, strain_limit=0.5)
+    trial_name = session.get(CompressionTrial, trial_id).name
+
+    def trial_steps():
+        session.expire_all()
+        steps = session.query(CompressionStep).filter(CompressionStep.compression_trial_id == trial_id).all()
+        return sorted(steps, key=lambda step: step.strain_target)
+
+    move_trial_assets = acquisition_protocols.move_trial_assets
+    run_trial_step = acquisition_protocols.run_trial_step
+    calls = {'uploads': 0, 'steps': 0}
+
+    def flaky_move(**kwargs):
+        calls['uploads'] += 1
+        if calls['uploads'] in fail_uploads:
+            raise OSError('nas unreachable')
+        return move_trial_assets(**kwargs)
+
+    def interrupted_step(**kwargs):
+        if calls['steps'] == interrupt_after:
+            raise Interrupted()
+        calls['steps'] += 1
+        return run_trial_step(**kwargs)
+
+    monkeypatch.setattr(acquisition_protocols, 'move_trial_assets', flaky_move)
+    monkeypatch.setattr(acquisition_protocols, 'run_trial_step', interrupted_step)
+
+    # the second step's upload fails and the trial dies before the fourth step
+    fail_uploads = [2]
+    interrupt_after = 3
+    with pytest.raises(Interrupted):
+        acquisition_protocols.run_trial(db_conn=db_conn, trial_id=trial_id, server_ip='127.0.0.1', postgres_db_dir='/data')
+
+    steps = trial_steps()
+    assert [step.strain_target for step in steps] == pytest.approx([0.0, 0.1, 0.2])
+    assert [len(step.frames) for step in steps] == [4, 0, 4]
+    forces = {step.id: step.force for step in steps}
+    failed_step_id = steps[1].id
+
+    # the nas is still down for the spooled step when the trial is resumed
+    calls['uploads'] = 0
+    fail_uploads = [1]
+    interrupt_after = None
+    acquisition_protocols.run_trial(db_conn=db_conn, trial_id=trial_id, server_ip='127.0.0.1', postgres_db_dir='/data', resume=True)
+
+    steps = trial_steps()
+    assert [step.strain_target for step in steps] == pytest.approx([0.0, 0.1, 0.2, 0.3, 0.4, 0.5])
+    assert all(step.force is not None for step in steps)
+    assert {step.id: step.force for step in steps if step.id in forces} == forces
+    assert [len(step.frames) for step in steps if step.id == failed_step_id] == [0]
+    assert acquisition_protocols.spool_pending(spool_dir=os.path.join('spool', f'step_{failed_step_id}'))
+
+    # once the nas is back the kept spool goes up
+    fail_uploads = []
+    acquisition_protocols.finish_spooled_steps(
+        session=session,
+        trial_id=trial_id,
+        trial_frames_dir=f'/data/{trial_name}',
+        cam_settings_id=1,
+        dest_machine_addr='127.0.0.1'
+    )
+    assert all(len(step.frames) == 4 for step in trial_steps())
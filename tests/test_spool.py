@@ -0,0 +1,50 @@
+import os
+
+from spool import MANIFEST_FILENAME, StepSpool, file_sha256
+
+
+def stage(tmp_path, contents):
+    staging_dir = tmp_path / 'step_1' / 'staging'
+    os.makedirs(str(staging_dir), exist_ok=True)
+    filepaths = []
+    for i, content in enumerate(contents):
+        filepath = str(staging_dir / f'IMG_{i:04d}.JPG')
+        with open(filepath, 'wb') as f:
+            f.write(content)
+        os.utime(filepath, (1650000000 + i, 1650000000 + i))
+        filepaths.append(filepath)
+    return filepaths
+
+
+def test_manifest_round_trip(tmp_path):
+    filepaths = stage(tmp_path, [b'frame zero', b'frame one', b'frame two'])
+    spool = StepSpool(spool_dir=str(tmp_path / 'step_1'))
+    spool.ingest(filepaths=filepaths, ports={filepaths[0]: 'usb:001,005'})
+
+    assert os.path.exists(os.path.join(spool.spool_dir, MANIFEST_FILENAME))
+    assert not os.path.exists(spool.staging_dir)
+    assert [frame.get('source_name') for frame in spool.frames] == ['IMG_0000.JPG', 'IMG_0001.JPG', 'IMG_0002.JPG']
+    assert spool.frames[0].get('port') == 'usb:001,005'
+    for frame, filepath in zip(spool.frames, spool.filepaths()):
+        assert frame.get('size') == os.path.getsize(filepath)
+        assert frame.get('sha256') == file_sha256(filepath)
+
+    reloaded = StepSpool(spool_dir=spool.spool_dir)
+    assert reloaded.frames == spool.frames
+
+
+def test_uploaded_and_kept_survive_reload(tmp_path):
+    filepaths = stage(tmp_path, [b'frame zero', b'frame one', b'frame two'])
+    spool = StepSpool(spool_dir=str(tmp_path / 'step_1'))
+    spool.ingest(filepaths=filepaths)
+    names = spool.file_names()
+
+    spool.keep(file_names=names[:2])
+    assert not os.path.exists(os.path.join(spool.spool_dir, names[2]))
+    spool.mark_uploaded(file_names=names[:1])
+
+    reloaded = StepSpool(spool_dir=spool.spool_dir)
+    assert reloaded.file_names() == names[:2]
+    assert reloaded.uploaded_file_names() == names[:1]
+    assert reloaded.pending_filepaths() == [os.path.join(spool.spool_dir, names[1])]
+    assert reloaded.checksums() == {name: file_sha256(os.path.join(spool.spool_dir, name)) for name in names[:2]}
@@ -0,0 +1,48 @@
+import pytest
+
+import sim_components
+from strain_schedule import adaptive_strain_delta
+
+DELTA_MIN = 0.02
+DELTA_MAX = 0.08
+
+
+@pytest.fixture
+def sim_force(monkeypatch):
+    # flat plateau so the plateau case lands on delta_max exactly
+    monkeypatch.setitem(sim_components.SIM_CONFIG, 'plateau_slope', 0.0)
+    return sim_components.sim_force
+
+
+def next_delta(strains, sim_force):
+    return adaptive_strain_delta(
+        strains=strains,
+        forces=[sim_force(strain) for strain in strains],
+        delta_min=DELTA_MIN,
+        delta_max=DELTA_MAX
+    )
+
+
+def test_elastic_region_steps_fine(sim_force):
+    assert next_delta([0.0, 0.01, 0.02, 0.03], sim_force) == pytest.approx(DELTA_MIN)
+
+
+def test_plateau_steps_coarse(sim_force):
+    assert next_delta([0.0, 0.02, 0.04, 0.2, 0.4, 0.5], sim_force) == pytest.approx(DELTA_MAX)
+
+
+def test_densification_steps_fine_again(sim_force):
+    plateau = next_delta([0.0, 0.02, 0.04, 0.2, 0.4, 0.5], sim_force)
+    densifying = next_delta([0.0, 0.02, 0.04, 0.2, 0.4, 0.5, 0.7, 0.8], sim_force)
+    assert densifying < plateau
+    assert densifying == pytest.approx(DELTA_MIN)
+
+
+def test_too_few_points():
+    assert adaptive_strain_delta(strains=[], forces=[], delta_min=DELTA_MIN, delta_max=DELTA_MAX) == DELTA_MIN
+    assert adaptive_strain_delta(strains=[0.0, 0.1], forces=[0.0, 5.0], delta_min=DELTA_MIN, delta_max=DELTA_MAX) == DELTA_MIN
+
+
+def test_equal_strains():
+    assert adaptive_strain_delta(strains=[0.1, 0.1, 0.1], forces=[1.0, 2.0, 3.0], delta_min=DELTA_MIN, delta_max=DELTA_MAX) == DELTA_MIN
+    assert adaptive_strain_delta(strains=[0.0, 0.1, 0.1, 0.2], forces=[0.0, 0.0, 0.0, 0.0], delta_min=DELTA_MIN, delta_max=DELTA_MAX) == DELTA_MAX
@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip('pandas')
+
+import pandas as pd
+
+import timing
+from timing import PhaseTimer, timed
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    monotonic clock that only moves when told to
+    """
+    now = [0.0]
+    monkeypatch.setattr(timing.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_timed_accumulates(clock):
+    timings = dict()
+    with timed(timings=timings, phase='capture'):
+        clock[0] += 2.0
+    with timed(timings=timings, phase='download'):
+        clock[0] += 1.0
+    with timed(timings=timings, phase='capture'):
+        clock[0] += 0.5
+    assert timings == {'capture': 2.5, 'download': 1.0}
+
+    with pytest.raises(ValueError):
+        with timed(timings=timings, phase='upload'):
+            clock[0] += 3.0
+            raise ValueError('nas unreachable')
+    assert timings.get('upload') == 3.0
+
+    with timed(timings=None, phase='capture'):
+        clock[0] += 1.0
+
+
+def test_summary_and_csv_totals(clock, tmp_path):
+    timer = PhaseTimer()
+    assert timer.summary().empty
+
+    for capture_s, upload_s in [(2.0, 1.0), (4.0, None)]:
+        timings = timer.new_step()
+        with timed(timings=timings, phase='capture'):
+            clock[0] += capture_s
+        if upload_s:
+            with timed(timings=timings, phase='upload'):
+                clock[0] += upload_s
+
+    summary = timer.summary()
+    assert list(summary.index) == ['capture', 'upload']
+    assert summary.loc['capture', 'total_s'] == 6.0
+    assert summary.loc['capture', 'mean_s'] == 3.0
+    assert summary.loc['capture', 'max_s'] == 4.0
+    # the step without an upload counts as 0 s
+    assert summary.loc['upload', 'mean_s'] == 0.5
+    assert summary['share'].tolist() == pytest.approx([6 / 7, 1 / 7])
+
+    filepath = str(tmp_path / 'timings.csv')
+    timer.to_csv(filepath)
+    df = pd.read_csv(filepath, index_col='step')
+    assert list(df.index) == [0, 1]
+    assert df['capture'].sum() == 6.0
+    assert df['upload'].tolist() == [1.0, 0.0]
@@ -0,0 +1,133 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip('paramiko')
+pytest.importorskip('dotenv')
+
+from spool import StepSpool
+from transfer_daemon import (
+    HEARTBEAT_FILENAME, STATUS_FILENAME, TransferDaemon, TransferQueue, enqueue_transfer, read_status, write_json
+)
+
+
+def make_spool(spool_root, name, n_files=2):
+    spool_dir = os.path.join(spool_root, name)
+    spool = StepSpool(spool_dir=spool_dir)
+    filepaths = []
+    for i in range(n_files):
+        filepath = os.path.join(spool.staging_dir, f"{i}.jpg")
+        with open(filepath, 'wb') as f:
+            f.write(os.urandom(500))
+        filepaths.append(filepath)
+    spool.ingest(filepaths=filepaths)
+    return spool.spool_dir
+
+
+def queue_spool(spool_root, name, status=None):
+    spool_dir = make_spool(spool_root=spool_root, name=name)
+    enqueue_transfer(spool_dir=spool_dir, trial_frames_dir='/trial', dest_machine_addr='local', dest_machine_user='nobody')
+    if status:
+        write_json(os.path.join(spool_dir, STATUS_FILENAME), status)
+    return spool_dir
+
+
+def test_due_retry_and_stale_rules(tmp_path):
+    root = str(tmp_path / 'spool')
+    now = time.time()
+    queued = queue_spool(root, 'step_queued')
+    failed_due = queue_spool(root, 'step_failed_due', {'state': 'failed', 'attempts': 1, 'updated_at': now - 60})
+    queue_spool(root, 'step_failed_recent', {'state': 'failed', 'attempts': 1, 'updated_at': now})
+    queue_spool(root, 'step_failed_out', {'state': 'failed', 'attempts': 5, 'updated_at': now - 60})
+    stale = queue_spool(root, 'step_stale', {'state': 'uploading', 'attempts': 1, 'updated_at': now - 45})
+    queue_spool(root, 'step_uploading', {'state': 'uploading', 'attempts': 1, 'updated_at': now})
+    queue_spool(root, 'step_stale_out', {'state': 'uploading', 'attempts': 5, 'updated_at': now - 45})
+    queue_spool(root, 'step_uploaded', {'state': 'uploaded', 'attempts': 1, 'updated_at': now - 60})
+
+    daemon = TransferDaemon(spool_root=root, retry_s=30, stale_s=30, max_attempts=5)
+    # oldest first, a fresh queued status sorts last
+    assert daemon.due() == [failed_due, stale, queued]
+
+    daemon.active.add(stale)
+    assert stale not in daemon.due()
+
+
+def test_refresh_uploading_keeps_active_fresh(tmp_path):
+    root = str(tmp_path / 'spool')
+    spool_dir = queue_spool(root, 'step_1', {'state': 'uploading', 'attempts': 1, 'updated_at': time.time() - 45})
+    daemon = TransferDaemon(spool_root=root, stale_s=30)
+    daemon.active.add(spool_dir)
+    daemon.refresh_uploading()
+    assert time.time() - read_status(spool_dir).get('updated_at') < 5
+
+
+def test_enqueue_writes_status_before_job(tmp_path, monkeypatch):
+    import transfer_daemon
+
+    spool_dir = make_spool(spool_root=str(tmp_path / 'spool'), name='step_1')
+    seen = []
+
+    def record_write(filepath, obj):
+        # what a daemon polling right now would find
+        seen.append((os.path.basename(filepath), TransferDaemon(spool_root=str(tmp_path / 'spool')).due()))
+        write_json(filepath, obj)
+
+    monkeypatch.setattr(transfer_daemon, 'write_json', record_write)
+    enqueue_transfer(spool_dir=spool_dir, trial_frames_dir='/trial', dest_machine_addr='local', dest_machine_user='nobody')
+    assert seen == [(STATUS_FILENAME, []), (transfer_daemon.TRANSFER_JOB_FILENAME, [])]
+    assert read_status(spool_dir).get('state') == 'queued'
+
+
+def test_upload_to_local_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv('TRANSFER_BACKEND', 'local')
+    monkeypatch.setenv('LOCAL_TRANSFER_ROOT', str(tmp_path / 'nas'))
+    root = str(tmp_path / 'spool')
+    spool_dir = queue_spool(root, 'step_1')
+
+    TransferDaemon(spool_root=root).upload(spool_dir=spool_dir)
+    status = read_status(spool_dir)
+    assert status.get('state') == 'uploaded'
+    assert status.get('attempts') == 1
+    assert sorted(os.listdir(tmp_path / 'nas' / 'trial')) == sorted(StepSpool(spool_dir=spool_dir).uploaded_file_names())
+
+
+def test_queue_collects_uploaded_and_drops_stale(tmp_path):
+    root = str(tmp_path / 'spool')
+    finished = []
+    transfer_queue = TransferQueue(finish=lambda session, **job: finished.append(job.get('step_id')), spool_root=root)
+    uploaded = make_spool(root, 'step_1')
+    stale = make_spool(root, 'step_2')
+    transfer_queue.submit({'step_id': 1, 'spool_dir': uploaded})
+    transfer_queue.submit({'step_id': 2, 'spool_dir': stale})
+    write_json(os.path.join(uploaded, STATUS_FILENAME), {'state': 'uploaded', 'attempts': 1, 'seconds': 1.0, 'updated_at': time.time()})
+    write_json(os.path.join(stale, STATUS_FILENAME), {'state': 'uploading', 'attempts': 5, 'updated_at': time.time() - 60})
+
+    assert transfer_queue.collect(session=None) == 1
+    assert finished == [1]
+    assert transfer_queue.jobs == {}
+
+
+def test_wait_and_throttle_stop_without_a_daemon(tmp_path):
+    root = str(tmp_path / 'spool')
+    transfer_queue = TransferQueue(finish=lambda session, **job: None, max_queued=2, spool_root=root)
+    for i in range(2):
+        transfer_queue.submit({'step_id': i, 'spool_dir': make_spool(root, f'step_{i}')})
+
+    start = time.monotonic()
+    assert len(transfer_queue.wait(session=None, timeout_s=30, poll_s=0.01)) == 2
+    assert time.monotonic() - start < 5
+
+    with pytest.raises(RuntimeError):
+        transfer_queue.throttle(session=None, poll_s=0.01)
+
+
+def test_wait_times_out_with_a_live_daemon(tmp_path):
+    root = str(tmp_path / 'spool')
+    transfer_queue = TransferQueue(finish=lambda session, **job: None, spool_root=root)
+    transfer_queue.submit({'step_id': 1, 'spool_dir': make_spool(root, 'step_1')})
+    write_json(os.path.join(root, HEARTBEAT_FILENAME), {'pid': os.getpid(), 'updated_at': time.time()})
+
+    assert len(transfer_queue.wait(session=None, timeout_s=0.05, poll_s=0.01)) == 1
+    # one below the cap doesnt block
+    transfer_queue.throttle(session=None, poll_s=0.01)
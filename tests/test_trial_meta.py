@@ -0,0 +1,15 @@
+from trial_meta import read_trial_meta, trial_meta_path, update_trial_meta
+
+
+def test_update_trial_meta_merges(tmp_path):
+    filepath = trial_meta_path(trial_name='trial_a', meta_dir=str(tmp_path / 'meta'))
+    assert read_trial_meta(filepath=filepath) == {}
+
+    update_trial_meta(filepath=filepath, table='compression_trial', name='trial_a', fields={'strain_schedule': '[0, 0.1]'})
+    update_trial_meta(filepath=filepath, table='compression_step', name='step_1', fields={'force_drift': 0.01})
+    update_trial_meta(filepath=filepath, table='compression_step', name='step_1', fields={'force_settle_s': 1.5})
+
+    assert read_trial_meta(filepath=filepath) == {
+        'compression_trial': {'trial_a': {'strain_schedule': '[0, 0.1]'}},
+        'compression_step': {'step_1': {'force_drift': 0.01, 'force_settle_s': 1.5}},
+    }